@@ -0,0 +1,65 @@
+from unittest import mock
+
+import pylast
+import pytest
+from django.contrib.auth import get_user_model
+from music.models import Album, Artist, Track
+
+from scrobbles.models import ImportItem, LastFmImport, Scrobble
+
+
+def played(title, uts):
+    return pylast.PlayedTrack(
+        track=pylast.Track("Sublime", title, mock.MagicMock()),
+        album="Sublime",
+        playback_date="",
+        timestamp=str(uts),
+    )
+
+
+@pytest.mark.django_db
+@mock.patch("music.lastfm.LASTFM_PAGE_SIZE", 2)
+@mock.patch("music.lastfm.lookup_track_info_from_lastfm")
+@mock.patch("music.lastfm.pylast.LastFMNetwork")
+def test_lastfm_import_streams_pages_from_cursor(network, track_info):
+    track_info.return_value = {"run_time_seconds": 200}
+    user = get_user_model().objects.create(username="Test User")
+    user.profile.lastfm_username = "sublime"
+    user.profile.lastfm_password = "badfish"
+    user.profile.save()
+    artist = Artist.objects.create(name="Sublime")
+    album = Album.objects.create(name="Sublime")
+    album.artists.add(artist)
+    for title in ["Santeria", "What I Got"]:
+        Track.objects.create(title=title, artist=artist, album=album)
+
+    recent_tracks = network.return_value.get_user.return_value
+    recent_tracks.get_recent_tracks.return_value = iter(
+        [
+            played("Santeria", 1685562000),
+            played("What I Got", 1685561500),
+            played("Santeria", 1685561082),
+        ]
+    )
+    LastFmImport.objects.create(
+        user=user,
+        processing_started="2023-05-01T00:00:00Z",
+        processed_finished="2023-05-02T00:00:00Z",
+        last_scrobble_uts=1685560000,
+    )
+    lastfm_import = LastFmImport.objects.create(user=user)
+    lastfm_import.process()
+
+    # Streams from just after the last import's newest scrobble
+    recent_tracks.get_recent_tracks.assert_called_once_with(
+        limit=None, stream=True, time_from=1685560001
+    )
+    # Track info is looked up once per distinct track
+    assert track_info.call_count == 2
+
+    lastfm_import.refresh_from_db()
+    assert lastfm_import.last_scrobble_uts == 1685562000
+    assert lastfm_import.process_count == 3
+    assert lastfm_import.processed_finished
+    assert ImportItem.objects.count() == 3
+    assert Scrobble.objects.filter(source="Last.fm").count() == 3
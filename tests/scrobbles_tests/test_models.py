@@ -0,0 +1,227 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+import pytz
+import time_machine
+from boardgames.models import BoardGame
+from bricksets.models import BrickSet
+from django.contrib.auth import get_user_model
+from django.db.models.deletion import Collector
+from django.urls import reverse
+from django.utils import timezone
+from music.aggregators import live_charts, scrobble_counts
+from music.models import Artist, Track
+
+from scrobbles.models import ActiveScrobble, Scrobble, ScrobbleRollup
+from scrobbles.progress import flush_progress
+from scrobbles.rollups import refresh_rollups
+
+
+@pytest.mark.django_db
+def test_with_media_one_query_per_media_type(django_assert_num_queries):
+    for i in range(3):
+        Scrobble.objects.create(
+            board_game=BoardGame.objects.create(title=f"Game {i}"),
+            media_type=Scrobble.MediaType.BOARD_GAME,
+        )
+    Scrobble.objects.create(
+        brickset=BrickSet.objects.create(title="Castle"),
+        media_type=Scrobble.MediaType.BRICKSET,
+    )
+
+    # Scrobbles, board games and brick sets
+    with django_assert_num_queries(3):
+        titles = sorted(
+            s.media_obj.title for s in Scrobble.objects.all().with_media()
+        )
+    assert titles == ["Castle", "Game 0", "Game 1", "Game 2"]
+
+
+@pytest.mark.django_db
+@time_machine.travel(datetime(2022, 3, 4, 12, 0, tzinfo=pytz.utc))
+def test_rollups_follow_completed_scrobbles(
+    django_capture_on_commit_callbacks,
+):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    track = Track.objects.create(title="Same in the End", artist=artist)
+    other = Track.objects.create(title="Santeria", artist=artist)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for days_ago, media in [
+            (0, track),
+            (0, track),
+            (1, other),
+            (40, track),
+        ]:
+            scrobble = Scrobble.objects.create(
+                track=media,
+                media_type=Scrobble.MediaType.TRACK,
+                user=user,
+                timestamp=timezone.now() - timedelta(days=days_ago),
+            )
+            scrobble.stop()
+        # Never finished, so never counted
+        Scrobble.objects.create(
+            track=other,
+            media_type=Scrobble.MediaType.TRACK,
+            user=user,
+            timestamp=timezone.now(),
+        )
+
+    assert scrobble_counts(user)["today"] == 2
+    assert scrobble_counts(user)["alltime"] == 4
+    assert [(t, t.num_scrobbles) for t in live_charts(user)] == [
+        (track, 3),
+        (other, 1),
+    ]
+    assert live_charts(user, chart_period="today")[0].num_scrobbles == 2
+    assert live_charts(user, media_type="Artist")[0].num_scrobbles == 4
+
+    # Rebuilding from scratch gives the same rollups
+    rollups = list(ScrobbleRollup.objects.values_list("play_count", flat=True))
+    refresh_rollups(user.id)
+    assert sorted(
+        ScrobbleRollup.objects.values_list("play_count", flat=True)
+    ) == sorted(rollups)
+
+
+@pytest.mark.django_db
+@time_machine.travel(datetime(2022, 3, 4, 12, 0, tzinfo=pytz.utc))
+def test_rollups_follow_moved_and_deleted_scrobbles(
+    django_capture_on_commit_callbacks,
+):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    track = Track.objects.create(title="Santeria", artist=artist)
+    with mock.patch(
+        "scrobbles.rollups.refresh_rollups", wraps=refresh_rollups
+    ) as refresh:
+        with django_capture_on_commit_callbacks(execute=True):
+            for days_ago in [0, 0, 1]:
+                Scrobble.objects.create(
+                    track=track,
+                    media_type=Scrobble.MediaType.TRACK,
+                    user=user,
+                    timestamp=timezone.now() - timedelta(days=days_ago),
+                ).stop()
+    # Each day is rebuilt once however many saves touched it
+    refresh.assert_called_once()
+    assert scrobble_counts(user)["today"] == 2
+
+    # Loaded fresh, as the admin would
+    moved = Scrobble.objects.filter(timestamp__date=timezone.now()).first()
+    moved.timestamp = timezone.now() - timedelta(days=1)
+    with django_capture_on_commit_callbacks(execute=True):
+        moved.save()
+    assert scrobble_counts(user)["today"] == 1
+    assert (
+        ScrobbleRollup.objects.get(
+            media_type="Track", local_date=moved.timestamp.date()
+        ).play_count
+        == 2
+    )
+
+    # Deletes stay fast, set-based deletes
+    scrobbles = Scrobble.objects.filter(user=user)
+    assert Collector(using="default").can_fast_delete(scrobbles)
+    assert scrobbles.exclude(id=moved.id).delete_with_rollups() == 2
+    assert scrobble_counts(user)["today"] == 0
+    assert scrobble_counts(user)["alltime"] == 1
+
+
+@pytest.mark.django_db
+def test_active_scrobble_follows_scrobble_lifecycle(client):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    track = Track.objects.create(
+        title="Santeria", artist=artist, run_time_seconds=203
+    )
+    scrobble_data = {
+        "user_id": user.id,
+        "source": "Mopidy",
+        "timestamp": timezone.now(),
+    }
+
+    scrobble = Scrobble.create_or_update(track, user.id, dict(scrobble_data))
+    active = ActiveScrobble.objects.get(user=user)
+    assert (active.media_type, active.media_id) == ("Track", track.id)
+    assert active.scrobble == scrobble
+
+    # Updates find the scrobble in flight without searching the history
+    assert (
+        Scrobble.create_or_update(track, user.id, dict(scrobble_data))
+        == scrobble
+    )
+
+    scrobble.pause()
+    assert ActiveScrobble.objects.get(user=user).is_paused
+    scrobble.resume()
+    assert not ActiveScrobble.objects.get(user=user).is_paused
+
+    client.force_login(user)
+    response = client.get(reverse("scrobbles:status"))
+    assert response.context["listening"] == scrobble
+    assert list(response.context["now_playing_list"]) == [scrobble]
+
+    scrobble.stop()
+    assert not ActiveScrobble.objects.exists()
+
+
+@pytest.fixture
+def progress_tick():
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    track = Track.objects.create(
+        title="Santeria", artist=artist, run_time_seconds=203
+    )
+
+    def tick(position, status="resumed"):
+        return Scrobble.create_or_update(
+            track,
+            user.id,
+            {
+                "user_id": user.id,
+                "source": "Jellyfin",
+                "timestamp": timezone.now(),
+                "playback_position_seconds": position,
+                "status": status,
+            },
+        )
+
+    return tick
+
+
+@pytest.mark.django_db
+def test_progress_ticks_are_written_through_without_a_shared_cache(
+    progress_tick,
+):
+    scrobble = progress_tick(0)
+    progress_tick(10)
+    scrobble.refresh_from_db()
+    assert scrobble.playback_position_seconds == 10
+    assert flush_progress() == 0
+
+
+@pytest.mark.django_db
+@mock.patch("scrobbles.progress.progress_buffer_is_shared", lambda: True)
+def test_progress_ticks_are_buffered_until_pause(progress_tick):
+    tick = progress_tick
+    scrobble = tick(0)
+    assert tick(10) == scrobble
+    assert tick(20).playback_position_seconds == 20
+    # Nothing written yet, but the buffered position is what we see
+    scrobble.refresh_from_db()
+    assert scrobble.playback_position_seconds == 0
+
+    flush_progress()
+    scrobble.refresh_from_db()
+    assert scrobble.playback_position_seconds == 20
+
+    tick(30)
+    tick(40, status="paused")
+    scrobble.refresh_from_db()
+    assert scrobble.is_paused
+    assert scrobble.playback_position_seconds == 40
+    assert flush_progress() == 0
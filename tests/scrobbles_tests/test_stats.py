@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+import pytz
+import time_machine
+from django.contrib.auth import get_user_model
+from music.models import Artist, Track
+
+from scrobbles.models import ChartRecord, Scrobble
+from scrobbles.stats import build_missing_charts_for_user
+
+
+@pytest.mark.django_db
+@time_machine.travel(datetime(2022, 3, 4, 12, 0, tzinfo=pytz.utc))
+def test_build_missing_charts_for_user(django_capture_on_commit_callbacks):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    same = Track.objects.create(title="Same in the End", artist=artist)
+    santeria = Track.objects.create(title="Santeria", artist=artist)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for day, track in [
+            (27, same),
+            (27, same),
+            (27, santeria),
+            (28, santeria),
+        ]:
+            Scrobble.objects.create(
+                track=track,
+                media_type=Scrobble.MediaType.TRACK,
+                user=user,
+                timestamp=datetime(2022, 2, day, 12, 0, tzinfo=pytz.utc),
+            ).stop()
+        # Today, this week, this month and this year are not finished yet
+        Scrobble.objects.create(
+            track=same,
+            media_type=Scrobble.MediaType.TRACK,
+            user=user,
+            timestamp=datetime(2022, 3, 4, 9, 0, tzinfo=pytz.utc),
+        ).stop()
+
+    assert build_missing_charts_for_user(user) == 7
+
+    day = ChartRecord.objects.filter(year=2022, month=2, day=27)
+    assert [(r.track, r.rank, r.count) for r in day.order_by("rank")] == [
+        (same, 1, 2),
+        (santeria, 2, 1),
+    ]
+    assert ChartRecord.objects.filter(year=2022, week=8).count() == 2
+    assert not ChartRecord.objects.filter(year=2022, week=9).exists()
+    month = ChartRecord.objects.filter(year=2022, month=2, day__isnull=True)
+    assert {r.rank for r in month} == {1}
+    assert not ChartRecord.objects.filter(
+        month__isnull=True, week__isnull=True
+    )
+
+    # Running again only fills in what's missing
+    assert build_missing_charts_for_user(user) == 0
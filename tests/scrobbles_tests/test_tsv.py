@@ -0,0 +1,115 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from music.models import Album, Artist, Track
+
+from scrobbles.models import AudioScrobblerTSVImport, ImportItem, Scrobble
+from scrobbles.tsv import process_audioscrobbler_tsv_file
+
+TSV = """#AUDIOSCROBBLER/1.1
+#TZ/UNKNOWN
+#CLIENT/Rockbox sansaclipplus $Revision$
+Sublime\tSublime\tSanteria\t7\t203\tL\t1685561082\t
+Sublime\tSublime\tSanteria\t7\t203\tL\t1685561500\t
+Sublime\tSublime\tWhat I Got\t2\t171\tL\t1685562000\t
+Sublime\tSublime\tDoin' Time\t12\t254\tS\t1685563000\t
+"""
+
+
+@pytest.mark.django_db
+def test_tsv_import_resolves_known_music_in_bulk(
+    tmp_path, django_assert_max_num_queries
+):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    album = Album.objects.create(name="Sublime")
+    album.artists.add(artist)
+    santeria = Track.objects.create(
+        title="Santeria", artist=artist, album=album
+    )
+    what_i_got = Track.objects.create(
+        title="What I Got", artist=artist, album=album, musicbrainz_id="abc"
+    )
+    tsv_file = tmp_path / "scrobbler.log"
+    tsv_file.write_text(TSV)
+
+    # Artists, albums, tracks by mbid and title, existing scrobbles and a
+    # savepointed insert
+    with django_assert_max_num_queries(10):
+        assert process_audioscrobbler_tsv_file(str(tsv_file), user.id) == 3
+    scrobbles = Scrobble.objects.order_by("timestamp")
+    assert [s.track for s in scrobbles] == [santeria, santeria, what_i_got]
+    assert all(s.source == "Rockbox" for s in scrobbles)
+
+    # Re-importing the same file skips everything already scrobbled
+    assert process_audioscrobbler_tsv_file(str(tsv_file), user.id) == 0
+    assert Scrobble.objects.count() == 3
+    assert Track.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_tsv_import_resumes_from_checkpoint(tmp_path):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    album = Album.objects.create(name="Sublime")
+    album.artists.add(artist)
+    for title in ["Santeria", "What I Got"]:
+        Track.objects.create(title=title, artist=artist, album=album)
+    tsv_file = tmp_path / "scrobbler.log"
+    tsv_file.write_text(TSV)
+
+    checkpoints = []
+
+    def die_after_first_chunk(created, next_row):
+        if checkpoints:
+            raise RuntimeError("Worker died")
+        checkpoints.append(next_row)
+
+    with pytest.raises(RuntimeError):
+        process_audioscrobbler_tsv_file(
+            str(tsv_file),
+            user.id,
+            chunk_size=1,
+            on_chunk=die_after_first_chunk,
+        )
+    # Only the first chunk was committed
+    assert checkpoints == [4]
+    assert Scrobble.objects.count() == 1
+
+    created = process_audioscrobbler_tsv_file(
+        str(tsv_file), user.id, start_row=checkpoints[0], chunk_size=1
+    )
+    assert created == 2
+    assert Scrobble.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_tsv_import_items_and_undo(tmp_path, django_assert_max_num_queries):
+    user = get_user_model().objects.create(username="Test User")
+    artist = Artist.objects.create(name="Sublime")
+    album = Album.objects.create(name="Sublime")
+    album.artists.add(artist)
+    for title in ["Santeria", "What I Got"]:
+        Track.objects.create(title=title, artist=artist, album=album)
+    tsv_file = tmp_path / "scrobbler.log"
+    tsv_file.write_text(TSV)
+    other = Scrobble.objects.create(user=user, track=Track.objects.first())
+
+    tsv_import = AudioScrobblerTSVImport.objects.create(user=user)
+    with mock.patch.object(
+        AudioScrobblerTSVImport, "upload_file_path", str(tsv_file)
+    ):
+        tsv_import.process()
+    tsv_import.refresh_from_db()
+    assert tsv_import.process_count == 3
+    assert tsv_import.import_items().count() == 3
+    assert tsv_import.scrobbles().count() == 3
+
+    with django_assert_max_num_queries(13):
+        tsv_import.undo()
+    assert list(Scrobble.objects.all()) == [other]
+    assert tsv_import.scrobbles().count() == 0
+    assert set(tsv_import.import_items().values_list("status", flat=True)) == {
+        ImportItem.Status.UNDONE
+    }
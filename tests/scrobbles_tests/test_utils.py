@@ -1,7 +1,25 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
 import pytz
+import time_machine
+from books.models import Book
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
+from scrobbles.http_client import TokenBucket, gather
+from scrobbles.lookup_cache import (
+    LookupUnavailable,
+    cached_lookup,
+    lookup_cache_stats,
+    reset_lookup_cache_stats,
+)
+from scrobbles.models import Scrobble
+from scrobbles.utils import (
+    get_long_plays_completed,
+    get_long_plays_in_progress,
+)
 from vrobbler.apps.scrobbles.utils import timestamp_user_tz_to_utc
 
 
@@ -10,3 +28,100 @@ def test_timestamp_user_tz_to_utc():
         1685561082, pytz.timezone("US/Eastern")
     )
     assert timestamp == datetime(2023, 5, 31, 23, 24, 42, tzinfo=pytz.utc)
+
+
+def test_cached_lookup_normalizes_names_and_caches_misses():
+    calls = []
+
+    @cached_lookup("test-artist", names=["name"])
+    def lookup_artist(name, url=""):
+        calls.append((name, url))
+        if name == "Outage":
+            raise LookupUnavailable({})
+        return {"name": name} if name == "Sublime" else {}
+
+    reset_lookup_cache_stats()
+    assert lookup_artist("Sublime") == {"name": "Sublime"}
+    assert lookup_artist("  sublime ") == {"name": "Sublime"}
+    assert lookup_artist("Nobody") == {}
+    assert lookup_artist("nobody") == {}
+    # Only names are normalized
+    assert lookup_artist("Sublime", url="https://x.org/A") == {
+        "name": "Sublime"
+    }
+    assert lookup_artist("Sublime", url="https://x.org/a") == {
+        "name": "Sublime"
+    }
+    # Failed lookups aren't cached
+    assert lookup_artist("Outage") == {}
+    assert lookup_artist("Outage") == {}
+
+    assert [name for name, _ in calls] == [
+        "Sublime",
+        "Nobody",
+        "Sublime",
+        "Sublime",
+        "Outage",
+        "Outage",
+    ]
+    assert lookup_cache_stats()["test-artist"] == {"hits": 2, "misses": 6}
+
+
+def test_token_bucket_spaces_out_requests_past_the_burst():
+    with mock.patch("scrobbles.http_client.time") as clock:
+        clock.monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=1, capacity=2)
+        waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits == [0, 0, 1.0, 2.0]
+    assert clock.sleep.call_args_list == [mock.call(1.0), mock.call(2.0)]
+
+
+def test_gather_maps_items_to_results_and_survives_failures():
+    def lookup(name):
+        if name == "Nobody":
+            raise ValueError(name)
+        return name.upper()
+
+    results = gather(lookup, ["Sublime", "Nobody", "Sublime", "Phish"])
+
+    assert results == {"Sublime": "SUBLIME", "Nobody": None, "Phish": "PHISH"}
+
+
+@pytest.mark.django_db
+@time_machine.travel(datetime(2023, 6, 1, 12, 0, tzinfo=pytz.utc))
+def test_long_plays_one_query_per_media_type(django_assert_num_queries):
+    user = get_user_model().objects.create(username="Test User")
+    other_user = get_user_model().objects.create(username="Other User")
+    reading, stale, finished, unread = [
+        Book.objects.create(title=title)
+        for title in ["Dune", "Emma", "Ulysses", "Beloved"]
+    ]
+    for book, days_ago, complete in [
+        (reading, 2, False),
+        (stale, 30, False),
+        (finished, 40, False),
+        (finished, 20, True),
+    ]:
+        Scrobble.objects.create(
+            user=user,
+            book=book,
+            media_type=Scrobble.MediaType.BOOK,
+            timestamp=timezone.now() - timedelta(days=days_ago),
+            long_play_complete=complete,
+        )
+    # Only the user's own scrobbles count
+    Scrobble.objects.create(
+        user=other_user,
+        book=unread,
+        media_type=Scrobble.MediaType.BOOK,
+        timestamp=timezone.now(),
+        long_play_complete=False,
+    )
+    user.profile  # Loaded once up front, like the views do
+
+    with django_assert_num_queries(3):
+        in_progress = get_long_plays_in_progress(user)
+    assert in_progress == {"active": [reading], "inactive": [stale]}
+    with django_assert_num_queries(3):
+        assert get_long_plays_completed(user) == [finished]
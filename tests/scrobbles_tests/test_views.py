@@ -1,13 +1,35 @@
+import gzip
+import json
 from datetime import datetime, timedelta
 from unittest.mock import patch
 from django.utils import timezone
 
 import pytest
+import pytz
 import time_machine
+from boardgames.models import BoardGame
+from django.contrib.auth import get_user_model
+from django.test import override_settings
 from django.urls import reverse
-from music.models import Track
+from locations.models import LocationPing
+from music.models import Artist, Track
 from podcasts.models import PodcastEpisode
-from scrobbles.models import Scrobble
+from scrobbles.chart_cache import (
+    chart_refresh_lock_key,
+    get_cached_charts,
+    get_chart_cache,
+)
+from scrobbles.models import (
+    ActiveScrobble,
+    ChartRecord,
+    Scrobble,
+    WebhookInbox,
+)
+from scrobbles.tasks import (
+    process_webhook_inbox,
+    purge_webhook_inbox,
+    refresh_chart_cache,
+)
 
 
 @pytest.mark.django_db
@@ -209,3 +231,362 @@ def test_scrobble_jellyfin_track(
         scrobble = Scrobble.objects.get(id=1)
         assert scrobble.media_obj.__class__ == Track
         assert scrobble.media_obj.title == "Emotion"
+
+
+@pytest.mark.django_db
+@override_settings(WEBHOOK_INGEST_ASYNC=True)
+@patch("scrobbles.views.process_webhook_inbox")
+@patch("scrobbles.scrobblers.mopidy_scrobble_media", return_value=None)
+def test_mopidy_webhook_queued_in_order(
+    mock_scrobble,
+    mock_task,
+    client,
+    mopidy_track,
+    valid_auth_token,
+    django_capture_on_commit_callbacks,
+):
+    url = reverse("scrobbles:mopidy-webhook")
+    headers = {"Authorization": f"Token {valid_auth_token}"}
+
+    for status in ["resumed", "paused", "stopped"]:
+        mopidy_track.request_data["status"] = status
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(
+                url,
+                mopidy_track.request_json,
+                content_type="application/json",
+                headers=headers,
+            )
+        assert response.status_code == 202
+    assert mock_task.delay.call_count == 3
+    assert not mock_scrobble.called
+
+    process_webhook_inbox(WebhookInbox.objects.first().user_id)
+
+    applied = [call.args[0]["status"] for call in mock_scrobble.call_args_list]
+    assert applied == ["resumed", "paused", "stopped"]
+    assert not WebhookInbox.objects.filter(
+        status=WebhookInbox.Status.PENDING
+    ).exists()
+
+    response = client.post(
+        url, {"status": "paused"}, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert response.data == {"missing_keys": ["name"]}
+
+
+@pytest.mark.django_db
+def test_export_streams_every_media_type(client):
+    user = get_user_model().objects.create(username="Test User")
+    other = get_user_model().objects.create(username="Other User")
+    track = Track.objects.create(
+        title="Santeria",
+        artist=Artist.objects.create(name="Sublime"),
+        run_time_seconds=203,
+    )
+    game = BoardGame.objects.create(title="Wingspan")
+    for scrobble_user in [user, other]:
+        Scrobble.objects.create(
+            track=track,
+            media_type=Scrobble.MediaType.TRACK,
+            user=scrobble_user,
+            timestamp=timezone.now() - timedelta(hours=1),
+            played_to_completion=True,
+        )
+    Scrobble.objects.create(
+        board_game=game,
+        media_type=Scrobble.MediaType.BOARD_GAME,
+        user=user,
+        timestamp=timezone.now(),
+    )
+    client.force_login(user)
+    url = reverse("scrobbles:export")
+
+    response = client.get(url, {"export_type": "jsonl"})
+    assert response.streaming
+    rows = [
+        json.loads(line)
+        for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [(r["media_type"], r["title"], r["artist"]) for r in rows] == [
+        ("Track", "Santeria", "Sublime"),
+        ("BoardGame", "Wingspan", ""),
+    ]
+
+    response = client.get(url, {"export_type": "as", "gzip": "on"})
+    assert response["Content-Type"] == "application/gzip"
+    lines = (
+        gzip.decompress(b"".join(response.streaming_content))
+        .decode()
+        .splitlines()
+    )
+    assert lines[0] == "#AUDIOSCROBBLER/1.1"
+    assert lines[3].split("\t")[:6] == [
+        "Sublime",
+        "",
+        "Santeria",
+        "",
+        "203",
+        "L",
+    ]
+    assert len(lines) == 4
+
+
+@pytest.mark.django_db
+def test_export_parquet(client):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    user = get_user_model().objects.create(username="Test User")
+    user.profile.timezone = "US/Eastern"
+    user.profile.save()
+    track = Track.objects.create(
+        title="Santeria",
+        artist=Artist.objects.create(name="Sublime"),
+        run_time_seconds=203,
+    )
+    Scrobble.objects.create(
+        track=track,
+        media_type=Scrobble.MediaType.TRACK,
+        user=user,
+        timestamp=datetime(2024, 1, 1, 17, 0, tzinfo=timezone.utc),
+        played_to_completion=True,
+    )
+    Scrobble.objects.create(
+        board_game=BoardGame.objects.create(title="Wingspan"),
+        media_type=Scrobble.MediaType.BOARD_GAME,
+        user=user,
+        timestamp=datetime(2024, 1, 2, 17, 0, tzinfo=timezone.utc),
+    )
+    client.force_login(user)
+
+    response = client.get(
+        reverse("scrobbles:export"), {"export_type": "parquet"}
+    )
+    table = pq.read_table(
+        pa.BufferReader(b"".join(response.streaming_content))
+    )
+    rows = table.to_pylist()
+    assert [(r["media_type"], r["title"]) for r in rows] == [
+        ("Track", "Santeria"),
+        ("BoardGame", "Wingspan"),
+    ]
+    assert rows[0]["local_timestamp"] == datetime(2024, 1, 1, 12, 0)
+    assert rows[0]["artist"] == "Sublime"
+
+
+@pytest.mark.django_db
+def test_chart_page_only_reads_the_chart_cache(
+    client, django_capture_on_commit_callbacks
+):
+    get_chart_cache().clear()
+    user = get_user_model().objects.create(username="Test User")
+    client.force_login(user)
+    artist = Artist.objects.create(name="Sublime")
+    track = Track.objects.create(title="Santeria", artist=artist)
+
+    def play():
+        with django_capture_on_commit_callbacks(execute=True):
+            Scrobble.objects.create(
+                track=track,
+                media_type=Scrobble.MediaType.TRACK,
+                user=user,
+                timestamp=timezone.now(),
+            ).stop()
+
+    play()
+    url = reverse("scrobbles:charts-home")
+    response = client.get(url)
+    assert response.context["charts_building"]
+    assert response.context["current_track_charts"]["today"] == []
+
+    refresh_chart_cache(user.id)
+    response = client.get(url)
+    assert not response.context["charts_building"]
+    today = response.context["current_track_charts"]["today"]
+    assert [(t, t.num_scrobbles) for t in today] == [(track, 1)]
+    assert response.context["current_artist_charts"]["all"] == [artist]
+
+    # Finishing a scrobble queues a rebuild, keeping the old charts up
+    play()
+    charts, building = get_cached_charts(user.id)
+    assert not building
+    assert charts["Track"]["today"][0].num_scrobbles == 1
+    assert get_chart_cache().get(chart_refresh_lock_key(user.id))
+
+    refresh_chart_cache(user.id)
+    charts, building = get_cached_charts(user.id)
+    assert charts["Track"]["today"][0].num_scrobbles == 2
+
+    # Past charts are queued rather than built by the page
+    response = client.get(url + "?date=2020-01-01")
+    assert response.context["charts_building"]
+    assert not ChartRecord.objects.exists()
+
+
+@pytest.mark.django_db
+def test_chart_page_builds_charts_when_tasks_run_eagerly(
+    client, settings, django_capture_on_commit_callbacks
+):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    get_chart_cache().clear()
+    user = get_user_model().objects.create(username="Test User")
+    track = Track.objects.create(
+        title="Santeria", artist=Artist.objects.create(name="Sublime")
+    )
+    with patch("scrobbles.tasks.refresh_chart_cache.delay") as delay:
+        with django_capture_on_commit_callbacks(execute=True):
+            Scrobble.objects.create(
+                track=track,
+                media_type=Scrobble.MediaType.TRACK,
+                user=user,
+                timestamp=timezone.now(),
+            ).stop()
+    # Finishing the scrobble leaves the build to the chart page
+    delay.assert_not_called()
+
+    charts, building = get_cached_charts(user.id)
+    assert not building
+    assert charts["Track"]["today"] == [track]
+
+
+@pytest.mark.django_db
+def test_gps_track_becomes_a_few_location_scrobbles(
+    client, django_assert_max_num_queries
+):
+    user = get_user_model().objects.create(username="Test User")
+    client.force_login(user)
+    start = datetime(2024, 5, 1, 8, 0, tzinfo=pytz.utc)
+    places = (
+        [(44.234, -69.234)] * 120
+        + [(44.240 + i / 1000, -69.240) for i in range(5)]
+        + [(44.26, -69.26)] * 120
+        + [(44.270 + i / 1000, -69.270) for i in range(5)]
+        + [(44.28, -69.28)] * 60
+    )
+    points = [
+        {
+            "lat": lat,
+            "lon": lon,
+            "alt": 60.4,
+            "time": (start + timedelta(seconds=30 * i)).isoformat(),
+            "prov": "gps",
+        }
+        for i, (lat, lon) in enumerate(places)
+    ]
+    url = reverse("scrobbles:gps-track-webhook")
+
+    with django_assert_max_num_queries(40):
+        response = client.post(
+            url, json.dumps(points[:200]), content_type="application/json"
+        )
+    assert response.status_code == 200
+    assert len(response.data["scrobble_ids"]) == 2
+
+    # The rest of the track carries on where the last upload left off
+    response = client.post(
+        url, json.dumps(points[200:]), content_type="application/json"
+    )
+    scrobbles = list(
+        Scrobble.objects.filter(
+            media_type=Scrobble.MediaType.GEO_LOCATION
+        ).order_by("timestamp")
+    )
+    assert [s.geo_location.lat for s in scrobbles] == [44.234, 44.26, 44.28]
+    assert [s.in_progress for s in scrobbles] == [False, False, True]
+    assert scrobbles[1].log["gps_pings"]["count"] == 120
+    assert scrobbles[1].location_pings.count() == 120
+    assert ActiveScrobble.objects.get(user=user).scrobble == scrobbles[2]
+
+
+@pytest.mark.django_db
+def test_gps_track_needs_a_user(client):
+    get_user_model().objects.create(username="Test User")
+    points = [
+        {"lat": 44.234, "lon": -69.234, "time": "2024-05-01T08:00:00+00:00"}
+    ] * 5
+
+    response = client.post(
+        reverse("scrobbles:gps-track-webhook"),
+        json.dumps(points),
+        content_type="application/json",
+    )
+    assert response.status_code == 401
+    assert not Scrobble.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(WEBHOOK_INGEST_ASYNC=True)
+def test_gps_webhook_needs_a_user(client):
+    get_user_model().objects.create(username="Test User")
+
+    response = client.post(
+        reverse("scrobbles:gps-webhook"),
+        {"lat": 44.2345, "lon": -68.2345},
+        content_type="application/json",
+    )
+    assert response.status_code == 401
+    assert not WebhookInbox.objects.exists()
+
+
+@pytest.mark.django_db
+def test_purge_webhook_inbox_keeps_recent_and_failed_webhooks():
+    user = get_user_model().objects.create(username="Test User")
+    long_ago = timezone.now() - timedelta(days=30)
+    for status, processed_at in [
+        (WebhookInbox.Status.PROCESSED, long_ago),
+        (WebhookInbox.Status.PROCESSED, timezone.now()),
+        (WebhookInbox.Status.FAILED, long_ago),
+        (WebhookInbox.Status.PENDING, None),
+    ]:
+        WebhookInbox.objects.create(
+            user=user,
+            source=WebhookInbox.Source.GPSLOGGER,
+            status=status,
+            processed_at=processed_at,
+        )
+
+    purge_webhook_inbox()
+
+    assert sorted(WebhookInbox.objects.values_list("status", flat=True)) == [
+        WebhookInbox.Status.FAILED,
+        WebhookInbox.Status.PENDING,
+        WebhookInbox.Status.PROCESSED,
+    ]
+
+
+@pytest.mark.django_db
+def test_gps_pings_are_kept_out_of_the_log(client):
+    user = get_user_model().objects.create(username="Test User")
+    client.force_login(user)
+    url = reverse("scrobbles:gps-webhook")
+    for minute, provider in [(0, "gps"), (1, "gps"), (2, "network")]:
+        response = client.post(
+            url,
+            {
+                "lat": 44.2345,
+                "lon": -68.2345,
+                "alt": 60.4,
+                "time": f"2024-05-01T08:0{minute}:00Z",
+                "prov": provider,
+            },
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+
+    scrobble = Scrobble.objects.get(id=response.data["scrobble_id"])
+    assert scrobble.log["gps_pings"] == {
+        "count": 3,
+        "first": "2024-05-01T08:00:00+00:00",
+        "last": "2024-05-01T08:02:00+00:00",
+        "providers": {"GPS": 2, "Wifi Triangulation": 1},
+    }
+    assert [
+        (ping.lat, ping.provider)
+        for ping in scrobble.location_pings.order_by("timestamp")
+    ] == [(44.2345, "gps"), (44.2345, "gps"), (44.2345, "network")]
+
+    # Deleting the scrobble takes its pings with it
+    Scrobble.objects.filter(id=scrobble.id).delete_with_rollups()
+    assert not LocationPing.objects.exists()
@@ -0,0 +1,85 @@
+import json
+from unittest import mock
+
+import pytest
+from videogames.igdb import (
+    IGDB_TOKEN_CACHE_KEY,
+    IGDB_TOKEN_LOCK_KEY,
+    MULTIQUERY_URL,
+    get_igdb_token,
+    lookup_games_from_igdb,
+)
+
+from scrobbles.lookup_cache import get_lookup_cache
+
+
+def response(data, status_code=200):
+    return mock.Mock(status_code=status_code, content=json.dumps(data))
+
+
+@pytest.fixture
+def twitch_tokens():
+    get_lookup_cache().clear()
+    tokens = iter(["first-token", "second-token"])
+
+    def post(url, provider, **kwargs):
+        if url.startswith("https://id.twitch.tv/"):
+            return response({"access_token": next(tokens), "expires_in": 3600})
+        return None
+
+    return post
+
+
+def test_igdb_token_is_cached_until_refused(twitch_tokens):
+    with mock.patch(
+        "videogames.igdb.http_client.post", side_effect=twitch_tokens
+    ) as post:
+        assert get_igdb_token() == "first-token"
+        assert get_igdb_token() == "first-token"
+        assert post.call_count == 1
+
+        assert get_igdb_token(rejected="first-token") == "second-token"
+        assert get_igdb_token() == "second-token"
+        assert post.call_count == 2
+
+
+def test_igdb_token_waits_for_another_worker_refreshing_it(twitch_tokens):
+    cache = get_lookup_cache()
+    cache.add(IGDB_TOKEN_LOCK_KEY, "refreshing", 30)
+
+    def other_worker_finishes(seconds):
+        cache.set(IGDB_TOKEN_CACHE_KEY, "their-token", 60)
+        cache.delete(IGDB_TOKEN_LOCK_KEY)
+
+    with mock.patch("videogames.igdb.http_client.post") as post:
+        with mock.patch(
+            "videogames.igdb.time.sleep", side_effect=other_worker_finishes
+        ):
+            assert get_igdb_token() == "their-token"
+    post.assert_not_called()
+
+
+def test_lookup_games_from_igdb_batches_searches(twitch_tokens):
+    def post(url, provider, **kwargs):
+        if token := twitch_tokens(url, provider):
+            return token
+        if url == MULTIQUERY_URL:
+            return response(
+                [
+                    {"name": "0", "result": [{"game": 9}, {"game": 7}]},
+                    {"name": "1", "result": []},
+                ]
+            )
+        return response([{"id": 7, "name": "Streets of Rage"}])
+
+    with mock.patch("videogames.igdb.http_client.post", side_effect=post) as p:
+        games = lookup_games_from_igdb(["Streets of Rage", "Nothing (USA)"])
+
+    assert games["Streets of Rage"]["igdb_id"] == 7
+    assert games["Nothing (USA)"] == {}
+    # A token, one multiquery for both names and one query for the games
+    assert p.call_count == 3
+    assert (
+        'query search "1" { fields name,game,published_at; search "Nothing"'
+        in p.call_args_list[1].kwargs["data"]
+    )
@@ -0,0 +1,73 @@
+import json
+import os
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from videogames.models import VideoGame
+from videogames.retroarch import import_retroarch_lrtl_files
+
+from scrobbles.models import Scrobble
+from scrobbles.utils import import_retroarch_for_all_users
+
+
+def write_lrtl(directory, name, runtime, last_played):
+    path = directory / f"{name} (World).lrtl"
+    path.write_text(
+        json.dumps(
+            {"version": "1.0", "runtime": runtime, "last_played": last_played}
+        )
+    )
+    return path
+
+
+@pytest.mark.django_db
+def test_retroarch_import_only_reads_changed_files(tmp_path):
+    user = get_user_model().objects.create(username="Test User")
+    user.profile.retroarch_path = f"{tmp_path}/"
+    user.profile.retroarch_auto_import = True
+    user.profile.save()
+    sonic = VideoGame.objects.create(
+        title="Sonic The Hedgehog 2", retroarch_name="Sonic The Hedgehog 2"
+    )
+    write_lrtl(
+        tmp_path, "Sonic The Hedgehog 2", "0:20:19", "2023-05-23 15:30:15"
+    )
+    streets = write_lrtl(
+        tmp_path, "Streets of Rage", "0:10:00", "2023-05-24 20:00:00"
+    )
+
+    game_dict = {"title": "Streets of Rage", "cover_url": "", "hltb_id": 1}
+    with mock.patch(
+        "videogames.retroarch.scrape_game_name_from_adb", return_value=""
+    ):
+        with mock.patch(
+            "videogames.retroarch.lookup_videogame_data_many",
+            return_value={"Streets of Rage": game_dict},
+        ) as lookup:
+            with mock.patch.object(VideoGame, "fix_metadata"):
+                created = import_retroarch_lrtl_files(
+                    user.profile.retroarch_path, user.id
+                )
+    lookup.assert_called_once_with(["Streets of Rage"])
+    assert sorted(s.video_game.title for s in created) == [
+        "Sonic The Hedgehog 2",
+        "Streets of Rage",
+    ]
+
+    # Nothing changed, so nothing is read or queued
+    user.refresh_from_db()
+    assert import_retroarch_for_all_users() == 0
+    with mock.patch("videogames.retroarch.load_game_data") as load:
+        load.return_value = {}
+        import_retroarch_lrtl_files(user.profile.retroarch_path, user.id)
+    assert load.call_args.kwargs["filenames"] == []
+
+    # Playing again picks up just the new session
+    write_lrtl(tmp_path, "Streets of Rage", "0:25:00", "2023-05-25 20:00:00")
+    os.utime(streets, ns=(0, 0))
+    created = import_retroarch_lrtl_files(user.profile.retroarch_path, user.id)
+    assert [
+        (s.video_game.title, s.playback_position_seconds) for s in created
+    ] == [("Streets of Rage", 900)]
+    assert Scrobble.objects.filter(video_game=sonic).count() == 1
@@ -1,17 +1,20 @@
-from collections import OrderedDict
 import logging
 import re
 import sqlite3
+from array import array
+from collections import defaultdict
 from datetime import datetime, timedelta
 from enum import Enum
+from itertools import accumulate
+from operator import add, sub
+from tempfile import NamedTemporaryFile
 
 import pytz
 import requests
-from books.models import Author, Book
+from books.models import Author, Book, KoReaderHash
 from books.openlibrary import get_author_openlibrary_id
 from django.apps import apps
 from django.contrib.auth import get_user_model
-from stream_sqlite import stream_sqlite
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -102,6 +105,7 @@ def create_book_from_row(row: list):
         },
         run_time_seconds=run_time,
     )
+    book.record_koreader_hashes()
     book.fix_metadata()
 
     # Add authors
@@ -121,6 +125,7 @@ def build_book_map(rows) -> dict:
     """
     book_id_map = {}
 
+    book_rows = []
     for book_row in rows:
         if (
             book_row[KoReaderBookColumn.TITLE.value]
@@ -130,16 +135,26 @@ def build_book_map(rows) -> dict:
                 "Ignoring the KOReader quickstart guide. No on wants that."
             )
             continue
-        book = Book.objects.filter(
-            koreader_data_by_hash__icontains=book_row[
-                KoReaderBookColumn.MD5.value
+        book_rows.append(book_row)
+
+    books_by_hash = {
+        koreader_hash.md5: koreader_hash.book
+        for koreader_hash in KoReaderHash.objects.filter(
+            md5__in=[
+                book_row[KoReaderBookColumn.MD5.value]
+                for book_row in book_rows
+                if book_row[KoReaderBookColumn.MD5.value]
             ]
-        ).first()
+        ).select_related("book")
+    }
 
+    for book_row in book_rows:
+        md5 = book_row[KoReaderBookColumn.MD5.value]
+        book = books_by_hash.get(md5) if md5 else None
         if not book:
             book = create_book_from_row(book_row)
+            books_by_hash[md5] = book
 
-        book.refresh_from_db()
         total_seconds = 0
         if book_row[KoReaderBookColumn.TOTAL_READ_TIME.value]:
             total_seconds = book_row[KoReaderBookColumn.TOTAL_READ_TIME.value]
@@ -152,10 +167,68 @@ def build_book_map(rows) -> dict:
     return book_id_map
 
 
+class PageStats:
+    """The page_stat_data rows for one book, one compact array per column
+
+    Like KOReader, we only keep the last read of each page.
+    """
+
+    def __init__(self):
+        self.pages = array("q")
+        self.start_ts = array("q")
+        self.durations = array("q")
+        self.rows = {}
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def append(self, page: int, start_ts: int, duration: int) -> None:
+        row = self.rows.get(page)
+        if row is not None:
+            self.start_ts[row] = start_ts
+            self.durations[row] = duration
+            return
+        self.rows[page] = len(self.pages)
+        self.pages.append(page)
+        self.start_ts.append(start_ts)
+        self.durations.append(duration)
+
+    def reading_order(self) -> "PageStats":
+        """The pages ordered by when they were read"""
+        ordered = PageStats()
+        for row in sorted(range(len(self)), key=self.start_ts.__getitem__):
+            ordered.append(
+                self.pages[row], self.start_ts[row], self.durations[row]
+            )
+        return ordered
+
+    @property
+    def end_ts(self) -> list[int]:
+        return list(map(add, self.start_ts, self.durations))
+
+    def session_ends(self) -> list[int]:
+        """Indexes of the pages that close a reading session
+
+        A session closes on a page that ends more than SESSION_GAP_SECONDS
+        after the previous page started, unless it also jumps more than ten
+        pages ahead, and always on the last page. The closing page itself
+        starts the next session.
+        """
+        gaps = map(sub, self.end_ts[1:], self.start_ts[:-1])
+        jumps = map(sub, self.pages[1:], self.pages[:-1])
+        ends = [
+            row
+            for row, (gap, jump) in enumerate(zip(gaps, jumps), start=1)
+            if gap > SESSION_GAP_SECONDS and jump <= 10
+        ]
+        if not ends or ends[-1] != len(self) - 1:
+            ends.append(len(self) - 1)
+        return ends
+
+
 def build_page_data(page_rows: list, book_map: dict, user_tz=None) -> dict:
-    """Given rows of page data from KoReader, parse each row and build
-    scrobbles for our user, loading the page data into the page_data
-    field on the scrobble instance.
+    """Given rows of page data from KoReader, load each row into the
+    PageStats of its book in the book map, for building scrobbles later.
     """
     book_ids_not_found = []
     for page_row in page_rows:
@@ -166,17 +239,13 @@ def build_page_data(page_rows: list, book_map: dict, user_tz=None) -> dict:
             continue
 
         if "pages" not in book_map[koreader_book_id].keys():
-            book_map[koreader_book_id]["pages"] = {}
+            book_map[koreader_book_id]["pages"] = PageStats()
 
-        page_number = page_row[KoReaderPageStatColumn.PAGE.value]
-        duration = page_row[KoReaderPageStatColumn.DURATION.value]
-        start_ts = page_row[KoReaderPageStatColumn.START_TIME.value]
-
-        book_map[koreader_book_id]["pages"][page_number] = {
-            "duration": duration,
-            "start_ts": start_ts,
-            "end_ts": start_ts + duration,
-        }
+        book_map[koreader_book_id]["pages"].append(
+            page_row[KoReaderPageStatColumn.PAGE.value],
+            page_row[KoReaderPageStatColumn.START_TIME.value],
+            page_row[KoReaderPageStatColumn.DURATION.value],
+        )
     if book_ids_not_found:
         logger.info(
             f"Found pages for books not in file: {set(book_ids_not_found)}"
@@ -184,6 +253,37 @@ def build_page_data(page_rows: list, book_map: dict, user_tz=None) -> dict:
     return book_map
 
 
+def get_session_timestamps(
+    start_ts: int, end_ts: int, timezone: str
+) -> tuple[datetime, datetime, str]:
+    """Convert the KOReader start and end of a reading session into the
+    timestamps and timezone name for its scrobble"""
+    timestamp = datetime.fromtimestamp(int(start_ts)).replace(
+        tzinfo=pytz.timezone(timezone)
+    )
+
+    # Add a shim here temporarily to fix imports while we were in France
+    # if date is between 10/15 and 12/15, cast it to Europe/Central
+    if (
+        datetime(2023, 10, 15).replace(tzinfo=pytz.timezone("Europe/Paris"))
+        <= timestamp
+        <= datetime(2023, 12, 15).replace(tzinfo=pytz.timezone("Europe/Paris"))
+    ):
+        timezone = "Europe/Paris"
+
+    stop_timestamp = datetime.fromtimestamp(int(end_ts)).replace(
+        tzinfo=pytz.timezone(timezone)
+    )
+
+    if (
+        timestamp.tzinfo._dst.seconds == 0
+        or stop_timestamp.tzinfo._dst.seconds == 0
+    ):
+        timestamp = timestamp - timedelta(hours=1)
+        stop_timestamp = stop_timestamp - timedelta(hours=1)
+    return timestamp, stop_timestamp, timezone
+
+
 def build_scrobbles_from_book_map(
     book_map: dict, user: "User"
 ) -> list["Scrobble"]:
@@ -191,6 +291,14 @@ def build_scrobbles_from_book_map(
 
     scrobbles_to_create = []
 
+    # Every existing scrobble of the books in the file, in one query
+    existing_timestamps = defaultdict(set)
+    for book_id, timestamp in Scrobble.objects.filter(
+        user_id=user.id,
+        book_id__in=[book_dict["book_id"] for book_dict in book_map.values()],
+    ).values_list("book_id", "timestamp"):
+        existing_timestamps[book_id].add(timestamp)
+
     pages_not_found = []
     for koreader_book_id, book_dict in book_map.items():
         book_id = book_dict["book_id"]
@@ -198,169 +306,164 @@ def build_scrobbles_from_book_map(
             pages_not_found.append(book_id)
             continue
 
-        should_create_scrobble = False
-        scrobble_page_data = {}
-        playback_position_seconds = 0
-        prev_page_stats = {}
-        last_page_number = 0
-
-        pages_processed = 0
-        total_pages_read = len(book_map[koreader_book_id]["pages"])
-        ordered_pages = sorted(
-            book_map[koreader_book_id]["pages"].items(),
-            key=lambda x: x[1]["start_ts"],
-        )
+        stats = book_dict["pages"].reading_order()
+        end_ts = stats.end_ts
+        # Running reading time, so a session's time is just a difference
+        elapsed = list(accumulate(stats.durations))
+
+        session_start = 0
+        last_session_end = None
+        for session_end in stats.session_ends():
+            if session_end == session_start:
+                logger.error(
+                    "Could not process book, no page data found",
+                    extra={"book_id": book_id},
+                )
+                continue
 
-        for cur_page_number, stats in ordered_pages:
-            pages_processed += 1
+            timestamp, stop_timestamp, timezone = get_session_timestamps(
+                stats.start_ts[session_start],
+                end_ts[session_end - 1],
+                user.profile.timezone,
+            )
+            # Later sessions always restart from the one already scrobbled
+            if timestamp in existing_timestamps[book_id]:
+                break
 
-            seconds_from_last_page = 0
-            if prev_page_stats:
-                seconds_from_last_page = stats.get(
-                    "end_ts"
-                ) - prev_page_stats.get("start_ts")
+            playback_position_seconds = elapsed[session_end]
+            if last_session_end is not None:
+                playback_position_seconds -= elapsed[last_session_end]
 
-            playback_position_seconds = playback_position_seconds + stats.get(
-                "duration"
+            logger.info(
+                f"Queueing scrobble for {book_id}, page {stats.pages[session_end]}"
             )
-
-            end_of_reading = pages_processed == total_pages_read
-            big_jump_to_this_page = (cur_page_number - last_page_number) > 10
-            is_session_gap = seconds_from_last_page > SESSION_GAP_SECONDS
-            if (
-                is_session_gap and not big_jump_to_this_page
-            ) or end_of_reading:
-                should_create_scrobble = True
-
-            if should_create_scrobble:
-                scrobble_page_data = dict(
-                    sorted(
-                        scrobble_page_data.items(),
-                        key=lambda x: x[1]["start_ts"],
-                    )
-                )
-                try:
-                    first_page = scrobble_page_data.get(
-                        list(scrobble_page_data.keys())[0]
-                    )
-                    last_page = scrobble_page_data.get(
-                        list(scrobble_page_data.keys())[-1]
-                    )
-                except IndexError:
-                    logger.error(
-                        "Could not process book, no page data found",
-                        extra={"scrobble_page_data": scrobble_page_data},
-                    )
-                    continue
-
-                timezone = user.profile.timezone
-
-                timestamp = datetime.fromtimestamp(
-                    int(first_page.get("start_ts"))
-                ).replace(tzinfo=pytz.timezone(timezone))
-
-                # Add a shim here temporarily to fix imports while we were in France
-                # if date is between 10/15 and 12/15, cast it to Europe/Central
-                if (
-                    datetime(2023, 10, 15).replace(
-                        tzinfo=pytz.timezone("Europe/Paris")
-                    )
-                    <= timestamp
-                    <= datetime(2023, 12, 15).replace(
-                        tzinfo=pytz.timezone("Europe/Paris")
-                    )
-                ):
-                    timezone = "Europe/Paris"
-
-                stop_timestamp = datetime.fromtimestamp(
-                    int(last_page.get("end_ts"))
-                ).replace(tzinfo=pytz.timezone(timezone))
-
-                if (
-                    timestamp.tzinfo._dst.seconds == 0
-                    or stop_timestamp.tzinfo._dst.seconds == 0
-                ):
-                    timestamp = timestamp - timedelta(hours=1)
-                    stop_timestamp = stop_timestamp - timedelta(hours=1)
-
-                scrobble = Scrobble.objects.filter(
-                    timestamp=timestamp,
+            page_data = {
+                stats.pages[row]: {
+                    "duration": stats.durations[row],
+                    "start_ts": stats.start_ts[row],
+                    "end_ts": end_ts[row],
+                }
+                for row in range(session_start, session_end)
+            }
+            log_data = {
+                "koreader_hash": book_dict.get("hash"),
+                "page_data": page_data,
+                "pages_read": len(page_data.keys()),
+            }
+            scrobbles_to_create.append(
+                Scrobble(
                     book_id=book_id,
                     user_id=user.id,
-                ).first()
-
-                if not scrobble:
-                    logger.info(
-                        f"Queueing scrobble for {book_id}, page {cur_page_number}"
-                    )
-                    log_data = {
-                        "koreader_hash": book_dict.get("hash"),
-                        "page_data": scrobble_page_data,
-                        "pages_read": len(scrobble_page_data.keys()),
-                    }
-                    scrobbles_to_create.append(
-                        Scrobble(
-                            book_id=book_id,
-                            user_id=user.id,
-                            source="KOReader",
-                            media_type=Scrobble.MediaType.BOOK,
-                            timestamp=timestamp,
-                            log=log_data,
-                            stop_timestamp=stop_timestamp,
-                            playback_position_seconds=playback_position_seconds,
-                            in_progress=False,
-                            played_to_completion=True,
-                            long_play_complete=False,
-                            timezone=timezone,
-                        )
-                    )
-                    # Then start over
-                    should_create_scrobble = False
-                    playback_position_seconds = 0
-                    scrobble_page_data = {}
-
-            # We accumulate pages for the scrobble until we should create a new one
-            scrobble_page_data[cur_page_number] = stats
-
-            last_page_number = cur_page_number
-            prev_page_stats = stats
+                    source="KOReader",
+                    media_type=Scrobble.MediaType.BOOK,
+                    timestamp=timestamp,
+                    log=log_data,
+                    stop_timestamp=stop_timestamp,
+                    playback_position_seconds=playback_position_seconds,
+                    in_progress=False,
+                    played_to_completion=True,
+                    long_play_complete=False,
+                    timezone=timezone,
+                )
+            )
+            session_start = session_end
+            last_session_end = session_end
     if pages_not_found:
         logger.info(f"Pages not found for books: {set(pages_not_found)}")
     return scrobbles_to_create
 
 
+def count_pages_read(page_data: dict) -> int:
+    """Pages read in a session, from the first page to the last"""
+    pages = sorted(int(page) for page in (page_data or {}).keys())
+    if len(pages) == 1:
+        return 1
+    if len(pages) >= 2:
+        return pages[-1] - pages[0]
+    return 0
+
+
 def fix_long_play_stats_for_scrobbles(scrobbles: list) -> None:
     """Given a list of scrobbles, update pages read, long play seconds and check
-    for media completion"""
+    for media completion
+
+    Long play seconds run on from the scrobble before, so each book's
+    scrobbles are walked in order, after the earlier scrobbles of the book
+    loaded in one query, and saved with one bulk update.
+    """
+    if not scrobbles:
+        return
+    Scrobble = apps.get_model("scrobbles", "Scrobble")
 
+    new_ids = {scrobble.id for scrobble in scrobbles}
+    timelines = defaultdict(list)
     for scrobble in scrobbles:
-        # But if there's a next scrobble, set pages read to their starting page
-        if scrobble.previous and not scrobble.previous.long_play_complete:
-            scrobble.long_play_seconds = scrobble.playback_position_seconds + (
-                scrobble.previous.long_play_seconds or 0
+        timelines[scrobble.book_id].append(scrobble)
+    for earlier in (
+        Scrobble.objects.filter(
+            book_id__in=timelines.keys(),
+            timestamp__lt=max(scrobble.timestamp for scrobble in scrobbles),
+        )
+        .exclude(id__in=new_ids)
+        .only(
+            "book_id", "timestamp", "long_play_seconds", "long_play_complete"
+        )
+    ):
+        timelines[earlier.book_id].append(earlier)
+
+    for timeline in timelines.values():
+        timeline.sort(key=lambda s: (s.timestamp, s.id in new_ids))
+        # The previous scrobble is the last one strictly before this one
+        previous = None
+        group_timestamp = None
+        group_last = None
+        for scrobble in timeline:
+            if scrobble.timestamp != group_timestamp:
+                previous = group_last
+                group_timestamp = scrobble.timestamp
+            group_last = scrobble
+            if scrobble.id not in new_ids:
+                continue
+
+            # But if there's a next scrobble, set pages read to their starting page
+            if previous and not previous.long_play_complete:
+                scrobble.long_play_seconds = (
+                    scrobble.playback_position_seconds
+                    + (previous.long_play_seconds or 0)
+                )
+            else:
+                scrobble.long_play_seconds = scrobble.playback_position_seconds
+            scrobble.log["book_pages_read"] = count_pages_read(
+                scrobble.log.get("page_data")
             )
-        else:
-            scrobble.long_play_seconds = scrobble.playback_position_seconds
-        scrobble.log["book_pages_read"] = scrobble.calc_pages_read()
 
-        scrobble.save(update_fields=["log", "long_play_seconds"])
+    Scrobble.objects.bulk_update(scrobbles, ["log", "long_play_seconds"])
 
 
 def process_koreader_sqlite_file(file_path, user_id) -> list:
     """Given a sqlite file from KoReader, open the book table, iterate
-    over rows creating scrobbles from each book found"""
+    over rows creating scrobbles from each book found
+
+    Files on S3 are downloaded once, to a temporary file, and read from there.
+    """
     Scrobble = apps.get_model("scrobbles", "Scrobble")
 
+    is_os_file = "https://" not in file_path
+    if not is_os_file:
+        with NamedTemporaryFile(suffix=".sqlite3") as sqlite_file:
+            for chunk in _sqlite_bytes(file_path):
+                sqlite_file.write(chunk)
+            sqlite_file.flush()
+            return process_koreader_sqlite_file(sqlite_file.name, user_id)
+
     new_scrobbles = []
     user = User.objects.filter(id=user_id).first()
     tz = pytz.utc
     if user:
         tz = user.profile.timezone
 
-    is_os_file = "https://" not in file_path
-    if is_os_file:
-        # Loading sqlite file from local filesystem
-        con = sqlite3.connect(file_path)
+    con = sqlite3.connect(file_path)
+    try:
         cur = con.cursor()
         try:
             book_map = build_book_map(cur.execute("SELECT * FROM book"))
@@ -375,23 +478,9 @@ def process_koreader_sqlite_file(file_path, user_id) -> list:
             book_map,
             tz,
         )
-        new_scrobbles = build_scrobbles_from_book_map(book_map, user)
-    else:
-        # Streaming the sqlite file off S3
-        book_map = {}
-        for table_name, pragma_table_info, rows in stream_sqlite(
-            _sqlite_bytes(file_path), max_buffer_size=1_048_576
-        ):
-            logger.debug(f"Found table {table_name} - processing")
-            if table_name == "book":
-                book_map = build_book_map(rows)
-
-        for table_name, pragma_table_info, rows in stream_sqlite(
-            _sqlite_bytes(file_path), max_buffer_size=1_048_576
-        ):
-            if table_name == "page_stat_data":
-                book_map = build_page_data(rows, book_map, tz)
-                new_scrobbles = build_scrobbles_from_book_map(book_map, user)
+    finally:
+        con.close()
+    new_scrobbles = build_scrobbles_from_book_map(book_map, user)
 
     logger.info(f"Creating {len(new_scrobbles)} new scrobbles")
     created = []
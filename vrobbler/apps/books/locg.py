@@ -2,8 +2,8 @@
 
 from typing import Optional
 from bs4 import BeautifulSoup
-import requests
 import logging
+from scrobbles import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +38,7 @@ def lookup_comic_writer_by_locg_slug(slug: str) -> dict:
     data_dict = {}
     writer_url = LOCG_WRITER_DETAIL_URL.format(slug=slug)
 
-    response = requests.get(writer_url, headers=HEADERS)
+    response = http_client.get(writer_url, provider="locg", headers=HEADERS)
 
     if response.status_code != 200:
         logger.info(f"Bad http response from LOCG {response}")
@@ -56,7 +56,7 @@ def lookup_comic_by_locg_slug(slug: str) -> dict:
     data_dict = {}
     product_url = LOCG_DETAIL_URL.format(locg_slug=slug)
 
-    response = requests.get(product_url, headers=HEADERS)
+    response = http_client.get(product_url, provider="locg", headers=HEADERS)
 
     if response.status_code != 200:
         logger.info(f"Bad http response from LOCG {response}")
@@ -106,7 +106,7 @@ def lookup_comic_by_locg_slug(slug: str) -> dict:
 
 def lookup_comic_from_locg(title: str) -> dict:
     search_url = LOCG_SEARCH_URL.format(query=title)
-    response = requests.get(search_url, headers=HEADERS)
+    response = http_client.get(search_url, provider="locg", headers=HEADERS)
 
     if response.status_code != 200:
         logger.warn(f"Bad http response from LOCG {response}")
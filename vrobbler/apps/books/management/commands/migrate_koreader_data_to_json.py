@@ -19,7 +19,7 @@ class Command(BaseCommand):
         scrobbles_to_create = []
 
         for book in Book.objects.filter(koreader_id__isnull=False):
-            book.scrobble_set.all().delete()
+            book.scrobble_set.all().delete_with_rollups()
 
             koreader_data = book.koreader_data_by_hash or {}
             if book.koreader_md5:
@@ -31,6 +31,7 @@ class Command(BaseCommand):
                 }
             book.koreader_data_by_hash = koreader_data
             book.save(update_fields=["koreader_data_by_hash"])
+            book.record_koreader_hashes()
 
             # Next parse all this book's pages into new scrobbles
             should_create_scrobble = False
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+def record_koreader_hashes(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    KoReaderHash = apps.get_model("books", "KoReaderHash")
+    KoReaderHash.objects.bulk_create(
+        [
+            KoReaderHash(book_id=book_id, md5=md5)
+            for book_id, data in Book.objects.filter(
+                koreader_data_by_hash__isnull=False
+            ).values_list("id", "koreader_data_by_hash")
+            for md5 in (data or {}).keys()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0020_author_comicvine_data_book_comicvine_data_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KoReaderHash",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    django_extensions.db.fields.CreationDateTimeField(
+                        auto_now_add=True, verbose_name="created"
+                    ),
+                ),
+                (
+                    "modified",
+                    django_extensions.db.fields.ModificationDateTimeField(
+                        auto_now=True, verbose_name="modified"
+                    ),
+                ),
+                ("md5", models.CharField(db_index=True, max_length=255)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="koreader_hashes",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("book", "md5")},
+            },
+        ),
+        migrations.RunPython(
+            record_koreader_hashes, migrations.RunPython.noop
+        ),
+    ]
@@ -152,6 +152,16 @@ class Book(LongPlayScrobblableMixin):
     def get_start_url(self):
         return reverse("scrobbles:start", kwargs={"uuid": self.uuid})
 
+    def record_koreader_hashes(self) -> None:
+        """Index the hashes in koreader_data_by_hash for import lookups"""
+        KoReaderHash.objects.bulk_create(
+            [
+                KoReaderHash(book=self, md5=md5)
+                for md5 in (self.koreader_data_by_hash or {}).keys()
+            ],
+            ignore_conflicts=True,
+        )
+
     def get_absolute_url(self):
         return reverse("books:book_detail", kwargs={"slug": self.uuid})
 
@@ -349,6 +359,25 @@ class Book(LongPlayScrobblableMixin):
         return book
 
 
+class KoReaderHash(TimeStampedModel):
+    """A KOReader document hash seen for a book, indexed so imports can
+    match all their books in one query"""
+
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="koreader_hashes"
+    )
+    md5 = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        unique_together = (
+            "book",
+            "md5",
+        )
+
+    def __str__(self):
+        return f"{self.md5} for {self.book}"
+
+
 class Page(TimeStampedModel):
     """DEPRECATED, we need to migrate pages into page_data on scrobbles and move on"""
 
@@ -3,8 +3,7 @@ import logging
 from typing import Optional
 import urllib
 
-import requests
-
+from scrobbles import http_client
 from thefuzz import fuzz
 
 logger = logging.getLogger(__name__)
@@ -26,7 +25,7 @@ def get_first(key: str, result: dict) -> str:
 
 def get_author_openlibrary_id(name: str) -> str:
     search_url = AUTHOR_SEARCH_URL.format(query=name)
-    response = requests.get(search_url)
+    response = http_client.get(search_url, provider="openlibrary")
 
     if response.status_code != 200:
         logger.warn(f"Bad response from OL: {response.status_code}")
@@ -47,7 +46,7 @@ def get_author_openlibrary_id(name: str) -> str:
 
 def lookup_author_from_openlibrary(olid: str) -> dict:
     author_url = AUTHOR_URL.format(id=olid)
-    response = requests.get(author_url)
+    response = http_client.get(author_url, provider="openlibrary")
 
     if response.status_code != 200:
         logger.warn(f"Bad response from OL: {response.status_code}")
@@ -90,7 +89,7 @@ def lookup_book_from_openlibrary(
     query = f"{title_quoted} {author_quoted}"
 
     search_url = SEARCH_URL.format(query=query)
-    response = requests.get(search_url)
+    response = http_client.get(search_url, provider="openlibrary")
 
     if response.status_code != 200:
         logger.warn(f"Bad response from OL: {response.status_code}")
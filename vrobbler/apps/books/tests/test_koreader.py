@@ -1,16 +1,32 @@
-import pytest
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
 from unittest import mock
 
+import pytest
+import pytz
 from books.koreader import (
+    SESSION_GAP_SECONDS,
     KoReaderBookColumn,
     build_book_map,
     build_page_data,
     build_scrobbles_from_book_map,
+    fix_long_play_stats_for_scrobbles,
+    get_session_timestamps,
+    process_koreader_sqlite_file,
 )
+from books.models import Book, KoReaderHash
+from django.contrib.auth import get_user_model
+
+from scrobbles.models import Scrobble
 
 
 @pytest.mark.django_db
-@mock.patch("requests.get")
+@mock.patch("scrobbles.http_client.get")
 def test_build_book_map(get_mock, koreader_rows, valid_response):
     get_mock.return_value = valid_response
     book_map = build_book_map(koreader_rows.BOOK_ROWS)
@@ -18,7 +34,7 @@ def test_build_book_map(get_mock, koreader_rows, valid_response):
 
 
 @pytest.mark.django_db
-@mock.patch("requests.get")
+@mock.patch("scrobbles.http_client.get")
 def test_load_page_data_to_map(get_mock, koreader_rows, valid_response):
     get_mock.return_value = valid_response
     book_map = build_page_data(
@@ -34,7 +50,7 @@ def test_load_page_data_to_map(get_mock, koreader_rows, valid_response):
 
 
 @pytest.mark.django_db
-@mock.patch("requests.get")
+@mock.patch("scrobbles.http_client.get")
 def test_build_scrobbles_from_pages(
     get_mock, koreader_rows, demo_user, valid_response
 ):
@@ -52,3 +68,256 @@ def test_build_scrobbles_from_pages(
     assert len(scrobbles[3].logdata.page_data.keys()) == 20
     assert len(scrobbles[4].logdata.page_data.keys()) == 20
     assert len(scrobbles[5].logdata.page_data.keys()) == 18
+
+
+def page_stat_rows(book_ids: list[int], rows_per_book: int) -> list[tuple]:
+    """Reading sessions with the odd skipped chapter and reread page"""
+    rng = random.Random(42)
+    rows = []
+    for book_id in book_ids:
+        page = 1
+        start_ts = 1672531200
+        for _ in range(rows_per_book):
+            roll = rng.random()
+            if roll < 0.02:
+                start_ts += rng.randint(SESSION_GAP_SECONDS, 86400 * 3)
+            if roll < 0.005:
+                page += rng.randint(11, 40)
+            elif roll < 0.05:
+                page -= rng.randint(1, 3)
+            else:
+                page += 1
+            duration = rng.randint(5, 240)
+            rows.append((book_id, page, start_ts, duration, 500))
+            start_ts += duration + rng.randint(0, 30)
+    return rows
+
+
+def reference_scrobbles(rows: list[tuple], book_map: dict, user) -> list:
+    """The page-by-page sessionizer PageStats replaced, kept to check the
+    sessions it splits each book into are unchanged"""
+    pages = defaultdict(dict)
+    for koreader_id, page, start_ts, duration, _ in rows:
+        pages[koreader_id][page] = {
+            "duration": duration,
+            "start_ts": start_ts,
+            "end_ts": start_ts + duration,
+        }
+
+    scrobbles = []
+    for koreader_id, book_dict in book_map.items():
+        book_id = book_dict["book_id"]
+        ordered = sorted(
+            pages[koreader_id].items(), key=lambda x: x[1]["start_ts"]
+        )
+        page_data, seconds, last_page, last_stats = {}, 0, 0, None
+        for pages_read, (page, stats) in enumerate(ordered, 1):
+            seconds += stats["duration"]
+            is_session_gap = (
+                last_stats
+                and stats["end_ts"] - last_stats["start_ts"]
+                > SESSION_GAP_SECONDS
+            )
+            # The page that ends a session starts the page data of the next
+            if (is_session_gap and page - last_page <= 10) or (
+                pages_read == len(ordered)
+            ):
+                if not page_data:
+                    break
+                session_pages = list(page_data.values())
+                timestamp, stop_timestamp, timezone = get_session_timestamps(
+                    session_pages[0]["start_ts"],
+                    session_pages[-1]["end_ts"],
+                    user.profile.timezone,
+                )
+                if Scrobble.objects.filter(
+                    timestamp=timestamp, book_id=book_id, user_id=user.id
+                ).exists():
+                    break
+                scrobbles.append(
+                    Scrobble(
+                        book_id=book_id,
+                        timestamp=timestamp,
+                        stop_timestamp=stop_timestamp,
+                        timezone=timezone,
+                        playback_position_seconds=seconds,
+                        log={
+                            "koreader_hash": book_dict.get("hash"),
+                            "page_data": page_data,
+                            "pages_read": len(page_data),
+                        },
+                    )
+                )
+                page_data, seconds = {}, 0
+            page_data[page] = stats
+            last_page, last_stats = page, stats
+    return scrobbles
+
+
+def scrobble_fields(scrobbles: list[Scrobble]) -> list[tuple]:
+    return [
+        (
+            s.book_id,
+            s.timestamp.isoformat(),
+            s.stop_timestamp.isoformat(),
+            s.timezone,
+            s.playback_position_seconds,
+            json.dumps(s.log),
+        )
+        for s in scrobbles
+    ]
+
+
+@pytest.fixture
+def reader():
+    user = get_user_model().objects.create(username="Test User")
+    user.profile.timezone = "US/Eastern"
+    user.profile.save()
+    return user
+
+
+def make_book_map(count: int) -> dict:
+    return {
+        koreader_id: {
+            "book_id": Book.objects.create(title=f"Book {koreader_id}").id,
+            "hash": f"hash{koreader_id}",
+            "total_seconds": 0,
+        }
+        for koreader_id in range(1, count + 1)
+    }
+
+
+@pytest.mark.django_db
+def test_sessionizer_matches_page_by_page_scrobbles(reader):
+    rows = page_stat_rows([1, 2, 3], 2000)
+    book_map = make_book_map(3)
+    # A single page is never enough for a scrobble
+    rows.append((3, 1, 1672531200, 30, 500))
+    book_map[4] = {"book_id": book_map[3]["book_id"] + 1, "hash": "single"}
+
+    def build_both():
+        scrobbles = build_scrobbles_from_book_map(
+            build_page_data(rows, {k: dict(v) for k, v in book_map.items()}),
+            reader,
+        )
+        reference = reference_scrobbles(rows, book_map, reader)
+        return scrobble_fields(scrobbles), scrobble_fields(reference)
+
+    scrobbles, reference = build_both()
+    assert len(scrobbles) > 20
+    assert scrobbles == reference
+
+    # Books stop at the first session that was already imported
+    existing = Scrobble.objects.create(
+        book_id=book_map[2]["book_id"],
+        user=reader,
+        timestamp=datetime.fromisoformat(
+            [s for s in scrobbles if s[0] == book_map[2]["book_id"]][3][1]
+        ),
+        media_type=Scrobble.MediaType.BOOK,
+    )
+    scrobbles, reference = build_both()
+    assert scrobbles == reference
+    assert existing.timestamp.isoformat() not in [s[1] for s in scrobbles]
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(
+    not os.environ.get("VROBBLER_BENCHMARK"),
+    reason="Set VROBBLER_BENCHMARK=1 to run benchmarks",
+)
+@pytest.mark.django_db
+def test_sessionizer_benchmark(reader):
+    rows = page_stat_rows(list(range(1, 6)), 20000)
+    book_map = make_book_map(5)
+
+    started = time.perf_counter()
+    scrobbles = build_scrobbles_from_book_map(
+        build_page_data(rows, {k: dict(v) for k, v in book_map.items()}),
+        reader,
+    )
+    columnar_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    reference = reference_scrobbles(rows, book_map, reader)
+    reference_seconds = time.perf_counter() - started
+
+    print(
+        f"{len(rows)} page stats, {len(scrobbles)} sessions: "
+        f"{columnar_seconds:.3f}s columnar, "
+        f"{reference_seconds:.3f}s page by page"
+    )
+    assert scrobble_fields(scrobbles) == scrobble_fields(reference)
+    assert columnar_seconds < reference_seconds
+
+
+@pytest.mark.django_db
+def test_koreader_import_downloads_s3_file_once(reader, tmp_path):
+    book = Book.objects.create(
+        title="Dune", koreader_data_by_hash={"abc123": {"title": "Dune"}}
+    )
+    book.record_koreader_hashes()
+
+    sqlite_path = tmp_path / "statistics.sqlite3"
+    con = sqlite3.connect(sqlite_path)
+    con.execute(
+        "CREATE TABLE book (id, title, authors, notes, last_open, "
+        "highlights, pages, series, language, md5, total_read_time, "
+        "total_read_pages)"
+    )
+    con.execute(
+        "INSERT INTO book VALUES "
+        "(1, 'Dune', 'Frank Herbert', 0, 0, 0, 500, '', 'en', 'abc123', "
+        "600, 5)"
+    )
+    con.execute(
+        "CREATE TABLE page_stat_data "
+        "(id_book, page, start_time, duration, total_pages)"
+    )
+    con.executemany(
+        "INSERT INTO page_stat_data VALUES (?, ?, ?, ?, ?)",
+        page_stat_rows([1], 200),
+    )
+    con.commit()
+    con.close()
+
+    with mock.patch("books.koreader.requests.get") as get:
+        response = get.return_value.__enter__.return_value
+        response.iter_content.return_value = [sqlite_path.read_bytes()]
+        created = process_koreader_sqlite_file(
+            "https://s3.example.com/statistics.sqlite3", reader.id
+        )
+
+    get.assert_called_once()
+    assert created
+    assert {scrobble.book_id for scrobble in created} == {book.id}
+    assert Book.objects.count() == 1
+    assert KoReaderHash.objects.get(md5="abc123").book == book
+
+
+@pytest.mark.django_db
+def test_long_play_stats_run_on_in_bulk(reader, django_assert_num_queries):
+    book = Book.objects.create(title="Dune")
+    start = datetime(2024, 1, 1, tzinfo=pytz.utc)
+
+    def read(days, seconds, pages, **kwargs):
+        return Scrobble.objects.create(
+            book=book,
+            user=reader,
+            media_type=Scrobble.MediaType.BOOK,
+            timestamp=start + timedelta(days=days),
+            playback_position_seconds=seconds,
+            log={"page_data": {page: {} for page in pages}},
+            **kwargs,
+        )
+
+    read(0, 100, [1, 2], long_play_seconds=100)
+    new = [read(2, 30, [20, 21, 22, 30]), read(1, 50, [3, 4, 5])]
+
+    with django_assert_num_queries(2):
+        fix_long_play_stats_for_scrobbles(new)
+
+    for scrobble in new:
+        scrobble.refresh_from_db()
+    assert [s.long_play_seconds for s in new] == [180, 150]
+    assert [s.log["book_pages_read"] for s in new] == [10, 2]
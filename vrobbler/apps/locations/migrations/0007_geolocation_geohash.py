@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:47
+
+from django.db import migrations, models
+from locations.spatial import encode
+
+
+def set_geohashes(apps, schema_editor):
+    GeoLocation = apps.get_model("locations", "GeoLocation")
+    locations = list(GeoLocation.objects.only("id", "lat", "lon"))
+    for location in locations:
+        location.geohash = encode(location.lat, location.lon)
+    GeoLocation.objects.bulk_update(locations, ["geohash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("locations", "0006_delete_rawgeolocation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="geolocation",
+            name="geohash",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=12, null=True
+            ),
+        ),
+        migrations.RunPython(set_geohashes, migrations.RunPython.noop),
+    ]
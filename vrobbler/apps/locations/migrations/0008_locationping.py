@@ -0,0 +1,108 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:55
+
+from collections import Counter
+
+from dateutil.parser import parse
+from django.db import migrations, models
+import django.db.models.deletion
+
+PROVIDERS = {"gps": "GPS", "network": "Wifi Triangulation"}
+
+
+def move_gps_updates_to_pings(apps, schema_editor):
+    """Turn each location scrobble's logged gps_updates into pings, leaving
+    a summary of them in the log"""
+    Scrobble = apps.get_model("scrobbles", "Scrobble")
+    LocationPing = apps.get_model("locations", "LocationPing")
+    provider_codes = {name: code for code, name in PROVIDERS.items()}
+
+    scrobbles = Scrobble.objects.filter(
+        media_type="GeoLocation", log__has_key="gps_updates"
+    ).only("id", "log")
+    changed = []
+    pings = []
+    for scrobble in scrobbles.iterator(chunk_size=500):
+        updates = scrobble.log.pop("gps_updates") or []
+        timestamps = []
+        providers = Counter()
+        for update in updates:
+            if not update.get("timestamp"):
+                continue
+            timestamp = parse(update["timestamp"])
+            provider = update.get("position_provider") or "Unknown"
+            timestamps.append(timestamp)
+            providers[provider] += 1
+            pings.append(
+                LocationPing(
+                    scrobble_id=scrobble.id,
+                    timestamp=timestamp,
+                    provider=provider_codes.get(provider),
+                )
+            )
+        scrobble.log["gps_pings"] = {
+            "count": len(timestamps),
+            "first": min(timestamps).isoformat() if timestamps else None,
+            "last": max(timestamps).isoformat() if timestamps else None,
+            "providers": dict(providers),
+        }
+        changed.append(scrobble)
+
+        if len(changed) >= 500:
+            LocationPing.objects.bulk_create(pings, batch_size=1000)
+            Scrobble.objects.bulk_update(changed, ["log"])
+            changed, pings = [], []
+    LocationPing.objects.bulk_create(pings, batch_size=1000)
+    Scrobble.objects.bulk_update(changed, ["log"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scrobbles", "0069_activescrobble"),
+        ("locations", "0007_geolocation_geohash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LocationPing",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField()),
+                ("lat", models.FloatField(blank=True, null=True)),
+                ("lon", models.FloatField(blank=True, null=True)),
+                (
+                    "provider",
+                    models.CharField(blank=True, max_length=16, null=True),
+                ),
+                (
+                    "scrobble",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="location_pings",
+                        to="scrobbles.scrobble",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["scrobble", "timestamp"],
+                        name="locations_l_scrobbl_dc76a0_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            move_gps_updates_to_pings, migrations.RunPython.noop
+        ),
+    ]
@@ -1,6 +1,8 @@
+from datetime import datetime
 from decimal import Decimal, getcontext
 import logging
-from typing import Dict
+from collections import Counter
+from typing import Dict, Iterable, Optional
 from uuid import uuid4
 
 from django.contrib.auth import get_user_model
@@ -8,6 +10,8 @@ from django.conf import settings
 from django.db import models
 from django.urls import reverse
 from django_extensions.db.models import TimeStampedModel
+from locations import spatial
+from locations.constants import LOCATION_PROVIDERS
 from scrobbles.mixins import ScrobblableMixin
 
 logger = logging.getLogger(__name__)
@@ -16,6 +20,28 @@ User = get_user_model()
 
 GEOLOC_ACCURACY = int(getattr(settings, "GEOLOC_ACCURACY", 4))
 GEOLOC_PROXIMITY = Decimal(getattr(settings, "GEOLOC_PROXIMITY", "0.0001"))
+# When set, proximity is a real distance in meters rather than degrees
+GEOLOC_PROXIMITY_METERS = getattr(settings, "GEOLOC_PROXIMITY_METERS", None)
+
+
+def points_apart(first, second) -> bool:
+    """Whether two things with a `lat` and `lon` are further apart than
+    GEOLOC_PROXIMITY, by distance if GEOLOC_PROXIMITY_METERS is set"""
+    if GEOLOC_PROXIMITY_METERS:
+        distance = spatial.haversine(
+            first.lat, first.lon, second.lat, second.lon
+        )
+        return distance > float(GEOLOC_PROXIMITY_METERS)
+    return (
+        abs(Decimal(first.lat) - Decimal(second.lat)) > GEOLOC_PROXIMITY
+        or abs(Decimal(first.lon) - Decimal(second.lon)) > GEOLOC_PROXIMITY
+    )
+
+
+def truncate_coordinate(value) -> float:
+    """Cut a coordinate down to GEOLOC_ACCURACY decimal places"""
+    whole, _, fraction = str(value).partition(".")
+    return float(f"{whole}.{fraction[0:GEOLOC_ACCURACY] or 0}")
 
 
 class GeoLocation(ScrobblableMixin):
@@ -26,6 +52,7 @@ class GeoLocation(ScrobblableMixin):
     truncated_lat = models.FloatField(**BNULL)
     truncated_lon = models.FloatField(**BNULL)
     altitude = models.FloatField(**BNULL)
+    geohash = models.CharField(max_length=12, db_index=True, **BNULL)
 
     class Meta:
         unique_together = [["lat", "lon", "altitude"]]
@@ -36,6 +63,13 @@ class GeoLocation(ScrobblableMixin):
 
         return f"{self.lat} x {self.lon}"
 
+    def save(self, *args, **kwargs):
+        self.geohash = spatial.encode(self.lat, self.lon)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"lat", "lon"} & set(update_fields):
+            kwargs["update_fields"] = [*update_fields, "geohash"]
+        return super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse(
             "locations:geo_location_detail", kwargs={"slug": self.uuid}
@@ -84,6 +118,52 @@ class GeoLocation(ScrobblableMixin):
             )
         return location
 
+    @classmethod
+    def find_or_create_many(cls, points: list) -> list["GeoLocation"]:
+        """Like find_or_create for a list of points with a `lat`, `lon` and
+        `altitude`, returning their locations in the same order with one
+        query to find them and one to create any that are missing"""
+        coordinates = [
+            (truncate_coordinate(point.lat), truncate_coordinate(point.lon))
+            for point in points
+        ]
+        if not coordinates:
+            return []
+
+        def find(wanted) -> dict:
+            query = models.Q()
+            for lat, lon in wanted:
+                query |= models.Q(lat=lat, lon=lon)
+            found = {}
+            for location in cls.objects.filter(query).order_by("id"):
+                found.setdefault((location.lat, location.lon), location)
+            return found
+
+        locations = find(set(coordinates))
+        missing = {}
+        for coordinate, point in zip(coordinates, points):
+            if coordinate not in locations:
+                missing.setdefault(coordinate, point)
+        if missing:
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        lat=lat,
+                        lon=lon,
+                        altitude=(
+                            float(int(point.altitude))
+                            if point.altitude is not None
+                            else None
+                        ),
+                        geohash=spatial.encode(lat, lon),
+                    )
+                    for (lat, lon), point in missing.items()
+                ],
+                ignore_conflicts=True,
+            )
+            locations.update(find(missing.keys()))
+        return [locations[coordinate] for coordinate in coordinates]
+
     @property
     def subtitle(self) -> str:
         if self.title:
@@ -96,14 +176,18 @@ class GeoLocation(ScrobblableMixin):
             abs(Decimal(old_lat_lon[1]) - Decimal(self.lon)),
         )
 
-    def has_moved(self, previous_location: "GeoLocation") -> bool:
-        has_moved = False
+    def distance_to(self, other: "GeoLocation") -> float:
+        """Distance to another location in meters"""
+        return spatial.haversine(self.lat, self.lon, other.lat, other.lon)
 
-        loc_diff = self.loc_diff(
-            (previous_location.lat, previous_location.lon)
-        )
-        if loc_diff[0] > GEOLOC_PROXIMITY or loc_diff[1] > GEOLOC_PROXIMITY:
-            has_moved = True
+    def has_moved(self, previous_location: "GeoLocation") -> bool:
+        has_moved = points_apart(self, previous_location)
+        if GEOLOC_PROXIMITY_METERS:
+            loc_diff = self.distance_to(previous_location)
+        else:
+            loc_diff = self.loc_diff(
+                (previous_location.lat, previous_location.lon)
+            )
         logger.debug(
             f"[locations] checked whether location has moved against proximity setting",
             extra={
@@ -117,16 +201,91 @@ class GeoLocation(ScrobblableMixin):
         return has_moved
 
     def in_proximity(self, named=False) -> models.QuerySet:
-        lat_min = Decimal(self.lat) - GEOLOC_PROXIMITY
-        lat_max = Decimal(self.lat) + GEOLOC_PROXIMITY
-        lon_min = Decimal(self.lon) - GEOLOC_PROXIMITY
-        lon_max = Decimal(self.lon) + GEOLOC_PROXIMITY
+        """Locations within GEOLOC_PROXIMITY of this one
+
+        Candidates come from an indexed lookup of the geohash cells around
+        this location, then get trimmed to the exact bounding box, or the
+        exact distance when GEOLOC_PROXIMITY_METERS is set.
+        """
+        lat_degrees = lon_degrees = GEOLOC_PROXIMITY
+        if GEOLOC_PROXIMITY_METERS:
+            lat_degrees, lon_degrees = map(
+                Decimal,
+                spatial.meters_to_degrees(
+                    float(GEOLOC_PROXIMITY_METERS), self.lat
+                ),
+            )
+        cells = models.Q()
+        for cell in spatial.neighbourhood(
+            self.lat, self.lon, float(lat_degrees), float(lon_degrees)
+        ):
+            cells |= models.Q(geohash__startswith=cell)
+
         is_title_null = not named
         close_locations = GeoLocation.objects.filter(
+            cells,
             title__isnull=is_title_null,
-            lat__lte=lat_max,
-            lat__gte=lat_min,
-            lon__lte=lon_max,
-            lon__gte=lon_min,
+            lat__lte=Decimal(self.lat) + lat_degrees,
+            lat__gte=Decimal(self.lat) - lat_degrees,
+            lon__lte=Decimal(self.lon) + lon_degrees,
+            lon__gte=Decimal(self.lon) - lon_degrees,
         ).exclude(id=self.id)
+
+        if GEOLOC_PROXIMITY_METERS:
+            close_ids = [
+                location.id
+                for location in close_locations.only("id", "lat", "lon")
+                if self.distance_to(location) <= float(GEOLOC_PROXIMITY_METERS)
+            ]
+            close_locations = GeoLocation.objects.filter(id__in=close_ids)
         return close_locations
+
+
+class LocationPing(models.Model):
+    """A single GPSLogger fix while a location scrobble was going on
+
+    Pings are only ever appended, so they're kept here rather than in the
+    scrobble's log, which holds a summary of them under "gps_pings". Like
+    ActiveScrobble there's no constraint on the scrobble, so deleting
+    scrobbles stays a fast delete. Scrobbles are deleted with
+    `ScrobbleQuerySet.delete_with_rollups`, which clears their pings.
+    """
+
+    scrobble = models.ForeignKey(
+        "scrobbles.Scrobble",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="location_pings",
+        db_index=False,
+    )
+    timestamp = models.DateTimeField()
+    lat = models.FloatField(**BNULL)
+    lon = models.FloatField(**BNULL)
+    provider = models.CharField(max_length=16, **BNULL)
+
+    class Meta:
+        indexes = [models.Index(fields=["scrobble", "timestamp"])]
+
+    def __str__(self):
+        return f"Ping for {self.scrobble_id} at {self.timestamp}"
+
+
+def summarize_pings(summary: Optional[dict], pings: Iterable) -> dict:
+    """Add pings, or anything with a `timestamp` and `provider`, to a
+    scrobble log's summary of its first and last pings, how many there were
+    and how many came from each position provider"""
+    summary = dict(
+        summary or {"count": 0, "first": None, "last": None, "providers": {}}
+    )
+    providers = Counter(summary["providers"])
+    timestamps = [summary["first"], summary["last"]]
+    for ping in pings:
+        summary["count"] += 1
+        providers[LOCATION_PROVIDERS[ping.provider]] += 1
+        timestamps.append(ping.timestamp.isoformat())
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    if timestamps:
+        summary["first"] = min(timestamps, key=datetime.fromisoformat)
+        summary["last"] = max(timestamps, key=datetime.fromisoformat)
+    summary["providers"] = dict(providers)
+    return summary
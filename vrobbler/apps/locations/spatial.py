@@ -0,0 +1,90 @@
+"""Geohashes and distances for finding nearby locations
+
+A geohash names a cell of a grid laid over the globe, and every character
+added splits the cell into 32 smaller ones, so locations sharing a prefix
+share a cell. Finding everything near a point is then a handful of indexed
+prefix lookups: the cell the point is in and the eight around it, at the
+smallest cell size that still covers the search distance.
+"""
+
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = 111320
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """Height and width in degrees of a cell at the given precision"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180 / 2**lat_bits, 360 / 2**lon_bits
+
+
+def precision_for(lat_degrees: float, lon_degrees: float) -> int:
+    """The longest geohash whose cells are at least this tall and wide"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height >= lat_degrees and width >= lon_degrees:
+            return precision
+    return 1
+
+
+def neighbourhood(
+    lat: float, lon: float, lat_degrees: float, lon_degrees: float
+) -> set[str]:
+    """Geohash prefixes of the cells holding every point within
+    `lat_degrees` and `lon_degrees` of a point"""
+    precision = precision_for(lat_degrees, lon_degrees)
+    height, width = cell_size(precision)
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        cell_lat = max(-90.0, min(90.0, lat + lat_step * height))
+        for lon_step in (-1, 0, 1):
+            cell_lon = (lon + lon_step * width + 180) % 360 - 180
+            cells.add(encode(cell_lat, cell_lon, precision))
+    return cells
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance between two points in meters"""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+def meters_to_degrees(meters: float, lat: float) -> tuple[float, float]:
+    """Degrees of latitude and longitude spanning `meters` around `lat`"""
+    lat_degrees = meters / METERS_PER_DEGREE
+    # Longitude lines meet at the poles, so cap how wide a span can get
+    lon_degrees = lat_degrees / max(math.cos(math.radians(lat)), 0.01)
+    return lat_degrees, min(lon_degrees, 180.0)
@@ -1,5 +1,6 @@
 import pytest
 import logging
+from unittest.mock import patch
 
 from locations.models import GeoLocation
 
@@ -88,3 +89,27 @@ def test_has_not_moved():
         lat=lat + 0.00009, lon=lon - 0.00009, altitude=60
     )[0]
     assert not loc.has_moved(past)
+
+
+@pytest.mark.django_db
+def test_in_proximity_across_geohash_cells():
+    # Either side of the prime meridian, so no geohash prefix is shared
+    loc = GeoLocation.objects.create(lat=51.4779, lon=-0.00005, altitude=10)
+    close = GeoLocation.objects.create(lat=51.4779, lon=0.00004, altitude=10)
+    assert loc.geohash[0] != close.geohash[0]
+    assert close in loc.in_proximity()
+
+
+@pytest.mark.django_db
+def test_in_proximity_by_distance():
+    lat = 44.234
+    lon = -69.234
+    loc = GeoLocation.objects.create(lat=lat, lon=lon, altitude=60)
+    # Around 40 and 160 meters east
+    close = GeoLocation.objects.create(lat=lat, lon=lon + 0.0005, altitude=60)
+    far = GeoLocation.objects.create(lat=lat, lon=lon + 0.002, altitude=60)
+
+    with patch("locations.models.GEOLOC_PROXIMITY_METERS", "50"):
+        assert list(loc.in_proximity()) == [close]
+        assert not close.has_moved(loc)
+        assert far.has_moved(loc)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from locations.tracks import GPSPoint, find_stays, parse_track
+
+START = datetime(2024, 5, 1, 8, 0, tzinfo=pytz.utc)
+
+
+def walk(places):
+    """A point a minute at each (lat, lon)"""
+    return [
+        GPSPoint(timestamp=START + timedelta(minutes=i), lat=lat, lon=lon)
+        for i, (lat, lon) in enumerate(places)
+    ]
+
+
+def test_find_stays_skips_jitter_and_travel():
+    home = (44.23400, -69.23400)
+    work = (44.25000, -69.25000)
+    points = walk(
+        [home] * 5
+        + [(44.23500, -69.23400)]  # A single stray fix
+        + [home] * 3
+        + [(44.240, -69.240), (44.244, -69.244), (44.247, -69.247)]
+        + [work] * 4
+    )
+
+    stays = list(find_stays(points, min_points=3))
+
+    # The stray fix is kept as a ping of the stay it strayed from
+    assert [(stay.point.lat, len(stay.pings)) for stay in stays] == [
+        (home[0], 9),
+        (work[0], 4),
+    ]
+    assert stays[0].end == START + timedelta(minutes=8)
+    assert stays[1].start == START + timedelta(minutes=12)
+
+
+def test_find_stays_carries_on_current_location():
+    current = GPSPoint(timestamp=START, lat=44.234, lon=-69.234)
+    points = walk([(44.23401, -69.23401)] * 3)
+
+    stays = list(find_stays(points, current, min_points=3))
+
+    assert len(stays) == 1
+    assert stays[0].point is current
+    assert len(stays[0].pings) == 3
+
+
+def test_parse_track_formats_agree():
+    gpx = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.0" xmlns="http://www.topografix.com/GPX/1/0">
+<trk><trkseg>
+<trkpt lat="44.234" lon="-69.234"><ele>60.0</ele>
+<time>2024-05-01T08:00:00Z</time><src>gps</src></trkpt>
+<trkpt lat="44.235" lon="-69.235"><ele>61.0</ele>
+<time>2024-05-01T08:01:00Z</time><src>network</src></trkpt>
+</trkseg></trk></gpx>"""
+    csv = (
+        b"time,lat,lon,elevation,accuracy,provider\n"
+        b"2024-05-01T08:00:00Z,44.234,-69.234,60.0,5,gps\n"
+        b"2024-05-01T08:01:00Z,44.235,-69.235,61.0,20,network\n"
+    )
+    json = (
+        b'[{"time": "2024-05-01T08:00:00Z", "lat": 44.234, "lon": -69.234,'
+        b' "alt": 60.0, "prov": "gps"},'
+        b' {"time": "2024-05-01T08:01:00Z", "lat": 44.235, "lon": -69.235,'
+        b' "alt": 61.0, "prov": "network"}]'
+    )
+
+    tracks = [
+        list(parse_track(content, format))
+        for content, format in [(gpx, "gpx"), (csv, "csv"), (json, "json")]
+    ]
+    assert tracks[0] == tracks[1] == tracks[2]
+    assert [point.provider for point in tracks[0]] == ["gps", "network"]
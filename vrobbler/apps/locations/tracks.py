@@ -0,0 +1,187 @@
+"""Read buffered GPS tracks and split them into stays
+
+GPSLogger can upload a whole track at once, as GPX, CSV or a JSON array of
+the points it would otherwise send one request at a time. Points are read
+one at a time and split into stays by `find_stays` in a single pass.
+
+A stay only ends once POINTS_FOR_MOVEMENT_HISTORY points in a row have
+settled somewhere else, more than GEOLOC_PROXIMITY from it. Shorter trips
+away are GPS jitter and count as pings of the stay, and points that never
+settle anywhere are travel between stays.
+"""
+
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+from xml.etree import ElementTree
+
+import pendulum
+import pytz
+from django.conf import settings
+from locations.models import points_apart
+
+logger = logging.getLogger(__name__)
+
+POINTS_FOR_MOVEMENT_HISTORY = int(
+    getattr(settings, "POINTS_FOR_MOVEMENT_HISTORY", 3)
+)
+
+
+@dataclass
+class GPSPoint:
+    timestamp: datetime
+    lat: float
+    lon: float
+    altitude: Optional[float] = None
+    provider: str = ""
+
+
+@dataclass
+class Stay:
+    point: GPSPoint
+    start: datetime
+    end: datetime
+    pings: list[GPSPoint] = field(default_factory=list)
+
+    def add(self, point: GPSPoint) -> None:
+        self.end = max(self.end, point.timestamp)
+        self.pings.append(point)
+
+
+def parse_time(value) -> datetime:
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        value = int(value)
+        # GPSLogger sends milliseconds in some fields and seconds in others
+        if value > 10**11:
+            value = value / 1000
+        return datetime.fromtimestamp(value, tz=pytz.utc)
+    return pendulum.parse(str(value))
+
+
+def point_from_dict(data: dict) -> Optional[GPSPoint]:
+    """A point from the keys GPSLogger uses in its JSON, CSV and webhook
+    payloads, or None if it has no position or time"""
+    time = data.get("time") or data.get("timestamp")
+    if data.get("lat") in [None, ""] or data.get("lon") in [None, ""]:
+        return None
+    if not time:
+        return None
+    altitude = data.get("alt", data.get("elevation", data.get("ele")))
+    return GPSPoint(
+        timestamp=parse_time(time),
+        lat=float(data["lat"]),
+        lon=float(data["lon"]),
+        altitude=float(altitude) if altitude not in [None, ""] else None,
+        provider=data.get("prov") or data.get("provider") or "",
+    )
+
+
+def parse_json(content: bytes) -> Iterator[GPSPoint]:
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = data.get("points", [])
+    for row in data:
+        if point := point_from_dict(row):
+            yield point
+
+
+def parse_csv(content: bytes) -> Iterator[GPSPoint]:
+    rows = csv.DictReader(io.StringIO(content.decode("utf-8-sig")))
+    for row in rows:
+        if point := point_from_dict(row):
+            yield point
+
+
+def parse_gpx(content: bytes) -> Iterator[GPSPoint]:
+    for _, element in ElementTree.iterparse(io.BytesIO(content)):
+        if not element.tag.endswith("trkpt"):
+            continue
+        # Tags come namespaced, so match children on their local names
+        children = {
+            child.tag.rsplit("}", 1)[-1]: child.text for child in element
+        }
+        if point := point_from_dict(
+            {
+                "lat": element.get("lat"),
+                "lon": element.get("lon"),
+                "ele": children.get("ele"),
+                "time": children.get("time"),
+                "prov": children.get("src"),
+            }
+        ):
+            yield point
+        element.clear()
+
+
+TRACK_PARSERS = {"gpx": parse_gpx, "csv": parse_csv, "json": parse_json}
+
+
+def track_format(filename: str = "", content_type: str = "") -> str:
+    """Guess a track's format from its file name or content type"""
+    extension = filename.rsplit(".", 1)[-1].lower() if filename else ""
+    if extension in TRACK_PARSERS:
+        return extension
+    if "gpx" in content_type or "xml" in content_type:
+        return "gpx"
+    if "csv" in content_type:
+        return "csv"
+    return "json"
+
+
+def parse_track(content: bytes, format: str = "json") -> Iterator[GPSPoint]:
+    return TRACK_PARSERS[format](content)
+
+
+def find_stays(
+    points: Iterable[GPSPoint],
+    current: Optional[GPSPoint] = None,
+    min_points: int = POINTS_FOR_MOVEMENT_HISTORY,
+) -> Iterator[Stay]:
+    """Split time ordered points into the places they stayed at
+
+    `current` is where the user was last known to be. Points still there
+    carry on that stay, which comes out first. The last stay is where the
+    track ends, and may still be going.
+    """
+    stay = None
+    if current:
+        stay = Stay(current, start=current.timestamp, end=current.timestamp)
+    pending = []
+    last_timestamp = None
+
+    for point in points:
+        if last_timestamp and point.timestamp < last_timestamp:
+            logger.info(
+                "[find_stays] skipping out of order point",
+                extra={"timestamp": point.timestamp},
+            )
+            continue
+        last_timestamp = point.timestamp
+
+        if stay and not points_apart(stay.point, point):
+            # Points that strayed and came back were only jitter
+            for jitter in pending:
+                stay.add(jitter)
+            stay.add(point)
+            pending = []
+            continue
+
+        if pending and points_apart(pending[0], point):
+            # Still on the move
+            pending = []
+        pending.append(point)
+        if len(pending) >= min_points:
+            if stay:
+                yield stay
+            start = pending[0].timestamp
+            stay = Stay(pending[0], start=start, end=start)
+            for settled in pending:
+                stay.add(settled)
+            pending = []
+
+    if stay:
+        yield stay
@@ -1,10 +1,11 @@
 from datetime import datetime, timedelta
 
 from django.apps import apps
-from django.db.models import Count, Q, QuerySet
+from django.db.models import Q, Sum
 from django.utils import timezone
 from profiles.utils import now_user_timezone
-from scrobbles.models import Scrobble
+from scrobbles.models import Scrobble, ScrobbleRollup
+from scrobbles.rollups import chart_from_rollups
 from videos.models import Video
 
 
@@ -16,35 +17,32 @@ def scrobble_counts(user=None):
         now = now_user_timezone(user.profile)
         user_filter = Q(user=user)
 
-    start_of_today = datetime.combine(
-        now.date(), datetime.min.time(), now.tzinfo
-    )
+    start_of_today = now.date()
     starting_day_of_current_week = now.date() - timedelta(
         days=now.today().isoweekday() % 7
     )
     starting_day_of_current_month = now.date().replace(day=1)
     starting_day_of_current_year = now.date().replace(month=1, day=1)
 
-    finished_scrobbles_qs = Scrobble.objects.filter(
-        user_filter,
-        played_to_completion=True,
-        media_type=Scrobble.MediaType.TRACK,
+    data = ScrobbleRollup.objects.filter(
+        user_filter, media_type=Scrobble.MediaType.TRACK
+    ).aggregate(
+        today=Sum("play_count", filter=Q(local_date__gte=start_of_today)),
+        week=Sum(
+            "play_count",
+            filter=Q(local_date__gte=starting_day_of_current_week),
+        ),
+        month=Sum(
+            "play_count",
+            filter=Q(local_date__gte=starting_day_of_current_month),
+        ),
+        year=Sum(
+            "play_count",
+            filter=Q(local_date__gte=starting_day_of_current_year),
+        ),
+        alltime=Sum("play_count"),
     )
-    data = {}
-    data["today"] = finished_scrobbles_qs.filter(
-        timestamp__gte=start_of_today
-    ).count()
-    data["week"] = finished_scrobbles_qs.filter(
-        timestamp__gte=starting_day_of_current_week
-    ).count()
-    data["month"] = finished_scrobbles_qs.filter(
-        timestamp__gte=starting_day_of_current_month
-    ).count()
-    data["year"] = finished_scrobbles_qs.filter(
-        timestamp__gte=starting_day_of_current_year
-    ).count()
-    data["alltime"] = finished_scrobbles_qs.count()
-    return data
+    return {key: count or 0 for key, count in data.items()}
 
 
 def week_of_scrobbles(
@@ -58,98 +56,78 @@ def week_of_scrobbles(
         user_filter = Q(user=user)
 
     if not start:
-        start = datetime.combine(now.date(), datetime.min.time(), now.tzinfo)
-
-    scrobble_day_dict = {}
-    base_qs = Scrobble.objects.filter(user_filter, played_to_completion=True)
+        start = now.date()
+    if isinstance(start, datetime):
+        start = start.date()
 
-    media_filter = Q(track__isnull=False)
+    media_filter = Q(media_type=Scrobble.MediaType.TRACK)
     if media == "movies":
-        media_filter = Q(video__video_type=Video.VideoType.MOVIE)
+        media_filter = Q(
+            media_type=Scrobble.MediaType.VIDEO,
+            media_id__in=Video.objects.filter(
+                video_type=Video.VideoType.MOVIE
+            ).values("id"),
+        )
     if media == "series":
-        media_filter = Q(video__video_type=Video.VideoType.TV_EPISODE)
+        media_filter = Q(
+            media_type=Scrobble.MediaType.VIDEO,
+            media_id__in=Video.objects.filter(
+                video_type=Video.VideoType.TV_EPISODE
+            ).values("id"),
+        )
+
+    day_counts = dict(
+        ScrobbleRollup.objects.filter(
+            user_filter,
+            media_filter,
+            local_date__gte=start - timedelta(days=6),
+            local_date__lte=start,
+        )
+        .values("local_date")
+        .annotate(count=Sum("play_count"))
+        .values_list("local_date", "count")
+    )
 
+    scrobble_day_dict = {}
     for day in range(6, -1, -1):
         start_day = start - timedelta(days=day)
-        end = datetime.combine(start_day, datetime.max.time(), now.tzinfo)
         day_of_week = start_day.strftime("%A")
-
-        scrobble_day_dict[day_of_week] = base_qs.filter(
-            media_filter,
-            timestamp__gte=start_day,
-            timestamp__lte=end,
-            played_to_completion=True,
-        ).count()
+        scrobble_day_dict[day_of_week] = day_counts.get(start_day, 0)
 
     return scrobble_day_dict
 
 
+def chart_period_starts(now: datetime) -> dict:
+    """The first local date of each live chart period, None for all time"""
+    today = now.date()
+    return {
+        "today": today,
+        "week": today - timedelta(days=now.today().isoweekday() % 7),
+        "last7": today - timedelta(days=7),
+        "last30": today - timedelta(days=30),
+        "month": today.replace(day=1),
+        "year": today.replace(month=1, day=1),
+        "all": None,
+    }
+
+
 def live_charts(
     user: "User",
     media_type: str = "Track",
     chart_period: str = "all",
     limit: int = 15,
-) -> QuerySet:
+) -> list:
     now = timezone.now()
-    tzinfo = now.tzinfo
-    now = now.date()
     if user.is_authenticated:
         now = now_user_timezone(user.profile)
-        tzinfo = now.tzinfo
-
-    seven_days_ago = now - timedelta(days=7)
-    thirty_days_ago = now - timedelta(days=30)
-    start_of_today = datetime.combine(now, datetime.min.time(), tzinfo)
-    start_day_of_week = start_of_today - timedelta(
-        days=now.today().isoweekday() % 7
-    )
-    start_day_of_month = now.replace(day=1)
-    start_day_of_year = now.replace(month=1, day=1)
+    period_starts = chart_period_starts(now)
 
     media_model = apps.get_model(app_label="music", model_name=media_type)
+    rollups = ScrobbleRollup.objects.filter(user=user, media_type=media_type)
+    if period_starts[chart_period]:
+        rollups = rollups.filter(local_date__gte=period_starts[chart_period])
 
-    period_queries = {
-        "today": {"scrobble__timestamp__gte": start_of_today},
-        "week": {"scrobble__timestamp__gte": start_day_of_week},
-        "last7": {"scrobble__timestamp__gte": seven_days_ago},
-        "last30": {"scrobble__timestamp__gte": thirty_days_ago},
-        "month": {"scrobble__timestamp__gte": start_day_of_month},
-        "year": {"scrobble__timestamp__gte": start_day_of_year},
-        "all": {},
-    }
-
-    time_filter = Q()
-    completion_filter = Q(
-        scrobble__user=user, scrobble__played_to_completion=True
-    )
-    user_filter = Q(scrobble__user=user)
-    count_field = "scrobble"
-
-    if media_type == "Artist":
-        for period, query_dict in period_queries.items():
-            period_queries[period] = {
-                "track__" + k: v for k, v in query_dict.items()
-            }
-        completion_filter = Q(
-            track__scrobble__user=user,
-            track__scrobble__played_to_completion=True,
-        )
-        count_field = "track__scrobble"
-        user_filter = Q(track__scrobble__user=user)
-
-    time_filter = Q(**period_queries[chart_period])
-
-    return (
-        media_model.objects.filter(user_filter, time_filter)
-        .annotate(
-            num_scrobbles=Count(
-                count_field,
-                filter=completion_filter,
-                distinct=True,
-            )
-        )
-        .order_by("-num_scrobbles")[:limit]
-    )
+    return chart_from_rollups(rollups, media_model, limit=limit)
 
 
 def artist_scrobble_count(artist_id: int, filter: str = "today") -> int:
@@ -1,8 +1,9 @@
 import urllib
 from typing import Optional
 from bs4 import BeautifulSoup
-import requests
 import logging
+from scrobbles import http_client
+from scrobbles.lookup_cache import LookupUnavailable, cached_lookup
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +36,13 @@ def get_review_from_soup(soup) -> str:
     return review
 
 
+@cached_lookup("allmusic-page")
 def scrape_data_from_allmusic(url) -> dict:
     data_dict = {}
-    headers = {"User-Agent": "Vrobbler 0.11.12"}
-    r = requests.get(url, headers=headers)
+    r = http_client.get(url, provider="allmusic")
+    if r.status_code not in [200, 404]:
+        logger.info(f"Bad http response from Allmusic {r}")
+        raise LookupUnavailable(data_dict)
     if r.status_code == 200:
         soup = BeautifulSoup(r.text, "html.parser")
         data_dict["rating"] = get_rating_from_soup(soup)
@@ -46,6 +50,7 @@ def scrape_data_from_allmusic(url) -> dict:
     return data_dict
 
 
+@cached_lookup("allmusic-slug", names=["artist_name", "album_name"])
 def get_allmusic_slug(artist_name=None, album_name=None) -> str:
     slug = ""
     if not artist_name:
@@ -60,12 +65,11 @@ def get_allmusic_slug(artist_name=None, album_name=None) -> str:
         query = "+".join([query, urllib.parse.quote(album_name)])
 
     url = ALLMUSIC_SEARCH_URL.format(subpath=subpath, query=query)
-    headers = {"User-Agent": "Vrobbler 0.11.12"}
-    r = requests.get(url, headers=headers)
+    r = http_client.get(url, provider="allmusic")
 
     if r.status_code != 200:
         logger.info(f"Bad http response from Allmusic {r}")
-        return slug
+        raise LookupUnavailable(slug)
 
     soup = BeautifulSoup(r.text, "html.parser")
     results = soup.find("ul", class_="search-results")
@@ -1,13 +1,15 @@
 import logging
 import urllib
 
-import requests
 from bs4 import BeautifulSoup
+from scrobbles import http_client
+from scrobbles.lookup_cache import LookupUnavailable, cached_lookup
 
 logger = logging.getLogger(__name__)
 BANDCAMP_SEARCH_URL = "https://bandcamp.com/search?q={query}&item_type={itype}"
 
 
+@cached_lookup("bandcamp-slug", names=["artist_name", "album_name"])
 def get_bandcamp_slug(artist_name=None, album_name=None) -> str:
     slug = ""
     if not artist_name:
@@ -21,12 +23,11 @@ def get_bandcamp_slug(artist_name=None, album_name=None) -> str:
         query = "+".join([query, urllib.parse.quote(album_name)])
 
     url = BANDCAMP_SEARCH_URL.format(query=query, itype=item_type)
-    headers = {"User-Agent": "Vrobbler 0.11.12"}
-    r = requests.get(url, headers=headers)
+    r = http_client.get(url, provider="bandcamp")
 
     if r.status_code != 200:
         logger.info(f"Bad http response from Bandcamp {r}")
-        return slug
+        raise LookupUnavailable(slug)
 
     soup = BeautifulSoup(r.text, "html.parser")
 
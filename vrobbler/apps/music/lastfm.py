@@ -1,19 +1,24 @@
+import bisect
 import logging
 import time
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
 
 import pylast
 import pytz
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from music.utils import (
-    get_or_create_album,
-    get_or_create_artist,
-    get_or_create_track,
-)
+from music.utils import bulk_get_or_create_tracks, track_dict_key
+from scrobbles.lookup_cache import LookupUnavailable, cached_lookup
+from scrobbles.utils import get_existing_track_scrobbles
 
 logger = logging.getLogger(__name__)
 
+# Last.fm's default page size for recent tracks
+LASTFM_PAGE_SIZE = 50
+
 PYLAST_ERRORS = tuple(
     getattr(pylast, exc_name)
     for exc_name in (
@@ -26,6 +31,30 @@ PYLAST_ERRORS = tuple(
 )
 
 
+@cached_lookup("lastfm-track", names=["artist", "title"])
+def lookup_track_info_from_lastfm(artist: str, title: str) -> dict:
+    """Look up the run time and MusicBrainz id Last.fm has for a track"""
+    network = pylast.LastFMNetwork(api_key=getattr(settings, "LASTFM_API_KEY"))
+    track = network.get_track(artist, title)
+    track_info = {}
+    try:
+        duration = track.get_duration()
+        if duration:
+            track_info["run_time_seconds"] = int(duration / 1000)
+        track_info["mbid"] = track.get_mbid()
+    except PYLAST_ERRORS as e:
+        logger.warning(
+            "[lookup_track_info_from_lastfm] LastFM barfed looking up track",
+            extra={"artist": artist, "title": title, "error": str(e)},
+        )
+        # Only "Track not found" is an answer, anything else is worth
+        # asking again
+        status = str(getattr(e, "status", ""))
+        if status != str(pylast.STATUS_INVALID_PARAMS):
+            raise LookupUnavailable(track_info)
+    return track_info
+
+
 class LastFM:
     def __init__(self, user):
         try:
@@ -37,31 +66,73 @@ class LastFM:
             )
             self.user = self.client.get_user(user.profile.lastfm_username)
             self.vrobbler_user = user
+            self.track_info = {}
         except PYLAST_ERRORS as e:
             logger.error(f"Error during Last.fm setup: {e}")
 
-    def import_from_lastfm(self, last_processed=None):
-        """Given a last processed time, import all scrobbles from LastFM since then"""
+    def import_from_lastfm(
+        self,
+        since_uts: Optional[int] = None,
+        on_page: Optional[Callable] = None,
+    ) -> int:
+        """Stream scrobbles newer than the `since_uts` cursor from Last.fm,
+        writing them a page at a time
+
+        `on_page(created_scrobbles, newest_uts)` is called inside each
+        page's transaction, so a cursor saved there matches what was
+        written. Returns the number of scrobbles created.
+        """
+        created_count = 0
+        page = []
+        for lfm_scrobble in self.get_last_scrobbles(time_from=since_uts):
+            page.append(lfm_scrobble)
+            if len(page) >= LASTFM_PAGE_SIZE:
+                created_count += self.import_page(page, on_page)
+                page = []
+        if page:
+            created_count += self.import_page(page, on_page)
+
+        logger.info(
+            f"Created {created_count} scrobbles",
+            extra={"user_id": self.vrobbler_user.id, "since_uts": since_uts},
+        )
+        return created_count
+
+    def import_page(
+        self, lastfm_scrobbles: list[dict], on_page: Optional[Callable] = None
+    ) -> int:
         from scrobbles.models import Scrobble
 
         new_scrobbles = []
         source = "Last.fm"
-        lastfm_scrobbles = self.get_last_scrobbles(time_from=last_processed)
-
-        for lfm_scrobble in lastfm_scrobbles:
-            timestamp = lfm_scrobble.pop("timestamp")
+        tracks = bulk_get_or_create_tracks(lastfm_scrobbles)
 
-            artist = get_or_create_artist(lfm_scrobble.pop("artist"))
-            album = get_or_create_album(lfm_scrobble.pop("album"), artist)
+        timezone = settings.TIME_ZONE
+        if self.vrobbler_user.profile:
+            timezone = self.vrobbler_user.profile.timezone
 
-            lfm_scrobble["artist"] = artist
-            if album:
-                lfm_scrobble["album"] = album
-            track = get_or_create_track(**lfm_scrobble)
+        timestamps = [s["timestamp"] for s in lastfm_scrobbles]
+        track_ids = {track.id for track in tracks.values()}
+        existing = get_existing_track_scrobbles(
+            self.vrobbler_user.id, timestamps, track_ids
+        )
+        # Vrobbler scrobbles on finish, LastFM scrobbles on start, so look
+        # for anything created within 20 seconds of the Last.fm timestamp
+        window = timedelta(seconds=20)
+        existing_created = defaultdict(list)
+        for created, track_id in Scrobble.objects.filter(
+            user=self.vrobbler_user,
+            created__gte=min(timestamps) - window,
+            created__lte=max(timestamps) + window,
+            track_id__in=track_ids,
+        ).values_list("created", "track_id"):
+            existing_created[track_id].append(created)
+        for created_times in existing_created.values():
+            created_times.sort()
 
-            timezone = settings.TIME_ZONE
-            if self.vrobbler_user.profile:
-                timezone = self.vrobbler_user.profile.timezone
+        for lfm_scrobble in lastfm_scrobbles:
+            timestamp = lfm_scrobble["timestamp"]
+            track = tracks[track_dict_key(lfm_scrobble)]
 
             new_scrobble = Scrobble(
                 user=self.vrobbler_user,
@@ -73,81 +144,61 @@ class LastFM:
                 in_progress=False,
                 media_type=Scrobble.MediaType.TRACK,
             )
-            # Vrobbler scrobbles on finish, LastFM scrobbles on start
-            seconds_eariler = timestamp - timedelta(seconds=20)
-            seconds_later = timestamp + timedelta(seconds=20)
-            existing = Scrobble.objects.filter(
-                created__gte=seconds_eariler,
-                created__lte=seconds_later,
-                track=track,
-            ).first()
-            if existing:
+            created_times = existing_created[track.id]
+            nearest = bisect.bisect_left(created_times, timestamp - window)
+            if (timestamp, track.id) in existing or (
+                nearest < len(created_times)
+                and created_times[nearest] <= timestamp + window
+            ):
                 logger.debug(f"Skipping existing scrobble {new_scrobble}")
                 continue
+            existing.add((timestamp, track.id))
             logger.debug(f"Queued scrobble {new_scrobble} for creation")
             new_scrobbles.append(new_scrobble)
 
-        created = Scrobble.objects.bulk_create(new_scrobbles)
-        logger.info(
-            f"Created {len(created)} scrobbles",
-            extra={"created_scrobbles": created},
-        )
-        return created
-
-    def get_last_scrobbles(self, time_from=None, time_to=None):
-        """Given a user, Last.fm api key, and secret key, grab a list of scrobbled
-        tracks"""
-        lfm_params = {}
-        scrobbles = []
+        newest_uts = max(s["uts"] for s in lastfm_scrobbles)
+        with transaction.atomic():
+            created = Scrobble.objects.bulk_create(new_scrobbles)
+            if on_page:
+                on_page(created, newest_uts)
+        return len(created)
+
+    def get_track_info(self, artist: str, title: str) -> dict:
+        key = (artist, title)
+        if key not in self.track_info:
+            self.track_info[key] = lookup_track_info_from_lastfm(artist, title)
+        return self.track_info[key]
+
+    def get_last_scrobbles(
+        self, time_from: Optional[int] = None, time_to: Optional[int] = None
+    ) -> Iterator[dict]:
+        """Stream a user's scrobbled tracks from Last.fm, newest first,
+        between two unix timestamps"""
+        lfm_params = {"limit": None, "stream": True}
         if time_from:
-            lfm_params["time_from"] = int(time_from.timestamp())
+            # Last.fm includes scrobbles at exactly `from`
+            lfm_params["time_from"] = time_from + 1
         if time_to:
-            lfm_params["time_to"] = int(time_to.timestamp())
-
-        # if not time_from and not time_to:
-        lfm_params["limit"] = None
+            lfm_params["time_to"] = time_to
 
-        found_scrobbles = self.user.get_recent_tracks(**lfm_params)
-        # TOOD spin this out into a celery task over certain threshold of found scrobbles?
-
-        for scrobble in found_scrobbles:
+        for scrobble in self.user.get_recent_tracks(**lfm_params):
             logger.debug(f"Processing {scrobble}")
-            run_time = None
-            mbid = None
-            artist = None
-
-            try:
-                run_time = int(scrobble.track.get_duration() / 1000)
-                mbid = scrobble.track.get_mbid()
-                artist = scrobble.track.get_artist().name
-            except pylast.MalformedResponseError as e:
-                logger.warn(e)
-            except pylast.WSError as e:
-                logger.warn(
-                    "LastFM barfed trying to get the track for {scrobble.track}"
-                )
-            except pylast.NetworkError as e:
-                logger.warn(
-                    "LastFM barfed trying to get the track for {scrobble.track}"
-                )
-
-            if not artist:
+            artist = scrobble.track.get_artist()
+            if not artist or not artist.name:
                 logger.warn(f"Silly LastFM, no artist found for {scrobble}")
                 continue
 
-            timestamp = datetime.utcfromtimestamp(
-                int(scrobble.timestamp)
-            ).replace(tzinfo=pytz.utc)
-
-            logger.info(f"{artist},{scrobble.track.title},{timestamp}")
-            scrobbles.append(
-                {
-                    "artist": artist,
-                    "album": scrobble.album,
-                    "title": scrobble.track.title,
-                    "mbid": mbid,
-                    "run_time_seconds": run_time,
-                    "timestamp": timestamp,
-                }
-            )
-        return scrobbles
+            uts = int(scrobble.timestamp)
+            timestamp = datetime.utcfromtimestamp(uts).replace(tzinfo=pytz.utc)
+            track_info = self.get_track_info(artist.name, scrobble.track.title)
+
+            logger.info(f"{artist.name},{scrobble.track.title},{timestamp}")
+            yield {
+                "artist": artist.name,
+                "album": scrobble.album,
+                "title": scrobble.track.title,
+                "mbid": track_info.get("mbid"),
+                "run_time_seconds": track_info.get("run_time_seconds"),
+                "timestamp": timestamp,
+                "uts": uts,
+            }
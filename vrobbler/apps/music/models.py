@@ -16,6 +16,7 @@ from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFit
 from music.allmusic import get_allmusic_slug, scrape_data_from_allmusic
 from music.bandcamp import get_bandcamp_slug
+from music.musicbrainz import lookup_release_from_mb
 from music.theaudiodb import lookup_album_from_tadb, lookup_artist_from_tadb
 from scrobbles.mixins import ScrobblableMixin
 
@@ -281,10 +282,7 @@ class Album(TimeStampedModel):
             or not self.year
             or not self.musicbrainz_releasegroup_id
         ):
-            musicbrainzngs.set_useragent("vrobbler", "0.3.0")
-            mb_data = musicbrainzngs.get_release_by_id(
-                self.musicbrainz_id, includes=["artists", "release-groups"]
-            )
+            mb_data = lookup_release_from_mb(self.musicbrainz_id)
             if not self.musicbrainz_releasegroup_id:
                 self.musicbrainz_releasegroup_id = mb_data["release"][
                     "release-group"
@@ -3,14 +3,22 @@ from typing import Iterable
 
 import musicbrainzngs
 from dateutil.parser import parse
+from scrobbles.http_client import PROVIDER_RATE_LIMITS
+from scrobbles.lookup_cache import cached_lookup
 
 logger = logging.getLogger(__name__)
 
+# musicbrainzngs makes its own requests, and its rate limit holds across
+# threads, so set it up once to match ours
+MB_RATE, MB_BURST = PROVIDER_RATE_LIMITS["musicbrainz"]
+musicbrainzngs.set_useragent("vrobbler", "0.3.0")
+musicbrainzngs.set_rate_limit(MB_BURST / MB_RATE, MB_BURST)
 
+
+@cached_lookup("musicbrainz-album")
 def lookup_album_from_mb(musicbrainz_id: str) -> dict:
     release_dict = {}
 
-    musicbrainzngs.set_useragent("vrobbler", "0.3.0")
     release_data = musicbrainzngs.get_release_by_id(
         musicbrainz_id,
         includes=["artists", "release-groups", "recordings"],
@@ -50,9 +58,10 @@ def lookup_album_from_mb(musicbrainz_id: str) -> dict:
     return release_dict
 
 
+@cached_lookup(
+    "musicbrainz-album-search", names=["release_name", "artist_name"]
+)
 def lookup_album_dict_from_mb(release_name: str, artist_name: str) -> dict:
-    musicbrainzngs.set_useragent("vrobbler", "0.3.0")
-
     top_result = {}
 
     try:
@@ -83,9 +92,8 @@ def lookup_album_dict_from_mb(release_name: str, artist_name: str) -> dict:
     }
 
 
+@cached_lookup("musicbrainz-artist-search", names=["artist_name"])
 def lookup_artist_from_mb(artist_name: str) -> dict:
-    musicbrainzngs.set_useragent("vrobbler", "0.3.0")
-
     try:
         top_result = musicbrainzngs.search_artists(artist=artist_name)[
             "artist-list"
@@ -103,6 +111,7 @@ def lookup_artist_from_mb(artist_name: str) -> dict:
     return top_result
 
 
+@cached_lookup("musicbrainz-track-search", names=["track_name"])
 def lookup_track_from_mb(
     track_name: str, artist_mb_id: str, album_mb_id: str
 ) -> dict:
@@ -114,8 +123,6 @@ def lookup_track_from_mb(
             "album_mb_id": album_mb_id,
         },
     )
-    musicbrainzngs.set_useragent("vrobbler", "0.3.0")
-
     try:
         results = musicbrainzngs.search_recordings(
             query=track_name, artist=artist_mb_id, release=album_mb_id
@@ -138,3 +145,10 @@ def lookup_track_from_mb(
         return {}
 
     return top_result
+
+
+@cached_lookup("musicbrainz-release")
+def lookup_release_from_mb(musicbrainz_id: str) -> dict:
+    return musicbrainzngs.get_release_by_id(
+        musicbrainz_id, includes=["artists", "release-groups"]
+    )
@@ -2,8 +2,9 @@ import urllib
 import json
 import logging
 
-import requests
 from django.conf import settings
+from scrobbles import http_client
+from scrobbles.lookup_cache import LookupUnavailable, cached_lookup
 
 THEAUDIODB_API_KEY = getattr(settings, "THEAUDIODB_API_KEY")
 ARTIST_SEARCH_URL = f"https://www.theaudiodb.com/api/v1/json/{THEAUDIODB_API_KEY}/search.php?s="
@@ -13,6 +14,7 @@ ALBUM_SEARCH_URL = f"https://www.theaudiodb.com/api/v1/json/{THEAUDIODB_API_KEY}
 logger = logging.getLogger(__name__)
 
 
+@cached_lookup("theaudiodb-artist", names=["name_or_id"])
 def lookup_artist_from_tadb(name_or_id: str) -> dict:
     artist_info = {}
     response = None
@@ -24,27 +26,31 @@ def lookup_artist_from_tadb(name_or_id: str) -> dict:
         tadb_id = None
 
     if tadb_id:
-        response = requests.get(ARTIST_FETCH_URL + str(tadb_id))
+        response = http_client.get(
+            ARTIST_FETCH_URL + str(tadb_id), provider="theaudiodb"
+        )
 
         if response.status_code != 200:
             logger.warn(f"Bad response from TADB: {response.status_code}")
-            return artist_info
+            raise LookupUnavailable(artist_info)
 
         if not response.content:
             logger.warn(f"Bad content from TADB: {response.content}")
-            return artist_info
+            raise LookupUnavailable(artist_info)
 
     if not response:
         name = urllib.parse.quote(name_or_id)
-        response = requests.get(ARTIST_SEARCH_URL + name)
+        response = http_client.get(
+            ARTIST_SEARCH_URL + name, provider="theaudiodb"
+        )
 
     if response.status_code != 200:
         logger.warn(f"Bad response from TADB: {response.status_code}")
-        return artist_info
+        raise LookupUnavailable(artist_info)
 
     if not response.content:
         logger.warn(f"Bad content from TADB: {response.content}")
-        return artist_info
+        raise LookupUnavailable(artist_info)
 
     if '{"artists": null}' in str(response.content):
         logger.warn(f"Bad content from TADB: {response.content}")
@@ -62,19 +68,23 @@ def lookup_artist_from_tadb(name_or_id: str) -> dict:
     return artist_info
 
 
+@cached_lookup("theaudiodb-album", names=["name", "artist"])
 def lookup_album_from_tadb(name: str, artist: str) -> dict:
     album_info = {}
     artist = urllib.parse.quote(artist)
     name = urllib.parse.quote(name)
-    response = requests.get("".join([ALBUM_SEARCH_URL, artist, "&a=", name]))
+    response = http_client.get(
+        "".join([ALBUM_SEARCH_URL, artist, "&a=", name]),
+        provider="theaudiodb",
+    )
 
     if response.status_code != 200:
         logger.warn(f"Bad response from TADB: {response.status_code}")
-        return {}
+        raise LookupUnavailable({})
 
     if not response.content:
         logger.warn(f"Bad content from TADB: {response.content}")
-        return {}
+        raise LookupUnavailable({})
 
     results = json.loads(response.content)
     if results["album"]:
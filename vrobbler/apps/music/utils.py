@@ -1,6 +1,6 @@
 import logging
 import re
-from typing import Optional
+from typing import Iterable, Optional
 
 from music.musicbrainz import (
     lookup_album_dict_from_mb,
@@ -16,15 +16,19 @@ logger = logging.getLogger(__name__)
 from music.models import Album, Artist, Track
 
 
-def get_or_create_artist(name: str, mbid: str = None) -> Artist:
-    artist = None
-
+def clean_artist_name(name: str) -> str:
     if "feat." in name.lower():
         name = re.split("feat.", name, flags=re.IGNORECASE)[0].strip()
     if "featuring" in name.lower():
         name = re.split("featuring", name, flags=re.IGNORECASE)[0].strip()
     if "&" in name.lower():
         name = re.split("&", name, flags=re.IGNORECASE)[0].strip()
+    return name
+
+
+def get_or_create_artist(name: str, mbid: str = None) -> Artist:
+    artist = None
+    name = clean_artist_name(name)
 
     artist_dict = lookup_artist_from_mb(name)
     mbid = mbid or artist_dict.get("id", None)
@@ -142,6 +146,140 @@ def get_or_create_track(post_data: dict, post_keys: dict) -> Track:
     return track
 
 
+def track_dict_key(track_dict: dict) -> tuple:
+    """Key a track dict by the fields `bulk_get_or_create_tracks` uses"""
+    album = track_dict.get("album") or ""
+    if not isinstance(album, str):
+        # Last.fm hands us pylast Album objects
+        album = album.title
+    return (
+        track_dict.get("artist") or "",
+        album,
+        track_dict.get("title") or "",
+        track_dict.get("mbid") or "",
+    )
+
+
+def bulk_get_or_create_tracks(track_dicts: Iterable[dict]) -> dict:
+    """Resolve many track dicts with artist, album, title, mbid and
+    run_time_seconds keys into Tracks, keyed by `track_dict_key`
+
+    Distinct artists, albums and tracks are matched against the database
+    with a few `__in` queries, and only the ones we've never seen go through
+    the remote lookups in `get_or_create_artist` and friends.
+    """
+    track_dicts = {track_dict_key(d): d for d in track_dicts}
+    if not track_dicts:
+        return {}
+
+    artist_names = {clean_artist_name(key[0]) for key in track_dicts}
+    artists = {}
+    for artist in Artist.objects.filter(name__in=artist_names).order_by("-id"):
+        artists[artist.name] = artist
+    for name in artist_names - artists.keys():
+        artists[name] = get_or_create_artist(name)
+
+    album_keys = {
+        (key[1], artists[clean_artist_name(key[0])].id)
+        for key in track_dicts
+        if key[1]
+    }
+    albums = {}
+    for album_artist in (
+        Album.artists.through.objects.filter(
+            album__name__in={name for name, _ in album_keys},
+            artist_id__in={artist_id for _, artist_id in album_keys},
+        )
+        .select_related("album")
+        .order_by("-album_id")
+    ):
+        albums[(album_artist.album.name, album_artist.artist_id)] = (
+            album_artist.album
+        )
+    artists_by_id = {artist.id: artist for artist in artists.values()}
+    for name, artist_id in album_keys - albums.keys():
+        try:
+            albums[(name, artist_id)] = get_or_create_album(
+                name, artists_by_id[artist_id]
+            )
+        except KeyError:
+            # MusicBrainz doesn't know the album either
+            logger.warning(
+                "[bulk_get_or_create_tracks] no album found",
+                extra={"album_name": name, "artist_id": artist_id},
+            )
+            albums[(name, artist_id)] = None
+
+    resolved = {}
+    for key, track_dict in track_dicts.items():
+        artist = artists[clean_artist_name(key[0])]
+        resolved[key] = {
+            "artist": artist,
+            "album": albums.get((key[1], artist.id)),
+            "title": key[2],
+            "mbid": key[3],
+            "run_time_seconds": track_dict.get("run_time_seconds"),
+        }
+
+    tracks_by_mbid = {}
+    for track in Track.objects.filter(
+        musicbrainz_id__in={key[3] for key in track_dicts if key[3]}
+    ).order_by("-id"):
+        tracks_by_mbid[track.musicbrainz_id] = track
+    tracks_by_title = {}
+    for track in Track.objects.filter(
+        title__in={key[2] for key in track_dicts},
+        artist_id__in=artists_by_id.keys(),
+    ).order_by("-id"):
+        tracks_by_title[(track.title, track.artist_id, track.album_id)] = track
+
+    tracks = {}
+    for key, data in resolved.items():
+        album = data["album"]
+        title_key = (data["title"], data["artist"].id, album and album.id)
+        track = tracks_by_mbid.get(data["mbid"]) or tracks_by_title.get(
+            title_key
+        )
+
+        if not track and not data["mbid"] and album:
+            try:
+                data["mbid"] = lookup_track_from_mb(
+                    data["title"],
+                    data["artist"].musicbrainz_id,
+                    album.musicbrainz_id,
+                ).get("id", "")
+            except TypeError:
+                pass
+            track = tracks_by_mbid.get(data["mbid"])
+            if not track and data["mbid"]:
+                track = Track.objects.filter(
+                    musicbrainz_id=data["mbid"]
+                ).first()
+
+        if not track:
+            track = Track.objects.create(
+                title=data["title"],
+                artist=data["artist"],
+                album=album,
+                musicbrainz_id=data["mbid"] or None,
+                run_time_seconds=data["run_time_seconds"],
+            )
+        if track.musicbrainz_id:
+            tracks_by_mbid[track.musicbrainz_id] = track
+        tracks_by_title[title_key] = track
+        tracks[key] = track
+
+    logger.info(
+        "[bulk_get_or_create_tracks] resolved tracks",
+        extra={
+            "tracks": len(tracks),
+            "artists": len(artists),
+            "albums": len(albums),
+        },
+    )
+    return tracks
+
+
 def get_or_create_various_artists():
     artist = Artist.objects.filter(name="Various Artists").first()
     if not artist:
@@ -1,6 +1,6 @@
 from typing import Optional
 from bs4 import BeautifulSoup
-import requests
+from scrobbles import http_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -77,9 +77,8 @@ def _get_img_url_from_soup(soup) -> str:
 
 def scrape_data_from_google_podcasts(title) -> dict:
     data_dict = {}
-    headers = {"User-Agent": "Vrobbler 0.11.12"}
     url = PODCAST_SEARCH_URL.format(query=title)
-    r = requests.get(url, headers=headers)
+    r = http_client.get(url, provider="podcasts")
     if r.status_code == 200:
         soup = BeautifulSoup(r.text, "html.parser")
         data_dict["title"] = _get_title_from_soup(soup)
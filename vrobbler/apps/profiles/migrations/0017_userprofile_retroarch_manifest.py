@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("profiles", "0016_alter_userprofile_timezone"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="retroarch_manifest",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
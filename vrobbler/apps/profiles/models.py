@@ -25,6 +25,8 @@ class UserProfile(TimeStampedModel):
 
     retroarch_path = models.CharField(max_length=255, **BNULL)
     retroarch_auto_import = models.BooleanField(default=False)
+    # Filename to [mtime_ns, size] of each lrtl file already imported
+    retroarch_manifest = models.JSONField(**BNULL)
 
     archivebox_username = models.CharField(max_length=255, **BNULL)
     archivebox_password = EncryptedField(**BNULL)
@@ -3,10 +3,12 @@ from django.contrib import admin
 from scrobbles.models import (
     AudioScrobblerTSVImport,
     ChartRecord,
+    ImportItem,
     KoReaderImport,
     LastFmImport,
     RetroarchImport,
     Scrobble,
+    WebhookInbox,
 )
 from scrobbles.mixins import Genre
 
@@ -67,6 +69,35 @@ class RetroarchImportAdmin(ImportBaseAdmin):
     ...
 
 
+@admin.register(ImportItem)
+class ImportItemAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "import_type",
+        "import_id",
+        "scrobble_id",
+        "status",
+    )
+    list_filter = ("import_type", "status")
+    ordering = ("-id",)
+
+
+@admin.register(WebhookInbox)
+class WebhookInboxAdmin(admin.ModelAdmin):
+    date_hierarchy = "created"
+    list_display = (
+        "id",
+        "source",
+        "user",
+        "status",
+        "created",
+        "processed_at",
+    )
+    list_filter = ("source", "status")
+    raw_id_fields = ("user",)
+    ordering = ("-id",)
+
+
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
     list_display = (
@@ -133,3 +164,6 @@ class ScrobbleAdmin(admin.ModelAdmin):
 
     def playback_percent(self, obj):
         return obj.percent_played
+
+    def delete_queryset(self, request, queryset):
+        queryset.delete_with_rollups()
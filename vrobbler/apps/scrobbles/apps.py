@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ScrobblesConfig(AppConfig):
     name = "scrobbles"
+
+    def ready(self):
+        import scrobbles.signals
@@ -0,0 +1,172 @@
+"""A cache of each user's live charts
+
+The chart page shows top tracks and artists over a handful of periods. Each
+chart is cached under its (user, media type, period, window start) and built
+by the `refresh_chart_cache` task, so rendering the page only reads the
+cache. Refreshing a user's rollups queues the charts to be built again,
+and the page keeps showing the cached ones until the new ones replace them.
+When tasks run eagerly there's no worker to build them, so the page builds
+missing charts itself instead.
+
+Past charts are ChartRecord rows. When one hasn't been built yet, building
+it is queued as well rather than done while the page waits.
+"""
+
+import logging
+from datetime import date
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from music.aggregators import chart_period_starts, live_charts
+from scrobbles.rollups import get_user_tz
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+CHART_CACHE_TTL = int(getattr(settings, "CHART_CACHE_TTL", 60 * 60 * 24 * 2))
+# Long enough to cover a queued build, short enough to retry a lost one
+CHART_BUILD_LOCK_SECONDS = 60 * 5
+
+CHART_MEDIA_TYPES = ["Artist", "Track"]
+# Periods in the order the chart page shows them
+CHART_PERIODS = ["today", "last7", "last30", "year", "all"]
+CHART_LIMIT = 14
+
+
+def get_chart_cache():
+    alias = "charts" if "charts" in settings.CACHES else "default"
+    return caches[alias]
+
+
+def chart_cache_key(
+    user_id: int, media_type: str, period: str, window_start: Optional[date]
+) -> str:
+    start = window_start.isoformat() if window_start else "all"
+    return f"chart:{user_id}:{media_type}:{period}:{start}"
+
+
+def chart_refresh_lock_key(user_id: int) -> str:
+    return f"chart-refresh-lock:{user_id}"
+
+
+def current_window_starts(user_id: int, tz=None) -> dict:
+    now = timezone.now().astimezone(tz or get_user_tz(user_id))
+    starts = chart_period_starts(now)
+    return {period: starts[period] for period in CHART_PERIODS}
+
+
+def current_chart_keys(user_id: int) -> dict[tuple, str]:
+    """Cache keys of a user's current charts by (media type, period)"""
+    return {
+        (media_type, period): chart_cache_key(
+            user_id, media_type, period, window_start
+        )
+        for period, window_start in current_window_starts(user_id).items()
+        for media_type in CHART_MEDIA_TYPES
+    }
+
+
+def get_cached_charts(user_id: int) -> tuple[dict, bool]:
+    """A user's current charts by media type and period, in one cache read
+
+    Charts that aren't cached yet come back empty and get queued to be built,
+    or are built right away when tasks run eagerly. Also returns whether any
+    were missing.
+    """
+    keys = current_chart_keys(user_id)
+    cache = get_chart_cache()
+    cached = cache.get_many(keys.values())
+    if len(cached) < len(keys) and charts_built_inline():
+        build_chart_cache(user_id)
+        cached = cache.get_many(keys.values())
+
+    charts = {media_type: {} for media_type in CHART_MEDIA_TYPES}
+    for (media_type, period), key in keys.items():
+        charts[media_type][period] = cached.get(key, [])
+
+    missing = len(cached) < len(keys)
+    if missing:
+        enqueue_chart_cache_refresh(user_id)
+    return charts, missing
+
+
+def build_chart_cache(user_id: int) -> int:
+    """Build and cache every current chart of a user, returning how many"""
+    user = User.objects.get(id=user_id)
+    charts = {}
+    for (media_type, period), key in current_chart_keys(user_id).items():
+        chart = live_charts(
+            user, media_type=media_type, chart_period=period, limit=CHART_LIMIT
+        )
+        if media_type == "Track":
+            prefetch_related_objects(chart, "artist")
+        charts[key] = chart
+    get_chart_cache().set_many(charts, CHART_CACHE_TTL)
+    logger.info(
+        "[chart_cache] built charts",
+        extra={"user_id": user_id, "charts": len(charts)},
+    )
+    return len(charts)
+
+
+def invalidate_charts(
+    user_id: int, dates: Optional[Iterable[date]] = None, tz=None
+) -> None:
+    """Queue a rebuild of a user's charts if any of their windows hold the
+    given local dates, or always if no dates are given
+
+    The cached charts stay until the rebuild overwrites them, so the page
+    doesn't go blank while it runs.
+    """
+    if dates is not None:
+        dates = set(dates)
+        if not dates:
+            return
+    latest = max(dates) if dates else None
+
+    # Every window runs up to today, so the latest day decides it
+    if latest is not None and all(
+        window_start is not None and latest < window_start
+        for window_start in current_window_starts(user_id, tz).values()
+    ):
+        return
+    if charts_built_inline():
+        # No worker to hand the rebuild to, so leave it to the next chart
+        # page view rather than the request that finished the scrobble
+        get_chart_cache().delete_many(current_chart_keys(user_id).values())
+        return
+    enqueue_chart_cache_refresh(user_id)
+
+
+def charts_built_inline() -> bool:
+    """Whether tasks run eagerly, so a queued chart build would run right
+    away in the request that queued it"""
+    return getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False)
+
+
+def enqueue_chart_cache_refresh(user_id: int) -> None:
+    """Queue a rebuild of a user's charts, unless one is already queued"""
+    from scrobbles.tasks import refresh_chart_cache
+
+    lock_key = chart_refresh_lock_key(user_id)
+    if get_chart_cache().add(lock_key, "queued", CHART_BUILD_LOCK_SECONDS):
+        transaction.on_commit(lambda: refresh_chart_cache.delay(user_id))
+
+
+def enqueue_chart_record_build(user_id: int, model_str: str, **params) -> None:
+    """Queue building a past chart, unless it's already queued"""
+    from scrobbles.tasks import build_chart_records
+
+    period = "-".join(
+        str(params.get(key) or "") for key in ["year", "month", "week", "day"]
+    )
+    lock_key = f"chart-record-build-lock:{user_id}:{model_str}:{period}"
+    if get_chart_cache().add(lock_key, "queued", CHART_BUILD_LOCK_SECONDS):
+        transaction.on_commit(
+            lambda: build_chart_records.delay(user_id, model_str, **params)
+        )
@@ -23,6 +23,23 @@ MEDIA_END_PADDING_SECONDS = {
 
 EXCLUDE_FROM_NOW_PLAYING = ("GeoLocation",)
 
+# Scrobble.media_type -> the Scrobble foreign key holding that media
+MEDIA_TYPE_FOREIGN_KEYS = {
+    "Video": "video",
+    "Track": "track",
+    "PodcastEpisode": "podcast_episode",
+    "SportEvent": "sport_event",
+    "Book": "book",
+    "VideoGame": "video_game",
+    "BoardGame": "board_game",
+    "GeoLocation": "geo_location",
+    "Trail": "trail",
+    "WebPage": "web_page",
+    "LifeEvent": "life_event",
+    "Mood": "mood",
+    "BrickSet": "brickset",
+}
+
 MANUAL_SCROBBLE_FNS = {
     "-v": "manual_scrobble_video_game",
     "-b": "manual_scrobble_book",
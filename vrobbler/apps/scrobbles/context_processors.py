@@ -2,19 +2,21 @@ import pytz
 from django.utils import timezone
 
 from scrobbles.constants import EXCLUDE_FROM_NOW_PLAYING
-from scrobbles.models import Scrobble
+from scrobbles.models import ActiveScrobble, Scrobble
+
 
 def now_playing(request):
     user = request.user
     now = timezone.now()
     if not user.is_authenticated:
         return {}
+    active = ActiveScrobble.objects.filter(user=user, is_paused=False).exclude(
+        media_type__in=EXCLUDE_FROM_NOW_PLAYING,
+    )
     return {
         "now_playing_list": Scrobble.objects.filter(
             in_progress=True,
-            is_paused=False,
             user=user,
-        ).exclude(
-            media_type__in=EXCLUDE_FROM_NOW_PLAYING,
-        )
+            id__in=active.values("scrobble_id"),
+        ).with_media()
     }
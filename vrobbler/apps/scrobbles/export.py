@@ -1,67 +1,334 @@
+"""Stream a user's scrobbles out as a file download
+
+Scrobbles are read in chunks through a server-side cursor and every row is
+written straight into the response, so an export uses the same memory no
+matter how many scrobbles it holds, and never touches the disk.
+"""
+
 import csv
-import tempfile
-from scrobbles.models import Scrobble
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, Optional
 
+import pytz
+from django.conf import settings
 from django.db.models import Q
+from profiles.models import UserProfile
+from scrobbles.constants import MEDIA_TYPE_FOREIGN_KEYS
+from scrobbles.models import Scrobble
 
+EXPORT_CHUNK_SIZE = int(getattr(settings, "EXPORT_CHUNK_SIZE", 2000))
+# Rows are gathered into blocks of about this many bytes before being sent
+EXPORT_BLOCK_SIZE = 64 * 1024
+EXPORT_PARQUET_ROW_GROUP_SIZE = int(
+    getattr(settings, "EXPORT_PARQUET_ROW_GROUP_SIZE", 50000)
+)
 
-def export_scrobbles(start_date=None, end_date=None, format="AS"):
-    start_query = Q()
-    end_query = Q()
-    if start_date:
-        start_query = Q(timestamp__gte=start_date)
+# Format to file extension and content type
+EXPORT_FORMATS = {
+    "as": ("tsv", "text/tab-separated-values"),
+    "csv": ("csv", "text/csv"),
+    "jsonl": ("jsonl", "application/jsonl"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+CSV_COLUMNS = [
+    "timestamp",
+    "stop_timestamp",
+    "media_type",
+    "title",
+    "artist",
+    "album",
+    "run_time_seconds",
+    "playback_position_seconds",
+    "played_to_completion",
+    "source",
+    "musicbrainz_id",
+]
+
+
+class Echo:
+    """A file-like object that hands back whatever is written to it, so
+    csv.writer can format rows without a file behind it"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def get_export_scrobbles(
+    user_id: int, start_date=None, end_date=None, tracks_only=False
+) -> Iterator[Scrobble]:
+    date_query = Q()
     if start_date:
-        end_query = Q(timestamp__lte=end_date)
+        date_query &= Q(timestamp__gte=start_date)
+    if end_date:
+        date_query &= Q(timestamp__lte=end_date)
+    if tracks_only:
+        date_query &= Q(track__isnull=False)
 
-    scrobble_qs = Scrobble.objects.filter(
-        start_query, end_query, track__isnull=False
+    return (
+        Scrobble.objects.filter(date_query, user_id=user_id)
+        .select_related(
+            *MEDIA_TYPE_FOREIGN_KEYS.values(),
+            "track__artist",
+            "track__album__album_artist",
+        )
+        .order_by("timestamp")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
     )
-    headers = []
-    extension = "tsv"
-    delimiter = "\t"
-
-    if format == "as":
-        headers = [
-            ["#AUDIOSCROBBLER/1.1"],
-            ["#TZ/UTC"],
-            ["#CLIENT/Vrobbler 1.0.0"],
-        ]
 
-    if format == "csv":
-        delimiter = ","
-        extension = "csv"
-        headers = [
+
+def epoch(timestamp) -> Optional[int]:
+    return int(timestamp.timestamp()) if timestamp else None
+
+
+def scrobble_row(scrobble: Scrobble) -> dict:
+    media = scrobble.media_obj
+    row = {
+        "timestamp": epoch(scrobble.timestamp),
+        "stop_timestamp": epoch(scrobble.stop_timestamp),
+        "media_type": scrobble.media_type,
+        "title": (
+            (getattr(media, "title", None) or str(media)) if media else ""
+        ),
+        "artist": "",
+        "album": "",
+        "run_time_seconds": getattr(media, "run_time_seconds", None),
+        "playback_position_seconds": scrobble.playback_position_seconds,
+        "played_to_completion": scrobble.played_to_completion,
+        "source": scrobble.source,
+        "musicbrainz_id": "",
+    }
+    if scrobble.track_id:
+        track = scrobble.track
+        artist = track.artist
+        if not artist and track.album:
+            artist = track.album.album_artist
+        row["artist"] = str(artist or "")
+        row["album"] = track.album.name if track.album else ""
+        row["musicbrainz_id"] = track.musicbrainz_id or ""
+    return row
+
+
+def audioscrobbler_lines(scrobbles: Iterable[Scrobble]) -> Iterator[str]:
+    writer = csv.writer(Echo(), delimiter="\t")
+    yield "#AUDIOSCROBBLER/1.1\n#TZ/UTC\n#CLIENT/Vrobbler 1.0.0\n"
+    for scrobble in scrobbles:
+        row = scrobble_row(scrobble)
+        yield writer.writerow(
             [
-                "artists",
-                "album",
-                "title",
-                "track_number",
-                "run_time",
-                "rating",
-                "timestamp",
-                "musicbrainz_id",
+                row["artist"],
+                row["album"],
+                row["title"],
+                "",  # Track number, which tracks don't keep
+                row["run_time_seconds"] or "",
+                "L" if row["played_to_completion"] else "S",
+                row["timestamp"],
+                row["musicbrainz_id"],
             ]
+        )
+
+
+def csv_lines(scrobbles: Iterable[Scrobble]) -> Iterator[str]:
+    writer = csv.DictWriter(Echo(), fieldnames=CSV_COLUMNS)
+    yield writer.writeheader()
+    for scrobble in scrobbles:
+        yield writer.writerow(scrobble_row(scrobble))
+
+
+def jsonl_lines(scrobbles: Iterable[Scrobble]) -> Iterator[str]:
+    for scrobble in scrobbles:
+        yield json.dumps(scrobble_row(scrobble)) + "\n"
+
+
+def encode_blocks(lines: Iterable[str]) -> Iterator[bytes]:
+    block = []
+    block_size = 0
+    for line in lines:
+        block.append(line)
+        block_size += len(line)
+        if block_size >= EXPORT_BLOCK_SIZE:
+            yield "".join(block).encode("utf-8")
+            block = []
+            block_size = 0
+    if block:
+        yield "".join(block).encode("utf-8")
+
+
+def gzip_blocks(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def import_pyarrow():
+    """Parquet exports need pyarrow, which is an optional dependency"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ImportError(
+            "Parquet exports need pyarrow, `pip install pyarrow` to use them"
+        ) from exc
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_schema(pa):
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("timestamp", pa.timestamp("s", tz="UTC")),
+            ("stop_timestamp", pa.timestamp("s", tz="UTC")),
+            ("local_timestamp", pa.timestamp("s")),
+            ("timezone", pa.string()),
+            ("media_type", pa.dictionary(pa.int8(), pa.string())),
+            ("media_id", pa.int64()),
+            ("title", pa.string()),
+            ("artist", pa.string()),
+            ("album", pa.string()),
+            ("run_time_seconds", pa.int64()),
+            ("playback_position_seconds", pa.int64()),
+            ("played_to_completion", pa.bool_()),
+            ("source", pa.string()),
+            ("musicbrainz_id", pa.string()),
         ]
+    )
 
-    with tempfile.NamedTemporaryFile(mode="w", delete=False) as outfile:
-        writer = csv.writer(outfile, delimiter=delimiter)
-        for row in headers:
-            writer.writerow(row)
-
-        for scrobble in scrobble_qs:
-            track = scrobble.track
-            track_number = 0  # TODO Add track number
-            track_rating = "S"  # TODO implement ratings?
-            track_artist = track.artist or track.album.album_artist
-            row = [
-                track_artist,
-                track.album.name,
-                track.title,
-                track_number,
-                track.run_time,
-                track_rating,
-                scrobble.timestamp.strftime("%s"),
-                track.musicbrainz_id,
-            ]
-            writer.writerow(row)
-        return outfile.name, extension
+
+def get_user_timezone(user_id: int):
+    timezone = (
+        UserProfile.objects.filter(user_id=user_id)
+        .values_list("timezone", flat=True)
+        .first()
+    )
+    return pytz.timezone(timezone or settings.TIME_ZONE)
+
+
+def parquet_columns(
+    scrobbles: list[Scrobble], user_tz, schema
+) -> dict[str, list]:
+    columns = {name: [] for name in schema.names}
+    for scrobble in scrobbles:
+        row = scrobble_row(scrobble)
+        media = scrobble.media_obj
+        columns["id"].append(scrobble.id)
+        columns["timestamp"].append(scrobble.timestamp)
+        columns["stop_timestamp"].append(scrobble.stop_timestamp)
+        columns["local_timestamp"].append(
+            scrobble.timestamp.astimezone(user_tz).replace(tzinfo=None)
+            if scrobble.timestamp
+            else None
+        )
+        columns["timezone"].append(user_tz.zone)
+        columns["media_id"].append(media.id if media else None)
+        for name in [
+            "media_type",
+            "title",
+            "artist",
+            "album",
+            "run_time_seconds",
+            "playback_position_seconds",
+            "played_to_completion",
+            "source",
+            "musicbrainz_id",
+        ]:
+            columns[name].append(row[name])
+    return columns
+
+
+class DrainableBuffer(io.RawIOBase):
+    """A write-only file that keeps what's written until it's drained, so
+    the Parquet writer's output can be streamed as it goes"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def parquet_blocks(scrobbles: Iterable[Scrobble], user_tz) -> Iterator[bytes]:
+    """Write scrobbles as Parquet, one row group per
+    EXPORT_PARQUET_ROW_GROUP_SIZE scrobbles, yielding each as it's done"""
+    pa, pq = import_pyarrow()
+    schema = parquet_schema(pa)
+    sink = DrainableBuffer()
+
+    def row_group(batch):
+        return pa.RecordBatch.from_pydict(
+            parquet_columns(batch, user_tz, schema), schema=schema
+        )
+
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        batch = []
+        for scrobble in scrobbles:
+            batch.append(scrobble)
+            if len(batch) >= EXPORT_PARQUET_ROW_GROUP_SIZE:
+                writer.write_batch(row_group(batch))
+                batch = []
+                yield sink.drain()
+        if batch:
+            writer.write_batch(row_group(batch))
+    # Closing the writer adds the footer
+    yield sink.drain()
+
+
+def export_scrobbles(
+    user_id: int,
+    start_date=None,
+    end_date=None,
+    format="as",
+    compress=False,
+) -> tuple[Iterator[bytes], str, str]:
+    """Build a user's scrobble export as a stream of bytes
+
+    Returns the stream, the file extension and the content type. The
+    Audioscrobbler format only has room for tracks, the others hold every
+    kind of scrobble. Parquet files are already compressed.
+    """
+    if format not in EXPORT_FORMATS:
+        format = "csv"
+    extension, content_type = EXPORT_FORMATS[format]
+
+    scrobbles = get_export_scrobbles(
+        user_id, start_date, end_date, tracks_only=format == "as"
+    )
+    if format == "parquet":
+        # Fail before the response starts if pyarrow isn't installed
+        import_pyarrow()
+        return (
+            parquet_blocks(scrobbles, get_user_timezone(user_id)),
+            extension,
+            content_type,
+        )
+
+    lines = {
+        "as": audioscrobbler_lines,
+        "csv": csv_lines,
+        "jsonl": jsonl_lines,
+    }[format](scrobbles)
+    stream = encode_blocks(lines)
+
+    if compress:
+        stream = gzip_blocks(stream)
+        extension += ".gz"
+        content_type = "application/gzip"
+    return stream, extension, content_type
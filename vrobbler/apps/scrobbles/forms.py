@@ -7,9 +7,11 @@ class ExportScrobbleForm(forms.Form):
     EXPORT_TYPES = (
         ("as", "Audioscrobbler"),
         ("csv", "CSV"),
-        ("html", "HTML"),
+        ("jsonl", "JSON Lines"),
+        ("parquet", "Parquet"),
     )
     export_type = forms.ChoiceField(choices=EXPORT_TYPES)
+    gzip = forms.BooleanField(required=False, label="Compress with gzip")
 
 
 class ScrobbleForm(forms.Form):
@@ -0,0 +1,187 @@
+"""Shared HTTP sessions for the remote metadata lookups
+
+Each provider gets one `requests.Session`, whose connection pools keep the
+connections to every host it talks to alive between lookups. Requests get a
+default timeout, and errors and 429s are retried with backoff.
+
+Every request to a provider first takes a token from that provider's
+bucket, so a worker stays under the provider's rate limit no matter how many
+threads `gather` is running lookups on. The buckets live in the process,
+each worker keeps its own.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT_SECONDS = float(getattr(settings, "HTTP_TIMEOUT_SECONDS", 10))
+HTTP_RETRIES = int(getattr(settings, "HTTP_RETRIES", 3))
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_LOOKUP_WORKERS = int(getattr(settings, "HTTP_LOOKUP_WORKERS", 8))
+USER_AGENT = "Vrobbler 0.11.12"
+
+# Requests per second and how many can go out in a burst, by provider
+PROVIDER_RATE_LIMITS = {
+    "musicbrainz": (1, 1),
+    "arcadedb": (1, 2),
+    "theaudiodb": (2, 2),
+    "allmusic": (1, 2),
+    "bandcamp": (1, 2),
+    "openlibrary": (1, 3),
+    "locg": (1, 2),
+    "bgg": (0.5, 1),
+    "igdb": (4, 4),
+    "howlongtobeat": (1, 1),
+    "thesportsdb": (0.5, 2),
+    "podcasts": (1, 2),
+}
+PROVIDER_RATE_LIMITS.update(getattr(settings, "HTTP_RATE_LIMITS", {}))
+DEFAULT_RATE_LIMIT = (2, 4)
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class TokenBucket:
+    """Hands out `rate` tokens a second, up to `capacity` at once
+
+    A caller that finds the bucket empty still takes its token and sleeps
+    until it would have been there, so waiting threads go out in turn.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, returning how long we waited for it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ProviderSession(requests.Session):
+    def __init__(
+        self,
+        provider: str,
+        bucket: TokenBucket,
+        timeout: float = HTTP_TIMEOUT_SECONDS,
+    ):
+        super().__init__()
+        self.provider = provider
+        self.bucket = bucket
+        self.timeout = timeout
+        self.headers["User-Agent"] = USER_AGENT
+
+        retry = Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=HTTP_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            # Lookups only read, even the ones IGDB wants POSTed
+            allowed_methods=None,
+            # Hand back the last bad response for callers to check
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_maxsize=HTTP_LOOKUP_WORKERS, max_retries=retry
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        waited = self.bucket.acquire()
+        if waited:
+            logger.debug(
+                "[http_client] rate limited",
+                extra={"provider": self.provider, "waited": waited},
+            )
+        return super().request(method, url, **kwargs)
+
+
+_buckets: dict[str, TokenBucket] = {}
+_sessions: dict[str, ProviderSession] = {}
+_registry_lock = threading.Lock()
+
+
+def get_bucket(provider: str) -> TokenBucket:
+    with _registry_lock:
+        if provider not in _buckets:
+            rate, capacity = PROVIDER_RATE_LIMITS.get(
+                provider, DEFAULT_RATE_LIMIT
+            )
+            _buckets[provider] = TokenBucket(rate, capacity)
+        return _buckets[provider]
+
+
+def get_session(provider: str) -> ProviderSession:
+    bucket = get_bucket(provider)
+    with _registry_lock:
+        if provider not in _sessions:
+            _sessions[provider] = ProviderSession(provider, bucket)
+        return _sessions[provider]
+
+
+def get(url: str, provider: str, **kwargs) -> requests.Response:
+    return get_session(provider).get(url, **kwargs)
+
+
+def post(url: str, provider: str, **kwargs) -> requests.Response:
+    return get_session(provider).post(url, **kwargs)
+
+
+def throttle(provider: str) -> None:
+    """Wait for a provider's rate limit before a request made by a client
+    library with its own HTTP stack"""
+    get_bucket(provider).acquire()
+
+
+def gather(
+    lookup: Callable, items: Iterable, workers: int = HTTP_LOOKUP_WORKERS
+) -> dict:
+    """Run a remote lookup for each item on a thread pool, returning a map
+    of item to result
+
+    Each request still waits on its provider's bucket, so this speeds up
+    lookups across providers and up to each provider's burst. A lookup that
+    raises is logged and comes back as None. Lookups must not touch the
+    database.
+    """
+    items = list(dict.fromkeys(items))
+    if not items:
+        return {}
+
+    def run(item):
+        try:
+            return lookup(item)
+        except Exception:
+            logger.exception(
+                "[http_client] lookup failed",
+                extra={
+                    "lookup": getattr(lookup, "__name__", ""),
+                    "item": item,
+                },
+            )
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return dict(zip(items, pool.map(run, items)))
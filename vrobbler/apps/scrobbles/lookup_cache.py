@@ -0,0 +1,182 @@
+"""A shared cache in front of the remote metadata lookups
+
+Lookups wrapped with `cached_lookup` are keyed by their namespace and their
+arguments. Name arguments are normalized, so "The Beatles" and " the beatles"
+share an entry, while ids and URLs are used as given. Empty results are
+cached too, for a shorter time, so an import doesn't keep asking MusicBrainz
+about the same unknown artist. A lookup that couldn't get an answer raises
+`LookupUnavailable`, and nothing is cached for it.
+
+Without Redis the "lookups" cache is a database table, so entries survive
+restarts and are shared by the web and celery processes. Hit and miss
+counts are kept in each process, and logged by the import tasks.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CACHE_TTL = int(
+    getattr(settings, "LOOKUP_CACHE_TTL", 60 * 60 * 24 * 30)
+)
+LOOKUP_CACHE_NEGATIVE_TTL = int(
+    getattr(settings, "LOOKUP_CACHE_NEGATIVE_TTL", 60 * 60 * 24)
+)
+
+# Every namespace registered by `cached_lookup`, for reporting hit counts
+LOOKUP_NAMESPACES = set()
+
+MISSING = object()
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+class LookupUnavailable(Exception):
+    """Raised by a cached lookup when the provider couldn't answer, such as
+    on an error response, so its empty `result` is returned uncached"""
+
+    def __init__(self, result: Any = None):
+        super().__init__(result)
+        self.result = result
+
+
+def get_lookup_cache():
+    alias = "lookups" if "lookups" in settings.CACHES else "default"
+    return caches[alias]
+
+
+def normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return value
+
+
+def lookup_key(namespace: str, arguments: dict, names: Iterable = ()) -> str:
+    query = json.dumps(
+        {
+            name: normalize(value) if name in names else value
+            for name, value in arguments.items()
+        },
+        sort_keys=True,
+        default=str,
+    )
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()
+    return f"lookup:{namespace}:{digest}"
+
+
+def count(namespace: str, counter: str) -> None:
+    with _stats_lock:
+        _stats[(namespace, counter)] += 1
+
+
+def lookup_cache_stats() -> dict[str, dict[str, int]]:
+    """Hits and misses of each namespace in this process"""
+    with _stats_lock:
+        return {
+            namespace: {
+                counter: _stats[(namespace, counter)]
+                for counter in ["hits", "misses"]
+            }
+            for namespace in sorted(LOOKUP_NAMESPACES)
+        }
+
+
+def reset_lookup_cache_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+@contextmanager
+def logged_lookup_stats(label: str):
+    """Log how many of the lookups made inside the block hit the cache"""
+    before = lookup_cache_stats()
+    yield
+    totals = Counter()
+    for namespace, counts in lookup_cache_stats().items():
+        for counter, value in counts.items():
+            totals[counter] += value - before.get(namespace, {}).get(
+                counter, 0
+            )
+    logger.info(
+        "[lookup_cache] lookups",
+        extra={
+            "label": label,
+            "hits": totals["hits"],
+            "misses": totals["misses"],
+        },
+    )
+
+
+def cached_lookup(
+    namespace: str,
+    ttl: Optional[int] = None,
+    negative_ttl: Optional[int] = None,
+    names: Iterable[str] = (),
+) -> Callable:
+    """Cache the results of a remote lookup function
+
+    Falsy results are cached for `negative_ttl` seconds, everything else
+    for `ttl` seconds. Exceptions are never cached, and `LookupUnavailable`
+    returns its result without caching it. The arguments listed in `names`
+    are matched ignoring case and extra whitespace. The undecorated function
+    is available as `.uncached`.
+    """
+    LOOKUP_NAMESPACES.add(namespace)
+    names = set(names)
+
+    def decorator(lookup: Callable) -> Callable:
+        signature = inspect.signature(lookup)
+
+        @functools.wraps(lookup)
+        def wrapper(*args, **kwargs):
+            cache = get_lookup_cache()
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            key = lookup_key(namespace, arguments.arguments, names)
+
+            result = cache.get(key, MISSING)
+            if result is not MISSING:
+                count(namespace, "hits")
+                return result
+
+            count(namespace, "misses")
+            try:
+                result = lookup(*args, **kwargs)
+            except LookupUnavailable as e:
+                logger.info(
+                    "[cached_lookup] lookup unavailable, not cached",
+                    extra={"namespace": namespace, "key": key},
+                )
+                return e.result
+
+            timeout = ttl or LOOKUP_CACHE_TTL
+            if not result:
+                timeout = negative_ttl or LOOKUP_CACHE_NEGATIVE_TTL
+            cache.set(key, result, timeout)
+            logger.debug(
+                "[cached_lookup] cached lookup result",
+                extra={
+                    "namespace": namespace,
+                    "key": key,
+                    "hit": bool(result),
+                },
+            )
+            return result
+
+        wrapper.uncached = lookup
+        return wrapper
+
+    return decorator
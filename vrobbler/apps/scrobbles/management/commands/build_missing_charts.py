@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from scrobbles.stats import CHART_MEDIA_FIELDS, build_missing_charts_for_user
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            help="Only backfill charts for this user",
+        )
+        parser.add_argument(
+            "--media",
+            choices=CHART_MEDIA_FIELDS.keys(),
+            default="Track",
+            help="Media type to build charts for",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["user_id"]:
+            users = users.filter(id=options["user_id"])
+
+        for user in users:
+            count = build_missing_charts_for_user(
+                user, model_str=options["media"]
+            )
+            print(
+                f"Created {count} {options['media']} chart records for {user}"
+            )
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+from scrobbles.models import Scrobble
+
+User = get_user_model()
+
+
+def hot_scrobble_queries(user_id: int) -> dict:
+    """Representative querysets for the hottest Scrobble lookups"""
+    now = timezone.now()
+    return {
+        "create_or_update": Scrobble.objects.filter(
+            user_id=user_id, track_id=1
+        ).order_by("-timestamp")[:1],
+        "create_or_update_location": Scrobble.objects.filter(
+            user_id=user_id, media_type=Scrobble.MediaType.GEO_LOCATION
+        ).order_by("-timestamp")[:1],
+        "previous_by_media": Scrobble.objects.filter(
+            user_id=user_id, book_id=1, timestamp__lt=now
+        ).order_by("-timestamp")[:1],
+        "scrobble_counts": Scrobble.objects.filter(
+            user_id=user_id,
+            media_type=Scrobble.MediaType.TRACK,
+            played_to_completion=True,
+            timestamp__gte=now - timedelta(days=7),
+        ),
+        "live_charts": Scrobble.objects.filter(
+            user_id=user_id,
+            media_type=Scrobble.MediaType.TRACK,
+            played_to_completion=True,
+            timestamp__gte=now - timedelta(days=30),
+        )
+        .values("track_id")
+        .annotate(num_scrobbles=Count("id"))
+        .order_by("-num_scrobbles"),
+        "now_playing": Scrobble.objects.filter(
+            user_id=user_id, in_progress=True, is_paused=False
+        ).order_by("-timestamp"),
+        "zombies": Scrobble.objects.filter(
+            timestamp__lte=now - timedelta(days=3),
+            is_paused=False,
+            played_to_completion=False,
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = "Print query plans for the hottest Scrobble lookups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            help="User to build the queries for, defaults to the first user",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run the queries and include timings (postgres only)",
+        )
+
+    def handle(self, *args, **options):
+        user_id = options["user_id"]
+        if not user_id:
+            user = User.objects.order_by("id").first()
+            user_id = user.id if user else 1
+
+        explain_options = {}
+        if options["analyze"]:
+            explain_options["analyze"] = True
+
+        index_names = [index.name for index in Scrobble._meta.indexes]
+        for name, queryset in hot_scrobble_queries(user_id).items():
+            plan = queryset.explain(**explain_options)
+            used = [index for index in index_names if index in plan]
+
+            print(f"== {name}")
+            print(plan)
+            if used:
+                print(f"-> uses {', '.join(used)}")
+            else:
+                print("-> no scrobble index used")
+            print()
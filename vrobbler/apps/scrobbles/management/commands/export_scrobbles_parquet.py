@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from scrobbles.export import export_scrobbles
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Export a user's scrobbles to a Parquet file for analysis"
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_id", type=int)
+        parser.add_argument("output", help="Path of the Parquet file to write")
+        parser.add_argument("--start", help="Only scrobbles from this date")
+        parser.add_argument("--end", help="Only scrobbles up to this date")
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(id=options["user_id"]).exists():
+            raise CommandError(f"No user with ID {options['user_id']}")
+
+        try:
+            stream, _extension, _content_type = export_scrobbles(
+                options["user_id"],
+                start_date=options["start"],
+                end_date=options["end"],
+                format="parquet",
+            )
+        except ImportError as e:
+            raise CommandError(str(e))
+
+        with open(options["output"], "wb") as outfile:
+            for block in stream:
+                outfile.write(block)
+        print(f"Exported scrobbles to {options['output']}")
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from scrobbles.rollups import refresh_rollups
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            help="Only rebuild rollups for this user",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["user_id"]:
+            users = users.filter(id=options["user_id"])
+
+        for user in users:
+            count = refresh_rollups(user.id)
+            print(f"Rebuilt {count} scrobble rollups for {user}")
@@ -0,0 +1,144 @@
+# Generated by Django 4.2.16 on 2024-10-17 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scrobbles", "0062_scrobble_trail_alter_scrobble_media_type"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "media_type", "-timestamp"],
+                name="scrobble_user_media_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "track", "-timestamp"],
+                name="scrobble_user_track_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "video", "-timestamp"],
+                name="scrobble_user_video_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "podcast_episode", "-timestamp"],
+                name="scrobble_user_podcast_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "book", "-timestamp"],
+                name="scrobble_user_book_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "video_game", "-timestamp"],
+                name="scrobble_user_vgame_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "board_game", "-timestamp"],
+                name="scrobble_user_bgame_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "web_page", "-timestamp"],
+                name="scrobble_user_webpage_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "sport_event", "-timestamp"],
+                name="scrobble_user_sport_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "geo_location", "-timestamp"],
+                name="scrobble_user_geoloc_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "trail", "-timestamp"],
+                name="scrobble_user_trail_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "life_event", "-timestamp"],
+                name="scrobble_user_lifeevt_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "mood", "-timestamp"],
+                name="scrobble_user_mood_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["user", "brickset", "-timestamp"],
+                name="scrobble_user_brickset_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                condition=models.Q(("in_progress", True)),
+                fields=["user", "is_paused", "media_type"],
+                name="scrobble_in_progress_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                condition=models.Q(("played_to_completion", True)),
+                fields=["user", "media_type", "timestamp"],
+                name="scrobble_completed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                fields=["played_to_completion", "timestamp"],
+                name="scrobble_completed_ts_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scrobble",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_paused", False), ("played_to_completion", False)
+                ),
+                fields=["timestamp"],
+                name="scrobble_zombie_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 4.2.16 on 2024-10-17 18:32
+
+from collections import defaultdict
+
+import pytz
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from scrobbles.constants import MEDIA_TYPE_FOREIGN_KEYS
+
+
+def backfill_rollups(apps, schema_editor):
+    Scrobble = apps.get_model("scrobbles", "Scrobble")
+    ScrobbleRollup = apps.get_model("scrobbles", "ScrobbleRollup")
+    UserProfile = apps.get_model("profiles", "UserProfile")
+    media_keys = [key + "_id" for key in MEDIA_TYPE_FOREIGN_KEYS.values()]
+
+    user_tzs = {
+        user_id: pytz.timezone(tz_name or settings.TIME_ZONE)
+        for user_id, tz_name in UserProfile.objects.values_list(
+            "user_id", "timezone"
+        )
+    }
+    default_tz = pytz.timezone(settings.TIME_ZONE)
+
+    totals = defaultdict(lambda: [0, 0])
+    for row in (
+        Scrobble.objects.filter(
+            played_to_completion=True,
+            timestamp__isnull=False,
+            user__isnull=False,
+        )
+        .values(
+            "user_id",
+            "media_type",
+            "timestamp",
+            "playback_position_seconds",
+            "track__artist_id",
+            *media_keys,
+        )
+        .iterator(chunk_size=2000)
+    ):
+        key = MEDIA_TYPE_FOREIGN_KEYS.get(row["media_type"])
+        if not key or not row[key + "_id"]:
+            continue
+        tz = user_tzs.get(row["user_id"], default_tz)
+        local_date = row["timestamp"].astimezone(tz).date()
+
+        seconds = row["playback_position_seconds"] or 0
+        media = [(row["media_type"], row[key + "_id"])]
+        if row["track__artist_id"]:
+            media.append(("Artist", row["track__artist_id"]))
+        for media_type, media_id in media:
+            total = totals[(row["user_id"], media_type, media_id, local_date)]
+            total[0] += 1
+            total[1] += seconds
+
+    rollups = []
+    for (user_id, media_type, media_id, local_date), total in totals.items():
+        rollups.append(
+            ScrobbleRollup(
+                user_id=user_id,
+                media_type=media_type,
+                media_id=media_id,
+                local_date=local_date,
+                play_count=total[0],
+                seconds=total[1],
+            )
+        )
+    ScrobbleRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("profiles", "0016_alter_userprofile_timezone"),
+        ("scrobbles", "0063_scrobble_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScrobbleRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("media_type", models.CharField(max_length=14)),
+                ("media_id", models.PositiveIntegerField()),
+                ("local_date", models.DateField()),
+                ("play_count", models.PositiveIntegerField(default=0)),
+                ("seconds", models.BigIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="scrobblerollup",
+            constraint=models.UniqueConstraint(
+                fields=("user", "media_type", "local_date", "media_id"),
+                name="unique_scrobble_rollup",
+            ),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2024-10-17 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scrobbles", "0065_webhookinbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audioscrobblertsvimport",
+            name="rows_processed",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
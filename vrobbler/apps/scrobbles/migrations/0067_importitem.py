@@ -0,0 +1,94 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:01
+
+from django.db import migrations, models
+
+IMPORT_MODELS = [
+    "AudioScrobblerTSVImport",
+    "KoReaderImport",
+    "LastFmImport",
+    "RetroarchImport",
+]
+
+
+def copy_process_logs(apps, schema_editor):
+    ImportItem = apps.get_model("scrobbles", "ImportItem")
+    for model_name in IMPORT_MODELS:
+        Import = apps.get_model("scrobbles", model_name)
+        for scrobble_import in Import.objects.exclude(
+            process_log__isnull=True
+        ).exclude(process_log=""):
+            items = []
+            for line in scrobble_import.process_log.split("\n"):
+                scrobble_id = line.split("\t")[0]
+                if scrobble_id.isdigit():
+                    items.append(
+                        ImportItem(
+                            import_type=model_name,
+                            import_id=scrobble_import.id,
+                            scrobble_id=int(scrobble_id),
+                        )
+                    )
+            ImportItem.objects.bulk_create(items, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scrobbles", "0066_audioscrobblertsvimport_rows_processed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("import_type", models.CharField(max_length=50)),
+                ("import_id", models.PositiveIntegerField()),
+                ("scrobble_id", models.BigIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("imported", "Imported"),
+                            ("undone", "Undone"),
+                        ],
+                        default="imported",
+                        max_length=10,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["import_type", "import_id", "status"],
+                        name="import_item_import_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(copy_process_logs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="audioscrobblertsvimport",
+            name="process_log",
+        ),
+        migrations.RemoveField(
+            model_name="koreaderimport",
+            name="process_log",
+        ),
+        migrations.RemoveField(
+            model_name="lastfmimport",
+            name="process_log",
+        ),
+        migrations.RemoveField(
+            model_name="retroarchimport",
+            name="process_log",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scrobbles", "0067_importitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lastfmimport",
+            name="last_scrobble_uts",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.16 on 2024-10-17 19:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from scrobbles.constants import MEDIA_TYPE_FOREIGN_KEYS
+
+
+def record_active_scrobbles(apps, schema_editor):
+    Scrobble = apps.get_model("scrobbles", "Scrobble")
+    ActiveScrobble = apps.get_model("scrobbles", "ActiveScrobble")
+    media_keys = [key + "_id" for key in MEDIA_TYPE_FOREIGN_KEYS.values()]
+
+    # Oldest first, so the newest scrobble of each media type wins
+    active = {}
+    for row in (
+        Scrobble.objects.filter(in_progress=True, user__isnull=False)
+        .order_by("timestamp")
+        .values(
+            "id",
+            "user_id",
+            "media_type",
+            "is_paused",
+            "timestamp",
+            *media_keys,
+        )
+        .iterator()
+    ):
+        key = MEDIA_TYPE_FOREIGN_KEYS.get(row["media_type"])
+        if not key or not row[key + "_id"]:
+            continue
+        active[(row["user_id"], row["media_type"])] = ActiveScrobble(
+            user_id=row["user_id"],
+            media_type=row["media_type"],
+            media_id=row[key + "_id"],
+            scrobble_id=row["id"],
+            is_paused=row["is_paused"],
+            timestamp=row["timestamp"],
+        )
+    ActiveScrobble.objects.bulk_create(active.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("scrobbles", "0068_lastfmimport_last_scrobble_uts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActiveScrobble",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("media_type", models.CharField(max_length=14)),
+                ("media_id", models.PositiveIntegerField()),
+                ("is_paused", models.BooleanField(default=False)),
+                ("timestamp", models.DateTimeField()),
+                (
+                    "scrobble",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="scrobbles.scrobble",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="activescrobble",
+            constraint=models.UniqueConstraint(
+                fields=("user", "media_type"), name="unique_active_scrobble"
+            ),
+        ),
+        migrations.RunPython(
+            record_active_scrobbles, migrations.RunPython.noop
+        ),
+    ]
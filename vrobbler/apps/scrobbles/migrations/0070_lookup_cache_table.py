@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2024-10-18 09:12
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    # Without Redis the lookup cache lives in a database table
+    call_command(
+        "createcachetable",
+        database=schema_editor.connection.alias,
+        verbosity=0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scrobbles", "0069_activescrobble"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
@@ -13,14 +13,14 @@ from books.models import Book
 from bricksets.models import BrickSet
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFit
 from lifeevents.models import LifeEvent
-from locations.models import GeoLocation
+from locations.models import GeoLocation, LocationPing
 from moods.models import Mood
 from music.lastfm import LastFM
 from music.models import Artist, Track
@@ -34,7 +34,18 @@ from profiles.utils import (
     start_of_week,
 )
 from scrobbles import dataclasses as logdata
-from scrobbles.constants import LONG_PLAY_MEDIA
+from scrobbles.constants import LONG_PLAY_MEDIA, MEDIA_TYPE_FOREIGN_KEYS
+from scrobbles.progress import (
+    apply_buffered_progress,
+    buffer_progress,
+    discard_buffered_progress,
+    is_progress_tick,
+)
+from scrobbles.rollups import (
+    RollupState,
+    refresh_rollups_for_scrobbles,
+    refresh_rollups_for_timestamps,
+)
 from scrobbles.stats import build_charts
 from scrobbles.utils import media_class_to_foreign_key
 from sports.models import SportEvent
@@ -60,7 +71,6 @@ class BaseFileImportMixin(TimeStampedModel):
     uuid = models.UUIDField(editable=False, default=uuid4)
     processing_started = models.DateTimeField(**BNULL)
     processed_finished = models.DateTimeField(**BNULL)
-    process_log = models.TextField(**BNULL)
     process_count = models.IntegerField(**BNULL)
 
     class Meta:
@@ -83,47 +93,49 @@ class BaseFileImportMixin(TimeStampedModel):
     def process(self, force=False):
         logger.warning("Process not implemented")
 
+    def import_items(self) -> models.QuerySet:
+        return ImportItem.objects.filter(
+            import_type=self.__class__.__name__, import_id=self.id
+        )
+
     def undo(self, dryrun=False):
-        """Accepts the log from a scrobble import and removes the scrobbles"""
+        """Removes the scrobbles created by this import in one delete"""
         from scrobbles.models import Scrobble
 
-        if not self.process_log:
-
-            logger.warning("No lines in process log found to undo")
+        items = self.import_items().filter(status=ImportItem.Status.IMPORTED)
+        scrobbles = Scrobble.objects.filter(id__in=items.values("scrobble_id"))
+        if dryrun:
+            logger.info(
+                f"Would remove {scrobbles.count()} scrobbles from {self}"
+            )
             return
 
-        for line in self.process_log.split("\n"):
-            scrobble_id = line.split("\t")[0]
-            scrobble = Scrobble.objects.filter(id=scrobble_id).first()
-            if not scrobble:
-                logger.warning(
-                    f"Could not find scrobble {scrobble_id} to undo"
-                )
-                continue
-            logger.info(f"Removing scrobble {scrobble_id}")
-            if not dryrun:
-                scrobble.delete()
+        with transaction.atomic():
+            removed = scrobbles.delete_with_rollups()
+            items.update(status=ImportItem.Status.UNDONE)
+        logger.info(f"Removed {removed} scrobbles from {self}")
+
         self.processed_finished = None
         self.processing_started = None
         self.process_count = None
-        self.process_log = ""
         self.save(
             update_fields=[
                 "processed_finished",
                 "processing_started",
-                "process_log",
                 "process_count",
             ]
         )
 
     def scrobbles(self) -> models.QuerySet:
-        scrobble_ids = []
-        if self.process_log:
-            for line in self.process_log.split("\n"):
-                sid = line.split("\t")[0]
-                if sid:
-                    scrobble_ids.append(sid)
-        return Scrobble.objects.filter(id__in=scrobble_ids)
+        return (
+            Scrobble.objects.filter(
+                id__in=self.import_items()
+                .filter(status=ImportItem.Status.IMPORTED)
+                .values("scrobble_id")
+            )
+            .with_media()
+            .order_by("timestamp")
+        )
 
     def mark_started(self):
         self.processing_started = timezone.now()
@@ -133,21 +145,26 @@ class BaseFileImportMixin(TimeStampedModel):
         self.processed_finished = timezone.now()
         self.save(update_fields=["processed_finished"])
 
+    def record_items(self, scrobbles) -> None:
+        ImportItem.objects.bulk_create(
+            [
+                ImportItem(
+                    import_type=self.__class__.__name__,
+                    import_id=self.id,
+                    scrobble_id=scrobble.id,
+                )
+                for scrobble in scrobbles
+            ],
+            batch_size=1000,
+        )
+
     def record_log(self, scrobbles):
-        self.process_log = ""
-        if not scrobbles:
-            self.process_count = 0
-            self.save(update_fields=["process_log", "process_count"])
-            return
+        self.record_items(scrobbles or [])
+        self.process_count = len(scrobbles or [])
+        self.save(update_fields=["process_count"])
 
-        for count, scrobble in enumerate(scrobbles):
-            scrobble_str = f"{scrobble.id}\t{scrobble.timestamp}\t{scrobble.media_obj.title}"
-            log_line = f"{scrobble_str}"
-            if count > 0:
-                log_line = "\n" + log_line
-            self.process_log += log_line
-        self.process_count = len(scrobbles)
-        self.save(update_fields=["process_log", "process_count"])
+        # Bulk created scrobbles skip post_save, so roll them up here
+        refresh_rollups_for_scrobbles(scrobbles or [])
 
     @property
     def upload_file_path(self):
@@ -225,8 +242,12 @@ class AudioScrobblerTSVImport(BaseFileImportMixin):
         return path
 
     tsv_file = models.FileField(upload_to=get_path, **BNULL)
+    # Checkpoint of the next row in the file to import
+    rows_processed = models.PositiveIntegerField(default=0)
 
     def process(self, force=False):
+        """Import the TSV file in chunks, resuming from the last committed
+        chunk if a previous run died part way through"""
         from scrobbles.tsv import process_audioscrobbler_tsv_file
 
         if self.processed_finished and not force:
@@ -235,21 +256,59 @@ class AudioScrobblerTSVImport(BaseFileImportMixin):
             )
             return
 
-        self.mark_started()
+        if self.processed_finished:
+            # Forcing a finished import runs it again from the top
+            self.processed_finished = None
+            self.rows_processed = 0
+        if not self.rows_processed:
+            self.process_count = 0
+            self.processing_started = timezone.now()
+        self.save(
+            update_fields=[
+                "processed_finished",
+                "processing_started",
+                "rows_processed",
+                "process_count",
+            ]
+        )
+        if self.rows_processed:
+            logger.info(
+                f"Resuming {self} from row {self.rows_processed}",
+                extra={"import_id": self.id},
+            )
 
         tz = None
         user_id = None
         if self.user:
             user_id = self.user.id
             tz = self.user.profile.tzinfo
-        scrobbles = process_audioscrobbler_tsv_file(
-            self.upload_file_path, user_id, user_tz=tz
+        process_audioscrobbler_tsv_file(
+            self.upload_file_path,
+            user_id,
+            user_tz=tz,
+            start_row=self.rows_processed,
+            on_chunk=self.record_chunk,
         )
-        self.record_log(scrobbles)
         self.mark_finished()
 
+    def record_chunk(self, scrobbles, rows_processed: int):
+        """Checkpoint a committed chunk of the import"""
+        self.record_items(scrobbles)
+        AudioScrobblerTSVImport.objects.filter(id=self.id).update(
+            rows_processed=rows_processed,
+            process_count=models.F("process_count") + len(scrobbles),
+        )
+        self.rows_processed = rows_processed
+        self.process_count = (self.process_count or 0) + len(scrobbles)
+
+        # Bulk created scrobbles skip post_save, so roll them up here
+        refresh_rollups_for_scrobbles(scrobbles)
+
 
 class LastFmImport(BaseFileImportMixin):
+    # Unix timestamp of the newest Last.fm scrobble imported so far
+    last_scrobble_uts = models.BigIntegerField(**BNULL)
+
     class Meta:
         verbose_name = "Last.FM Import"
 
@@ -263,7 +322,8 @@ class LastFmImport(BaseFileImportMixin):
         )
 
     def process(self, import_all=False):
-        """Import scrobbles found on LastFM"""
+        """Import scrobbles found on LastFM since the newest scrobble the
+        last finished import brought in"""
         if self.processed_finished:
             logger.info(
                 f"{self} already processed on {self.processed_finished}"
@@ -272,10 +332,14 @@ class LastFmImport(BaseFileImportMixin):
 
         last_import = None
         if not import_all:
-            try:
-                last_import = LastFmImport.objects.exclude(id=self.id).last()
-            except:
-                pass
+            last_import = (
+                LastFmImport.objects.filter(
+                    user=self.user, processed_finished__isnull=False
+                )
+                .exclude(id=self.id)
+                .order_by("-processed_finished")
+                .first()
+            )
 
         if not import_all and not last_import:
             logger.warn(
@@ -284,16 +348,45 @@ class LastFmImport(BaseFileImportMixin):
             return
 
         lastfm = LastFM(self.user)
-        last_processed = None
+        since_uts = None
         if last_import:
-            last_processed = last_import.processed_finished
+            since_uts = last_import.last_scrobble_uts
+            if not since_uts and last_import.processed_finished:
+                # Imports from before we kept a cursor
+                since_uts = int(last_import.processed_finished.timestamp())
+
+        # Carry the cursor forward, even if there's nothing new to import
+        self.last_scrobble_uts = max(
+            self.last_scrobble_uts or 0, since_uts or 0
+        )
+        if not self.processing_started:
+            self.processing_started = timezone.now()
+            self.process_count = 0
+        self.save(
+            update_fields=[
+                "last_scrobble_uts",
+                "processing_started",
+                "process_count",
+            ]
+        )
 
-        self.mark_started()
+        lastfm.import_from_lastfm(
+            since_uts=since_uts, on_page=self.record_page
+        )
+        self.mark_finished()
 
-        scrobbles = lastfm.import_from_lastfm(last_processed)
+    def record_page(self, scrobbles, newest_uts: int):
+        """Record a page of imported scrobbles and move the cursor"""
+        self.record_items(scrobbles)
+        self.last_scrobble_uts = max(self.last_scrobble_uts or 0, newest_uts)
+        LastFmImport.objects.filter(id=self.id).update(
+            last_scrobble_uts=self.last_scrobble_uts,
+            process_count=models.F("process_count") + len(scrobbles),
+        )
+        self.process_count = (self.process_count or 0) + len(scrobbles)
 
-        self.record_log(scrobbles)
-        self.mark_finished()
+        # Bulk created scrobbles skip post_save, so roll them up here
+        refresh_rollups_for_scrobbles(scrobbles)
 
 
 class RetroarchImport(BaseFileImportMixin):
@@ -330,12 +423,162 @@ class RetroarchImport(BaseFileImportMixin):
         scrobbles = retroarch.import_retroarch_lrtl_files(
             self.user.profile.retroarch_path,
             self.user.id,
+            import_all=import_all,
         )
 
         self.record_log(scrobbles)
         self.mark_finished()
 
 
+class ImportItem(models.Model):
+    """A scrobble created by one of the imports above
+
+    `import_type` is the import's model name, so every kind of import
+    shares this table.
+    """
+
+    class Status(models.TextChoices):
+        IMPORTED = "imported", "Imported"
+        UNDONE = "undone", "Undone"
+
+    import_type = models.CharField(max_length=50)
+    import_id = models.PositiveIntegerField()
+    scrobble_id = models.BigIntegerField()
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.IMPORTED
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["import_type", "import_id", "status"],
+                name="import_item_import_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"Scrobble {self.scrobble_id} from {self.import_type} {self.import_id}"
+
+
+class WebhookInbox(TimeStampedModel):
+    """A webhook payload waiting to be turned into a scrobble
+
+    Celery drains each user's inbox in id order, so pause, resume and stop
+    events are applied in the order they arrived.
+    """
+
+    class Source(models.TextChoices):
+        JELLYFIN = "jellyfin", "Jellyfin"
+        MOPIDY = "mopidy", "Mopidy"
+        GPSLOGGER = "gpslogger", "GPSLogger"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSED = "processed", "Processed"
+        FAILED = "failed", "Failed"
+
+    # Payloads missing these can never become a scrobble
+    REQUIRED_KEYS = {
+        Source.JELLYFIN: ["NotificationType"],
+        Source.MOPIDY: ["name", "status"],
+        Source.GPSLOGGER: ["lat", "lon"],
+    }
+
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, **BNULL)
+    source = models.CharField(max_length=20, choices=Source.choices)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    processed_at = models.DateTimeField(**BNULL)
+    scrobble_id = models.BigIntegerField(**BNULL)
+    error = models.TextField(**BNULL)
+
+    class Meta:
+        verbose_name_plural = "Webhook inbox"
+        indexes = [
+            models.Index(
+                fields=["user", "status", "id"],
+                name="webhook_inbox_pending_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.source} webhook {self.id} ({self.status})"
+
+    @classmethod
+    def missing_keys(cls, source: str, payload) -> list[str]:
+        if not isinstance(payload, dict):
+            return cls.REQUIRED_KEYS[source]
+        return [key for key in cls.REQUIRED_KEYS[source] if key not in payload]
+
+    def process(self) -> Optional["Scrobble"]:
+        from scrobbles.scrobblers import (
+            gpslogger_scrobble_location,
+            jellyfin_scrobble_media,
+            mopidy_scrobble_media,
+        )
+
+        scrobblers = {
+            self.Source.JELLYFIN: jellyfin_scrobble_media,
+            self.Source.MOPIDY: mopidy_scrobble_media,
+            self.Source.GPSLOGGER: gpslogger_scrobble_location,
+        }
+
+        scrobble = None
+        try:
+            # A savepoint, so a failed scrobbler leaves nothing half written
+            # and the inbox worker's transaction can still record the error
+            with transaction.atomic():
+                # Scrobblers pop keys off the payload, so hand them a copy
+                scrobble = scrobblers[self.source](
+                    dict(self.payload), self.user_id
+                )
+        except Exception as e:
+            logger.exception(
+                "[webhook_inbox] processing failed",
+                extra={"inbox_id": self.id, "source": self.source},
+            )
+            self.status = self.Status.FAILED
+            self.error = str(e)
+        else:
+            self.status = self.Status.PROCESSED
+            self.scrobble_id = scrobble.id if scrobble else None
+
+        self.processed_at = timezone.now()
+        self.save(
+            update_fields=["status", "error", "scrobble_id", "processed_at"]
+        )
+        return scrobble
+
+
+class ScrobbleRollup(models.Model):
+    """Completed plays and seconds per user, media item and local day
+
+    A derived table, rebuilt a day at a time by scrobbles.rollups, which
+    charts and counters sum over instead of counting every scrobble. Track
+    plays are also rolled up to their artist under the "Artist" media type.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    media_type = models.CharField(max_length=14)
+    media_id = models.PositiveIntegerField()
+    local_date = models.DateField()
+    play_count = models.PositiveIntegerField(default=0)
+    seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "media_type", "local_date", "media_id"],
+                name="unique_scrobble_rollup",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.media_type} {self.media_id} on {self.local_date}: {self.play_count}"
+
+
 class ChartRecord(TimeStampedModel):
     """Sort of like a materialized view for what we could dynamically generate,
     but would kill the DB as it gets larger. Collects time-based records
@@ -470,6 +713,31 @@ class ChartRecord(TimeStampedModel):
         return cls.objects.filter(year=year, week=week, user=user)
 
 
+class ScrobbleQuerySet(models.QuerySet):
+    def with_media(self) -> "ScrobbleQuerySet":
+        """Batch load the media of each scrobble
+
+        Only the foreign keys actually set on the fetched scrobbles are
+        queried, so this costs one query per media type in the results.
+        """
+        return self.prefetch_related(*MEDIA_TYPE_FOREIGN_KEYS.values())
+
+    def delete_with_rollups(self) -> int:
+        """Delete the scrobbles and their location pings in set-based
+        deletes, then refresh the rollup days the completed ones counted
+        toward, once per day"""
+        user_timestamps = list(
+            self.filter(played_to_completion=True).values_list(
+                "user_id", "timestamp"
+            )
+        )
+        # Pings have no constraint on their scrobble to cascade through
+        LocationPing.objects.filter(scrobble_id__in=self.values("id")).delete()
+        removed, _ = self.delete()
+        refresh_rollups_for_timestamps(user_timestamps)
+        return removed
+
+
 class Scrobble(TimeStampedModel):
     """A scrobble tracks played media items by a user."""
 
@@ -490,6 +758,92 @@ class Scrobble(TimeStampedModel):
         MOOD = "Mood", "Mood"
         BRICKSET = "BrickSet", "Brick set"
 
+    class Meta(TimeStampedModel.Meta):
+        # Every hot path filters scrobbles by user and then by media (either
+        # the media_type or a specific media FK) ordered by timestamp. The
+        # partial indexes keep the in-progress, completed and zombie lookups
+        # tiny, and are narrow enough that counts become index-only scans.
+        # Use `manage.py explain_scrobble_queries` to check coverage.
+        indexes = [
+            models.Index(
+                fields=["user", "media_type", "-timestamp"],
+                name="scrobble_user_media_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "track", "-timestamp"],
+                name="scrobble_user_track_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "video", "-timestamp"],
+                name="scrobble_user_video_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "podcast_episode", "-timestamp"],
+                name="scrobble_user_podcast_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "book", "-timestamp"],
+                name="scrobble_user_book_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "video_game", "-timestamp"],
+                name="scrobble_user_vgame_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "board_game", "-timestamp"],
+                name="scrobble_user_bgame_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "web_page", "-timestamp"],
+                name="scrobble_user_webpage_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "sport_event", "-timestamp"],
+                name="scrobble_user_sport_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "geo_location", "-timestamp"],
+                name="scrobble_user_geoloc_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "trail", "-timestamp"],
+                name="scrobble_user_trail_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "life_event", "-timestamp"],
+                name="scrobble_user_lifeevt_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "mood", "-timestamp"],
+                name="scrobble_user_mood_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "brickset", "-timestamp"],
+                name="scrobble_user_brickset_ts_idx",
+            ),
+            models.Index(
+                fields=["user", "is_paused", "media_type"],
+                name="scrobble_in_progress_idx",
+                condition=models.Q(in_progress=True),
+            ),
+            models.Index(
+                fields=["user", "media_type", "timestamp"],
+                name="scrobble_completed_idx",
+                condition=models.Q(played_to_completion=True),
+            ),
+            models.Index(
+                fields=["played_to_completion", "timestamp"],
+                name="scrobble_completed_ts_idx",
+            ),
+            models.Index(
+                fields=["timestamp"],
+                name="scrobble_zombie_idx",
+                condition=models.Q(
+                    played_to_completion=False, is_paused=False
+                ),
+            ),
+        ]
+
     uuid = models.UUIDField(editable=False, **BNULL)
     video = models.ForeignKey(Video, on_delete=models.DO_NOTHING, **BNULL)
     track = models.ForeignKey(Track, on_delete=models.DO_NOTHING, **BNULL)
@@ -566,6 +920,24 @@ class Scrobble(TimeStampedModel):
     long_play_seconds = models.BigIntegerField(**BNULL)
     long_play_complete = models.BooleanField(**BNULL)
 
+    objects = ScrobbleQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        scrobble = super().from_db(db, field_names, values)
+        # Remember where it counts, so moving it also refreshes the old day
+        scrobble._rollup_state = scrobble.rollup_state()
+        return scrobble
+
+    def rollup_state(self) -> RollupState:
+        # Read from __dict__ so deferred fields aren't fetched one by one
+        fields = self.__dict__
+        return RollupState(
+            fields.get("user_id"),
+            fields.get("timestamp"),
+            bool(fields.get("played_to_completion")),
+        )
+
     def save(self, *args, **kwargs):
         if not self.uuid:
             self.uuid = uuid4()
@@ -866,31 +1238,20 @@ class Scrobble(TimeStampedModel):
 
     @property
     def media_obj(self):
+        """The media this scrobble is of, picked by media_type
+
+        When listing scrobbles, use `Scrobble.objects.with_media()` so the
+        media is loaded in one query per media type rather than per row.
+        """
+        key = MEDIA_TYPE_FOREIGN_KEYS.get(self.media_type)
+        if key and getattr(self, key + "_id"):
+            return getattr(self, key)
+
+        # Older scrobbles may have a media_type that doesn't match the FK
         media_obj = None
-        if self.video:
-            media_obj = self.video
-        if self.track:
-            media_obj = self.track
-        if self.podcast_episode:
-            media_obj = self.podcast_episode
-        if self.sport_event:
-            media_obj = self.sport_event
-        if self.book:
-            media_obj = self.book
-        if self.video_game:
-            media_obj = self.video_game
-        if self.board_game:
-            media_obj = self.board_game
-        if self.geo_location:
-            media_obj = self.geo_location
-        if self.web_page:
-            media_obj = self.web_page
-        if self.life_event:
-            media_obj = self.life_event
-        if self.mood:
-            media_obj = self.mood
-        if self.brickset:
-            media_obj = self.brickset
+        for key in MEDIA_TYPE_FOREIGN_KEYS.values():
+            if getattr(self, key + "_id"):
+                media_obj = getattr(self, key)
         return media_obj
 
     def __str__(self):
@@ -934,15 +1295,6 @@ class Scrobble(TimeStampedModel):
         media_query = models.Q(**{key: media})
         scrobble_data[key + "_id"] = media.id
 
-        # Find our last scrobble of this media item (track, video, etc)
-        scrobble = (
-            cls.objects.filter(
-                media_query,
-                user_id=user_id,
-            )
-            .order_by("-timestamp")
-            .first()
-        )
         source = scrobble_data.get("source", "Vrobbler")
         mtype = media.__class__.__name__
         mopidy_status = scrobble_data.get("mopidy_status", None)
@@ -957,6 +1309,28 @@ class Scrobble(TimeStampedModel):
             )
             return scrobble
 
+        # Check what's in flight first, it's a much smaller table
+        active = (
+            ActiveScrobble.objects.filter(
+                user_id=user_id, media_type=mtype, media_id=media.id
+            )
+            .select_related("scrobble")
+            .first()
+        )
+        scrobble = active.scrobble if active else None
+        # Ticks since the last write may only be in the progress buffer
+        apply_buffered_progress(scrobble)
+        if not scrobble:
+            # Find our last scrobble of this media item (track, video, etc)
+            scrobble = (
+                cls.objects.filter(
+                    media_query,
+                    user_id=user_id,
+                )
+                .order_by("-timestamp")
+                .first()
+            )
+
         logger.info(
             f"[create_or_update] check for existing scrobble to update ",
             extra={
@@ -1113,6 +1487,13 @@ class Scrobble(TimeStampedModel):
         if self.beyond_completion_percent:
             playback_status = "stopped"
 
+        # Plain progress ticks are buffered rather than saved every time
+        if playback_status == "resumed" and is_progress_tick(
+            self, scrobble_data
+        ):
+            buffer_progress(self, scrobble_data["playback_position_seconds"])
+            return self
+
         if playback_status == "stopped":
             self.stop()
         if playback_status == "paused":
@@ -1133,6 +1514,7 @@ class Scrobble(TimeStampedModel):
             setattr(self, key, value)
             update_fields.append(key)
         self.save(update_fields=update_fields)
+        discard_buffered_progress(self)
 
         return self
 
@@ -1142,12 +1524,16 @@ class Scrobble(TimeStampedModel):
         scrobble_data: dict,
     ) -> "Scrobble":
         scrobble_data["log"] = {}
-        scrobble = cls.objects.create(
-            **scrobble_data,
-        )
+        with transaction.atomic():
+            scrobble = cls.objects.create(
+                **scrobble_data,
+            )
+            if scrobble.in_progress:
+                ActiveScrobble.record(scrobble)
         return scrobble
 
     def stop(self, force_finish=False) -> None:
+        apply_buffered_progress(self)
         self.stop_timestamp = timezone.now()
         self.played_to_completion = True
         self.in_progress = False
@@ -1157,14 +1543,17 @@ class Scrobble(TimeStampedModel):
                 (self.stop_timestamp - self.timestamp).total_seconds()
             )
 
-        self.save(
-            update_fields=[
-                "in_progress",
-                "played_to_completion",
-                "stop_timestamp",
-                "playback_position_seconds",
-            ]
-        )
+        with transaction.atomic():
+            self.save(
+                update_fields=[
+                    "in_progress",
+                    "played_to_completion",
+                    "stop_timestamp",
+                    "playback_position_seconds",
+                ]
+            )
+            ActiveScrobble.discard(self)
+        discard_buffered_progress(self)
 
         class_name = self.media_obj.__class__.__name__
         if class_name in LONG_PLAY_MEDIA.values():
@@ -1184,8 +1573,14 @@ class Scrobble(TimeStampedModel):
         if self.is_paused:
             logger.warning(f"{self.id} - already paused - {self.source}")
             return
+        apply_buffered_progress(self)
         self.is_paused = True
-        self.save(update_fields=["is_paused"])
+        with transaction.atomic():
+            self.save(update_fields=["is_paused", "playback_position_seconds"])
+            ActiveScrobble.objects.filter(scrobble_id=self.id).update(
+                is_paused=True
+            )
+        discard_buffered_progress(self)
         logger.info(
             f"[scrobbling] paused",
             extra={
@@ -1199,7 +1594,9 @@ class Scrobble(TimeStampedModel):
         if self.is_paused or not self.in_progress:
             self.is_paused = False
             self.in_progress = True
-            self.save(update_fields=["is_paused", "in_progress"])
+            with transaction.atomic():
+                self.save(update_fields=["is_paused", "in_progress"])
+                ActiveScrobble.record(self)
             logger.info(
                 f"[scrobbling] resumed",
                 extra={
@@ -1210,7 +1607,10 @@ class Scrobble(TimeStampedModel):
             )
 
     def cancel(self) -> None:
-        self.delete()
+        discard_buffered_progress(self)
+        with transaction.atomic():
+            ActiveScrobble.discard(self)
+            Scrobble.objects.filter(id=self.id).delete_with_rollups()
 
     def update_ticks(self, data) -> None:
         self.playback_position_seconds = data.get("playback_position_seconds")
@@ -1265,3 +1665,55 @@ class Scrobble(TimeStampedModel):
             beyond_completion = False
 
         return beyond_completion
+
+
+class ActiveScrobble(models.Model):
+    """The scrobble each user has in flight for each media type
+
+    Kept in step with Scrobble.create, stop, pause and resume, so the
+    webhooks, now playing and status pages can find what's playing without
+    searching the scrobble history. Rows whose scrobble was deleted out from
+    under them drop out of any query that joins to the scrobble.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    media_type = models.CharField(max_length=14)
+    media_id = models.PositiveIntegerField()
+    scrobble = models.ForeignKey(
+        Scrobble,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    is_paused = models.BooleanField(default=False)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "media_type"], name="unique_active_scrobble"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.media_type} {self.media_id} for {self.user_id}"
+
+    @classmethod
+    def record(cls, scrobble: Scrobble) -> None:
+        media_id = getattr(scrobble, scrobble.scrobble_media_key, None)
+        if not scrobble.user_id or not media_id:
+            return
+        cls.objects.update_or_create(
+            user_id=scrobble.user_id,
+            media_type=scrobble.media_type,
+            defaults={
+                "media_id": media_id,
+                "scrobble": scrobble,
+                "is_paused": scrobble.is_paused,
+                "timestamp": scrobble.timestamp or timezone.now(),
+            },
+        )
+
+    @classmethod
+    def discard(cls, scrobble: Scrobble) -> None:
+        cls.objects.filter(scrobble_id=scrobble.id).delete()
@@ -0,0 +1,134 @@
+"""A write-behind buffer for playback progress ticks
+
+Jellyfin and friends report playback position every few seconds. Rather than
+save the scrobble on every tick, ticks that only move the playback position
+are kept in the "progress" cache and written to the database at most every
+PROGRESS_FLUSH_SECONDS, whenever the scrobble changes state, or by the
+`flush_progress_buffer` task.
+
+The buffer has to be a cache every process shares, like Redis. A local
+memory cache would hide ticks from the flush task and the other web workers,
+so without one every tick is written straight through.
+"""
+
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_FLUSH_SECONDS = int(getattr(settings, "PROGRESS_FLUSH_SECONDS", 60))
+# Buffered ticks outlive any sane gap between flushes
+PROGRESS_BUFFER_TTL = 60 * 60 * 24
+
+BUFFERED_FIELDS = ["playback_position_seconds", "is_paused"]
+
+
+def get_progress_cache():
+    alias = "progress" if "progress" in settings.CACHES else "default"
+    return caches[alias]
+
+
+def progress_key(scrobble_id: int) -> str:
+    return f"progress:{scrobble_id}"
+
+
+def progress_buffer_is_shared() -> bool:
+    return not isinstance(get_progress_cache(), LocMemCache)
+
+
+def is_progress_tick(scrobble, scrobble_data: dict) -> bool:
+    """A tick only moves the playback position of a scrobble in flight"""
+    if not scrobble.in_progress or scrobble.is_paused:
+        return False
+    if "playback_position_seconds" not in scrobble_data:
+        return False
+    return all(
+        getattr(scrobble, key, None) == value
+        for key, value in scrobble_data.items()
+        if key not in ["playback_position_seconds", "timestamp"]
+    )
+
+
+def buffer_progress(scrobble, playback_position_seconds: int) -> bool:
+    """Buffer a progress tick, returning True if it was also written
+    through because the last write is older than PROGRESS_FLUSH_SECONDS
+    or there's no shared cache to buffer it in"""
+    if not progress_buffer_is_shared():
+        scrobble.playback_position_seconds = playback_position_seconds
+        scrobble.save(update_fields=BUFFERED_FIELDS)
+        return True
+
+    cache = get_progress_cache()
+    key = progress_key(scrobble.id)
+    now = time.time()
+    buffered = cache.get(key) or {"flushed_at": now}
+
+    scrobble.playback_position_seconds = playback_position_seconds
+    buffered.update(
+        {field: getattr(scrobble, field) for field in BUFFERED_FIELDS}
+    )
+
+    written = now - buffered["flushed_at"] >= PROGRESS_FLUSH_SECONDS
+    if written:
+        scrobble.save(update_fields=BUFFERED_FIELDS)
+        buffered["flushed_at"] = now
+    cache.set(key, buffered, PROGRESS_BUFFER_TTL)
+    return written
+
+
+def apply_buffered_progress(scrobble) -> None:
+    """Overlay any buffered ticks on a scrobble loaded from the database"""
+    if not scrobble:
+        return
+    buffered = get_progress_cache().get(progress_key(scrobble.id))
+    if not buffered:
+        return
+    for field in BUFFERED_FIELDS:
+        setattr(scrobble, field, buffered[field])
+
+
+def discard_buffered_progress(scrobble) -> None:
+    """Forget buffered ticks once the scrobble itself has been saved"""
+    get_progress_cache().delete(progress_key(scrobble.id))
+
+
+def flush_progress() -> int:
+    """Write buffered ticks for every scrobble in flight to the database,
+    returning how many scrobbles were updated"""
+    ActiveScrobble = apps.get_model("scrobbles", "ActiveScrobble")
+    Scrobble = apps.get_model("scrobbles", "Scrobble")
+    cache = get_progress_cache()
+
+    keys = {
+        progress_key(scrobble_id): scrobble_id
+        for scrobble_id in ActiveScrobble.objects.values_list(
+            "scrobble_id", flat=True
+        )
+    }
+    buffered = cache.get_many(keys.keys())
+    if not buffered:
+        return 0
+
+    scrobbles = Scrobble.objects.in_bulk(
+        [keys[key] for key in buffered.keys()]
+    )
+    for key, ticks in buffered.items():
+        scrobble = scrobbles.get(keys[key])
+        if scrobble:
+            for field in BUFFERED_FIELDS:
+                setattr(scrobble, field, ticks[field])
+    Scrobble.objects.bulk_update(scrobbles.values(), BUFFERED_FIELDS)
+    # A tick landing between the read and this delete is lost, but the next
+    # one a few seconds later buffers the position again
+    cache.delete_many(buffered.keys())
+
+    logger.info(
+        "[flush_progress] flushed buffered progress",
+        extra={"scrobbles": len(scrobbles)},
+    )
+    return len(scrobbles)
@@ -0,0 +1,196 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, NamedTuple, Optional
+
+import pytz
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+
+from scrobbles.constants import MEDIA_TYPE_FOREIGN_KEYS
+
+logger = logging.getLogger(__name__)
+
+_pending = threading.local()
+
+
+class RollupState(NamedTuple):
+    """Where a scrobble counts in the rollups when it was loaded or saved"""
+
+    user_id: Optional[int]
+    timestamp: Optional[datetime]
+    played_to_completion: bool
+
+
+def get_user_tz(user_id: int) -> pytz.BaseTzInfo:
+    UserProfile = apps.get_model("profiles", "UserProfile")
+    tz_name = (
+        UserProfile.objects.filter(user_id=user_id)
+        .values_list("timezone", flat=True)
+        .first()
+    )
+    return pytz.timezone(tz_name or settings.TIME_ZONE)
+
+
+def local_day_start(day: date, tz: pytz.BaseTzInfo) -> datetime:
+    return tz.localize(datetime.combine(day, time.min))
+
+
+def refresh_rollups(
+    user_id: int, dates: Optional[Iterable[date]] = None
+) -> int:
+    """Rebuild a user's rollup rows for the given local dates from their
+    completed scrobbles, or rebuild every row if no dates are given.
+
+    Rows are always recomputed from scratch, so it's safe to call this as
+    often as needed. Returns the number of rollup rows written.
+    """
+    Scrobble = apps.get_model("scrobbles", "Scrobble")
+    ScrobbleRollup = apps.get_model("scrobbles", "ScrobbleRollup")
+    tz = get_user_tz(user_id)
+
+    scrobbles = Scrobble.objects.filter(
+        user_id=user_id, played_to_completion=True, timestamp__isnull=False
+    )
+    stale_rollups = ScrobbleRollup.objects.filter(user_id=user_id)
+    if dates is not None:
+        dates = set(dates)
+        if not dates:
+            return 0
+        scrobbles = scrobbles.filter(
+            timestamp__gte=local_day_start(min(dates), tz),
+            timestamp__lt=local_day_start(max(dates) + timedelta(days=1), tz),
+        )
+        stale_rollups = stale_rollups.filter(local_date__in=dates)
+
+    media_keys = [key + "_id" for key in MEDIA_TYPE_FOREIGN_KEYS.values()]
+    totals = defaultdict(lambda: [0, 0])
+    for row in scrobbles.values(
+        "media_type",
+        "timestamp",
+        "playback_position_seconds",
+        "track__artist_id",
+        *media_keys,
+    ).iterator(chunk_size=2000):
+        local_date = row["timestamp"].astimezone(tz).date()
+        if dates is not None and local_date not in dates:
+            continue
+        key = MEDIA_TYPE_FOREIGN_KEYS.get(row["media_type"])
+        if not key or not row[key + "_id"]:
+            continue
+
+        seconds = row["playback_position_seconds"] or 0
+        media = [(row["media_type"], row[key + "_id"])]
+        if row["track__artist_id"]:
+            media.append(("Artist", row["track__artist_id"]))
+        for media_type, media_id in media:
+            total = totals[(media_type, media_id, local_date)]
+            total[0] += 1
+            total[1] += seconds
+
+    rollups = [
+        ScrobbleRollup(
+            user_id=user_id,
+            media_type=media_type,
+            media_id=media_id,
+            local_date=local_date,
+            play_count=play_count,
+            seconds=seconds,
+        )
+        for (media_type, media_id, local_date), [play_count, seconds] in (
+            totals.items()
+        )
+    ]
+    with transaction.atomic():
+        stale_rollups.delete()
+        ScrobbleRollup.objects.bulk_create(rollups, batch_size=1000)
+
+    from scrobbles.chart_cache import invalidate_charts
+
+    invalidate_charts(user_id, dates, tz)
+
+    logger.info(
+        "[rollups] refreshed",
+        extra={
+            "user_id": user_id,
+            "days": len(dates) if dates is not None else "all",
+            "rollups": len(rollups),
+        },
+    )
+    return len(rollups)
+
+
+def refresh_rollups_for_timestamps(
+    user_timestamps: Iterable[tuple[Optional[int], Optional[datetime]]],
+) -> None:
+    """Refresh the rollup day of each (user id, timestamp) pair, once per
+    user and day"""
+    user_tzs = {}
+    user_dates = defaultdict(set)
+    for user_id, timestamp in user_timestamps:
+        if not user_id or not timestamp:
+            continue
+        if user_id not in user_tzs:
+            user_tzs[user_id] = get_user_tz(user_id)
+        user_dates[user_id].add(timestamp.astimezone(user_tzs[user_id]).date())
+
+    for user_id, dates in user_dates.items():
+        refresh_rollups(user_id, dates)
+
+
+def refresh_rollups_for_scrobbles(scrobbles: Iterable) -> None:
+    """Refresh the rollup days touched by the given scrobbles"""
+    refresh_rollups_for_timestamps(
+        (scrobble.user_id, scrobble.timestamp) for scrobble in scrobbles
+    )
+
+
+def refresh_rollups_on_commit(
+    user_timestamps: Iterable[tuple[Optional[int], Optional[datetime]]],
+) -> None:
+    """Refresh the rollup days of the given (user id, timestamp) pairs when
+    the transaction commits, so a day saved many times in one transaction
+    is only rebuilt once"""
+    if getattr(_pending, "user_timestamps", None) is None:
+        _pending.user_timestamps = set()
+    _pending.user_timestamps.update(user_timestamps)
+    # Days left over from a rolled back transaction are refreshed with the
+    # next one that commits, which does no harm
+    transaction.on_commit(refresh_pending_rollups)
+
+
+def refresh_pending_rollups() -> None:
+    user_timestamps = getattr(_pending, "user_timestamps", None)
+    _pending.user_timestamps = None
+    if user_timestamps:
+        refresh_rollups_for_timestamps(user_timestamps)
+
+
+def chart_from_rollups(
+    rollups: models.QuerySet,
+    media_model: models.Model,
+    count_attr: str = "num_scrobbles",
+    limit: Optional[int] = None,
+) -> list:
+    """Sum play counts of a rollup queryset per media item, returning the
+    media objects in chart order with the count set on `count_attr`"""
+    totals = (
+        rollups.values("media_id")
+        .annotate(play_count=models.Sum("play_count"))
+        .order_by("-play_count", "media_id")
+    )
+    if limit:
+        totals = totals[:limit]
+    totals = list(totals)
+
+    media = media_model.objects.in_bulk([row["media_id"] for row in totals])
+    chart = []
+    for row in totals:
+        media_obj = media.get(row["media_id"])
+        if not media_obj:
+            continue
+        setattr(media_obj, count_attr, row["play_count"])
+        chart.append(media_obj)
+    return chart
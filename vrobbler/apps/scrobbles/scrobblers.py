@@ -1,6 +1,8 @@
 import json
 import logging
-from typing import Optional
+from itertools import chain
+from typing import Iterable, Optional
+from uuid import uuid4
 
 import pendulum
 import pytz
@@ -8,15 +10,18 @@ from boardgames.models import BoardGame
 from books.models import Book
 from dateutil.parser import parse
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from locations.constants import LOCATION_PROVIDERS
-from locations.models import GeoLocation
+from locations.models import GeoLocation, LocationPing, summarize_pings
+from locations.tracks import GPSPoint, find_stays
 from music.constants import JELLYFIN_POST_KEYS, MOPIDY_POST_KEYS
 from music.models import Track
 from music.utils import get_or_create_track
 from podcasts.utils import get_or_create_podcast
 from scrobbles.constants import JELLYFIN_AUDIO_ITEM_TYPES
-from scrobbles.models import Scrobble
+from scrobbles.models import ActiveScrobble, Scrobble
+from scrobbles.rollups import get_user_tz, refresh_rollups_for_scrobbles
 from sports.models import SportEvent
 from sports.thesportsdb import lookup_event_from_thesportsdb
 from videogames.howlongtobeat import lookup_game_from_hltb
@@ -279,6 +284,8 @@ def manual_scrobble_webpage(url: str, user_id: int):
 
 
 def gpslogger_scrobble_location(data_dict: dict, user_id: int) -> Scrobble:
+    # Finding the location truncates the coordinates in place
+    lat, lon = data_dict.get("lat"), data_dict.get("lon")
     location = GeoLocation.find_or_create(data_dict)
 
     timestamp = pendulum.parse(data_dict.get("time", timezone.now()))
@@ -297,14 +304,16 @@ def gpslogger_scrobble_location(data_dict: dict, user_id: int) -> Scrobble:
 
     provider = LOCATION_PROVIDERS[data_dict.get("prov")]
 
-    if "gps_updates" not in scrobble.log.keys():
-        scrobble.log["gps_updates"] = []
-
-    scrobble.log["gps_updates"].append(
-        {
-            "timestamp": data_dict.get("time"),
-            "position_provider": provider,
-        }
+    ping = LocationPing.objects.create(
+        scrobble=scrobble,
+        timestamp=timestamp,
+        lat=lat,
+        lon=lon,
+        provider=data_dict.get("prov"),
+    )
+    scrobble.log = scrobble.log or {}
+    scrobble.log["gps_pings"] = summarize_pings(
+        scrobble.log.get("gps_pings"), [ping]
     )
     if scrobble.timestamp:
         scrobble.playback_position_seconds = (
@@ -327,6 +336,157 @@ def gpslogger_scrobble_location(data_dict: dict, user_id: int) -> Scrobble:
     return scrobble
 
 
+def gpslogger_scrobble_track(
+    points: Iterable[GPSPoint], user_id: int
+) -> list[Scrobble]:
+    """Turn a buffered GPSLogger track into location scrobbles
+
+    The track is split into stays in one pass over its points. Points at the
+    user's current location carry on that scrobble, and every other stay
+    becomes a scrobble, all written with one bulk insert. The last one is
+    left in progress, as a single GPSLogger ping would leave it, unless the
+    user already has a later location.
+    """
+    points = iter(points)
+    first_point = next(points, None)
+    if not first_point:
+        return []
+
+    location_scrobbles = Scrobble.objects.filter(
+        media_type=Scrobble.MediaType.GEO_LOCATION, user_id=user_id
+    )
+    current = (
+        location_scrobbles.filter(
+            in_progress=True, timestamp__lte=first_point.timestamp
+        )
+        .select_related("geo_location")
+        .order_by("-timestamp")
+        .first()
+    )
+    current_point = None
+    if current and current.geo_location:
+        current_point = GPSPoint(
+            timestamp=current.timestamp,
+            lat=current.geo_location.lat,
+            lon=current.geo_location.lon,
+        )
+
+    stays = list(find_stays(chain([first_point], points), current_point))
+    continued = stays.pop(0) if current_point else None
+    locations = GeoLocation.find_or_create_many([stay.point for stay in stays])
+
+    # Truncating coordinates can land neighbouring stays on one location
+    merged = []
+    for stay, location in zip(stays, locations):
+        previous = (
+            merged[-1]
+            if merged
+            else (continued, current and current.geo_location)
+        )
+        if previous[0] and previous[1] == location:
+            previous[0].end = stay.end
+            previous[0].pings.extend(stay.pings)
+            continue
+        merged.append((stay, location))
+
+    if continued:
+        current.playback_position_seconds = int(
+            (continued.end - current.timestamp).total_seconds()
+        )
+        current.log = current.log or {}
+        current.log["gps_pings"] = summarize_pings(
+            current.log.get("gps_pings"), continued.pings
+        )
+
+    def pings(scrobble, stay) -> list[LocationPing]:
+        return [
+            LocationPing(
+                scrobble=scrobble,
+                timestamp=ping.timestamp,
+                lat=ping.lat,
+                lon=ping.lon,
+                provider=ping.provider or None,
+            )
+            for ping in stay.pings
+        ]
+
+    if not merged:
+        if current:
+            with transaction.atomic():
+                current.save(
+                    update_fields=["log", "playback_position_seconds"]
+                )
+                LocationPing.objects.bulk_create(
+                    pings(current, continued), batch_size=1000
+                )
+        return [current] if current else []
+
+    ongoing = not location_scrobbles.filter(
+        timestamp__gt=merged[-1][0].start
+    ).exists()
+    timezone_name = get_user_tz(user_id).zone
+    new_scrobbles = []
+    for index, (stay, location) in enumerate(merged):
+        in_progress = ongoing and index == len(merged) - 1
+        new_scrobbles.append(
+            Scrobble(
+                uuid=uuid4(),
+                user_id=user_id,
+                geo_location=location,
+                media_type=Scrobble.MediaType.GEO_LOCATION,
+                source="GPSLogger",
+                timestamp=stay.start.replace(microsecond=0),
+                stop_timestamp=None if in_progress else stay.end,
+                playback_position_seconds=int(
+                    (stay.end - stay.start).total_seconds()
+                ),
+                in_progress=in_progress,
+                played_to_completion=not in_progress,
+                timezone=timezone_name,
+                log={"gps_pings": summarize_pings(None, stay.pings)},
+            )
+        )
+
+    with transaction.atomic():
+        if continued:
+            current.stop_timestamp = continued.end
+            current.in_progress = False
+            current.played_to_completion = True
+            current.save(
+                update_fields=[
+                    "log",
+                    "playback_position_seconds",
+                    "stop_timestamp",
+                    "in_progress",
+                    "played_to_completion",
+                ]
+            )
+            ActiveScrobble.discard(current)
+        created = Scrobble.objects.bulk_create(new_scrobbles, batch_size=500)
+        if ongoing:
+            ActiveScrobble.record(created[-1])
+
+        new_pings = pings(current, continued) if continued else []
+        for scrobble, (stay, _) in zip(created, merged):
+            new_pings.extend(pings(scrobble, stay))
+        LocationPing.objects.bulk_create(new_pings, batch_size=1000)
+
+    # Bulk created scrobbles skip post_save, so roll them up here
+    refresh_rollups_for_scrobbles(
+        [scrobble for scrobble in created if scrobble.played_to_completion]
+    )
+    logger.info(
+        "[webhook] gpslogger track received",
+        extra={
+            "user_id": user_id,
+            "continued_scrobble_id": current.id if continued else None,
+            "scrobbles": len(created),
+            "media_type": Scrobble.MediaType.GEO_LOCATION,
+        },
+    )
+    return ([current] if continued else []) + created
+
+
 def web_scrobbler_scrobble_video_or_song(
     data_dict: dict, user_id: Optional[int]
 ) -> Scrobble:
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from scrobbles.models import Scrobble
+from scrobbles.rollups import refresh_rollups_on_commit
+
+# Saves that can move a completed scrobble in or out of the rollups
+ROLLUP_FIELDS = {
+    "played_to_completion",
+    "playback_position_seconds",
+    "timestamp",
+    "user",
+    "media_type",
+}
+
+
+@receiver(post_save, sender=Scrobble)
+def refresh_scrobble_rollups(
+    sender, instance, created, update_fields, **kwargs
+):
+    if update_fields is not None and not ROLLUP_FIELDS.intersection(
+        update_fields
+    ):
+        return
+    previous = getattr(instance, "_rollup_state", None)
+    current = instance._rollup_state = instance.rollup_state()
+    was_completed = previous is not None and previous.played_to_completion
+    if (
+        not current.played_to_completion
+        and not was_completed
+        and "played_to_completion" not in (update_fields or ())
+    ):
+        return
+
+    user_timestamps = {(current.user_id, current.timestamp)}
+    # A scrobble moved to another day or user also leaves its old day
+    if was_completed:
+        user_timestamps.add((previous.user_id, previous.timestamp))
+    refresh_rollups_on_commit(user_timestamps)
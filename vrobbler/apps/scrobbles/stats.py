@@ -1,14 +1,15 @@
 import calendar
 import logging
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 from typing import Optional
 
 import pytz
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q
 from django.utils import timezone
+from scrobbles.rollups import chart_from_rollups, refresh_rollups
 
 User = get_user_model()
 
@@ -32,12 +33,12 @@ def get_scrobble_count_qs(
     day: Optional[int] = None,
     user=None,
     model_str="Track",
-) -> dict[str, int]:
-    tz = settings.TIME_ZONE
-    if user and user.is_authenticated:
-        tz = pytz.timezone(user.profile.timezone)
-
-    tz = pytz.utc
+) -> list:
+    """Media items ranked by completed scrobbles in a period, each with a
+    `scrobble_count`, summed from the user's daily rollups"""
+    ScrobbleRollup = apps.get_model(
+        app_label="scrobbles", model_name="ScrobbleRollup"
+    )
     data_model = apps.get_model(app_label="music", model_name="Track")
     if model_str == "Artist":
         data_model = apps.get_model(app_label="music", model_name="Artist")
@@ -52,60 +53,33 @@ def get_scrobble_count_qs(
             app_label="locations", model_name="GeoLocation"
         )
 
-    if model_str == "Artist":
-        base_qs = data_model.objects.filter(
-            track__scrobble__user=user,
-            track__scrobble__played_to_completion=True,
-        )
-    else:
-        base_qs = data_model.objects.filter(
-            scrobble__user=user,
-            scrobble__played_to_completion=True,
-        )
+    rollups = ScrobbleRollup.objects.filter(
+        user=user, media_type=data_model.__name__
+    )
 
-    # Returna all media items with scrobble count annotated
+    # Return all media items with scrobble count annotated
     if not year:
-        return base_qs.annotate(scrobble_count=Count("scrobble")).order_by(
-            "-scrobble_count"
-        )
+        return chart_from_rollups(rollups, data_model, "scrobble_count")
 
-    start = datetime(year, 1, 1, tzinfo=tz)
-    end = datetime(year, 12, 31, tzinfo=tz)
+    start = date(year, 1, 1)
+    end = date(year, 12, 31)
 
     if year and day and month:
         logger.debug("Filtering by year, month and day")
-        start = datetime(year, month, day, 0, 0, tzinfo=tz)
-        end = datetime(year, month, day, 23, 59, tzinfo=tz)
+        start = date(year, month, day)
+        end = start
     elif year and week:
         logger.debug("Filtering by year and week")
-        start, end = get_start_end_dates_by_week(year, week, tz)
+        start, end = get_start_end_dates_by_week(year, week, pytz.utc)
+        start, end = start.date(), end.date()
     elif month:
         logger.debug("Filtering by month")
         end_day = calendar.monthrange(year, month)[1]
-        start = datetime(year, month, 1, tzinfo=tz)
-        end = datetime(year, month, end_day, tzinfo=tz)
+        start = date(year, month, 1)
+        end = date(year, month, end_day)
 
-    if model_str == "Artist":
-        scrobble_date_filter = Q(
-            track__scrobble__timestamp__gte=start,
-            track__scrobble__timestamp__lte=end,
-        )
-        qs = (
-            base_qs.filter(scrobble_date_filter)
-            .annotate(scrobble_count=Count("track__scrobble", distinct=True))
-            .order_by("-scrobble_count")
-        )
-    else:
-        scrobble_date_filter = Q(
-            scrobble__timestamp__gte=start, scrobble__timestamp__lte=end
-        )
-        qs = (
-            base_qs.filter(scrobble_date_filter)
-            .annotate(scrobble_count=Count("scrobble", distinct=True))
-            .order_by("-scrobble_count")
-        )
-
-    return qs
+    rollups = rollups.filter(local_date__gte=start, local_date__lte=end)
+    return chart_from_rollups(rollups, data_model, "scrobble_count")
 
 
 def build_charts(
@@ -120,11 +94,7 @@ def build_charts(
         app_label="scrobbles", model_name="ChartRecord"
     )
     results = get_scrobble_count_qs(year, month, week, day, user, model_str)
-    unique_counts = list(set([result.scrobble_count for result in results]))
-    unique_counts.sort(reverse=True)
-    ranks = {}
-    for rank, count in enumerate(unique_counts, start=1):
-        ranks[count] = rank
+    ranks = dense_ranks(result.scrobble_count for result in results)
 
     chart_records = []
     for result in results:
@@ -163,6 +133,9 @@ def build_yesterdays_charts_for_user(user: "User", model_str="Track") -> None:
         f"Generating charts for yesterday ({yesterday.date()}) for {user}"
     )
 
+    # Heal yesterday's rollups in case any scrobbles changed behind our back
+    refresh_rollups(user.id, [yesterday.date()])
+
     # Always build yesterday's chart
     ChartRecord.build(
         user,
@@ -200,41 +173,112 @@ def build_yesterdays_charts_for_user(user: "User", model_str="Track") -> None:
         ChartRecord.build(user, year=yesterday.year, model_str=model_str)
 
 
-def build_missing_charts_for_user(user: "User", model_str="Track") -> None:
-    """"""
+CHART_MEDIA_FIELDS = {"Track": "track", "Artist": "artist", "Video": "video"}
+
+
+def dense_ranks(counts) -> dict[int, int]:
+    """Map each distinct count to its rank, ties sharing a rank"""
+    unique_counts = sorted(set(counts), reverse=True)
+    return {count: rank for rank, count in enumerate(unique_counts, start=1)}
+
+
+def chart_periods_for_date(day: date) -> list[tuple]:
+    """The (year, month, week, day) chart keys a local date falls in
+
+    Weeks are ISO weeks, keyed by their ISO year."""
+    iso_year, iso_week, _ = day.isocalendar()
+    return [
+        (day.year, day.month, None, day.day),
+        (iso_year, None, iso_week, None),
+        (day.year, day.month, None, None),
+        (day.year, None, None, None),
+    ]
+
+
+def chart_period_end(period: tuple) -> date:
+    year, month, week, day = period
+    if day:
+        return date(year, month, day)
+    if week:
+        return date.fromisocalendar(year, week, 7)
+    if month:
+        return date(year, month, calendar.monthrange(year, month)[1])
+    return date(year, 12, 31)
+
+
+def build_missing_charts_for_user(user: "User", model_str="Track") -> int:
+    """Backfill every finished day, week, month and year chart for a user
+
+    All periods are ranked in a single pass over the user's daily rollups
+    and written with one bulk_create per period type. Periods that already
+    have charts are skipped, so an interrupted backfill resumes where it
+    left off when run again. Returns the number of chart records written.
+    """
     ChartRecord = apps.get_model(
         app_label="scrobbles", model_name="ChartRecord"
     )
-    Scrobble = apps.get_model(app_label="scrobbles", model_name="Scrobble")
+    ScrobbleRollup = apps.get_model(
+        app_label="scrobbles", model_name="ScrobbleRollup"
+    )
+    media_field = CHART_MEDIA_FIELDS[model_str]
 
     logger.info(f"Generating historical charts for {user}")
     tz = pytz.timezone(settings.TIME_ZONE)
     if user and user.is_authenticated:
         tz = pytz.timezone(user.profile.timezone)
-    now = timezone.now().astimezone(tz)
+    today = timezone.now().astimezone(tz).date()
 
-    first_scrobble = (
-        Scrobble.objects.filter(user=user, played_to_completion=True)
-        .order_by("created")
-        .first()
+    existing_periods = set(
+        ChartRecord.objects.filter(
+            user=user, **{f"{media_field}__isnull": False}
+        )
+        .values_list("year", "month", "week", "day")
+        .distinct()
     )
 
-    start_date = first_scrobble.timestamp
-    days_since = (now - start_date).days
-
-    for day_num in range(0, days_since):
-        build_date = start_date + timedelta(days=day_num)
-        logger.info(f"Generating chart batch for {build_date}")
-        ChartRecord.build(user=user, year=build_date.year)
-        ChartRecord.build(
-            user=user, year=build_date.year, week=build_date.isocalendar()[1]
+    period_counts = defaultdict(lambda: defaultdict(int))
+    rollups = (
+        ScrobbleRollup.objects.filter(
+            user=user, media_type=model_str, local_date__lt=today
         )
-        ChartRecord.build(
-            user=user, year=build_date.year, month=build_date.month
+        .order_by("local_date")
+        .values_list("local_date", "media_id", "play_count")
+    )
+    for local_date, media_id, play_count in rollups.iterator(chunk_size=5000):
+        for period in chart_periods_for_date(local_date):
+            if period not in existing_periods:
+                period_counts[period][media_id] += play_count
+
+    records_by_type = defaultdict(list)
+    for period, counts in period_counts.items():
+        # Only finished periods get charts, the daily task does the rest
+        if chart_period_end(period) >= today:
+            continue
+        year, month, week, day = period
+        period_type = (
+            "day" if day else "week" if week else "month" if month else "year"
         )
-        ChartRecord.build(
-            user=user,
-            year=build_date.year,
-            month=build_date.month,
-            day=build_date.day,
+        ranks = dense_ranks(counts.values())
+        for media_id, count in counts.items():
+            records_by_type[period_type].append(
+                ChartRecord(
+                    user=user,
+                    year=year,
+                    month=month,
+                    week=week,
+                    day=day,
+                    rank=ranks[count],
+                    count=count,
+                    **{f"{media_field}_id": media_id},
+                )
+            )
+
+    created = 0
+    for period_type in ["day", "week", "month", "year"]:
+        records = records_by_type[period_type]
+        logger.info(
+            f"Writing {len(records)} {period_type} chart records for {user}"
         )
+        ChartRecord.objects.bulk_create(records, batch_size=500)
+        created += len(records)
+    return created
@@ -1,13 +1,23 @@
 import logging
+from datetime import timedelta
 
 from celery import shared_task
 from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from scrobbles.stats import build_yesterdays_charts_for_user
+from django.db import transaction
+from django.utils import timezone
+from scrobbles.lookup_cache import logged_lookup_stats
+from scrobbles.progress import flush_progress
+from scrobbles.stats import build_charts, build_yesterdays_charts_for_user
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+WEBHOOK_INBOX_RETENTION_DAYS = int(
+    getattr(settings, "WEBHOOK_INBOX_RETENTION_DAYS", 7)
+)
+
 
 @shared_task
 def process_retroarch_import(import_id):
@@ -16,7 +26,8 @@ def process_retroarch_import(import_id):
     if not retroarch_import:
         logger.warn(f"RetroarchImport not found with id {import_id}")
 
-    retroarch_import.process()
+    with logged_lookup_stats(str(retroarch_import)):
+        retroarch_import.process()
 
 
 @shared_task
@@ -26,7 +37,8 @@ def process_lastfm_import(import_id):
     if not lastfm_import:
         logger.warn(f"LastFmImport not found with id {import_id}")
 
-    lastfm_import.process()
+    with logged_lookup_stats(str(lastfm_import)):
+        lastfm_import.process()
 
 
 @shared_task
@@ -38,7 +50,8 @@ def process_tsv_import(import_id):
     if not tsv_import:
         logger.warn(f"AudioScrobblerTSVImport not found with id {import_id}")
 
-    tsv_import.process()
+    with logged_lookup_stats(str(tsv_import)):
+        tsv_import.process()
 
 
 @shared_task
@@ -48,10 +61,83 @@ def process_koreader_import(import_id):
     if not koreader_import:
         logger.warn(f"KOReaderImport not found with id {import_id}")
 
-    koreader_import.process()
+    with logged_lookup_stats(str(koreader_import)):
+        koreader_import.process()
 
 
 @shared_task
 def create_yesterdays_charts():
     for user in User.objects.all():
         build_yesterdays_charts_for_user(user)
+
+
+@shared_task
+def refresh_chart_cache(user_id):
+    # The chart cache reads live charts, which need the scrobble models
+    from scrobbles.chart_cache import (
+        build_chart_cache,
+        chart_refresh_lock_key,
+        get_chart_cache,
+    )
+
+    # Let charts invalidated while this runs queue another refresh
+    get_chart_cache().delete(chart_refresh_lock_key(user_id))
+    build_chart_cache(user_id)
+
+
+@shared_task
+def build_chart_records(user_id, model_str, **params):
+    user = User.objects.filter(id=user_id).first()
+    if not user:
+        logger.warn(f"User not found with id {user_id}")
+        return
+    build_charts(user=user, model_str=model_str, **params)
+
+
+@shared_task
+def process_webhook_inbox(user_id):
+    """Apply a user's pending webhooks in the order they arrived
+
+    Each entry is processed while holding a row lock on it, and only by the
+    worker that locked the oldest pending one. Another worker finding that
+    row locked leaves the inbox alone, and the worker holding it keeps going
+    until the inbox is empty, including entries queued in the meantime.
+    """
+    WebhookInbox = apps.get_model("scrobbles", "WebhookInbox")
+    pending = WebhookInbox.objects.filter(
+        user_id=user_id, status=WebhookInbox.Status.PENDING
+    ).order_by("id")
+
+    while True:
+        with transaction.atomic():
+            oldest_id = pending.values_list("id", flat=True).first()
+            if oldest_id is None:
+                return
+            entry = pending.select_for_update(skip_locked=True).first()
+            if not entry or entry.id != oldest_id:
+                logger.info(
+                    "[process_webhook_inbox] inbox already being processed",
+                    extra={"user_id": user_id},
+                )
+                return
+            entry.process()
+
+
+@shared_task
+def purge_webhook_inbox():
+    """Delete processed webhooks older than WEBHOOK_INBOX_RETENTION_DAYS,
+    keeping failed ones around to look into"""
+    WebhookInbox = apps.get_model("scrobbles", "WebhookInbox")
+    cutoff = timezone.now() - timedelta(days=WEBHOOK_INBOX_RETENTION_DAYS)
+    purged, _ = WebhookInbox.objects.filter(
+        status=WebhookInbox.Status.PROCESSED, processed_at__lt=cutoff
+    ).delete()
+    logger.info(
+        "[purge_webhook_inbox] purged processed webhooks",
+        extra={"purged": purged},
+    )
+
+
+@shared_task
+def flush_progress_buffer():
+    flush_progress()
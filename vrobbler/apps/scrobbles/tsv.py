@@ -1,33 +1,84 @@
 import codecs
 import csv
 import logging
-from datetime import datetime
+from typing import Callable, Optional
 
 import pytz
 import requests
-from music.utils import (
-    get_or_create_album,
-    get_or_create_artist,
-    get_or_create_track,
-)
+from django.conf import settings
+from django.db import transaction
+from music.utils import bulk_get_or_create_tracks, track_dict_key
 from scrobbles.constants import AsTsvColumn
 from scrobbles.models import Scrobble
-
-from vrobbler.apps.scrobbles.utils import timestamp_user_tz_to_utc
+from scrobbles.utils import (
+    get_existing_track_scrobbles,
+    timestamp_user_tz_to_utc,
+)
 
 logger = logging.getLogger(__name__)
 
+TSV_IMPORT_CHUNK_SIZE = int(getattr(settings, "TSV_IMPORT_CHUNK_SIZE", 1000))
+
+
+def build_tsv_scrobbles(
+    played_rows: list[dict], user_id: int, source: str, rockbox_info: str
+) -> list[Scrobble]:
+    """Resolve the music for a chunk of played rows and build the scrobbles
+    we don't already have, without saving them"""
+    tracks = bulk_get_or_create_tracks(played_rows)
+    existing = get_existing_track_scrobbles(
+        user_id,
+        [row["timestamp"] for row in played_rows],
+        [track.id for track in tracks.values()],
+    )
 
-def process_audioscrobbler_tsv_file(file_path, user_id, user_tz=None):
-    """Takes a path to a file of TSV data and imports it as past scrobbles"""
     new_scrobbles = []
+    for row in played_rows:
+        track = tracks[track_dict_key(row)]
+        new_scrobble = Scrobble(
+            user_id=user_id,
+            timestamp=row["timestamp"],
+            source=source,
+            log={"rockbox_info": rockbox_info},
+            track=track,
+            played_to_completion=True,
+            in_progress=False,
+            media_type=Scrobble.MediaType.TRACK,
+        )
+        if (row["timestamp"], track.id) in existing:
+            logger.debug(f"Skipping existing scrobble {new_scrobble}")
+            continue
+        existing.add((row["timestamp"], track.id))
+        logger.debug(f"Queued scrobble {new_scrobble} for creation")
+        new_scrobbles.append(new_scrobble)
+
+    return new_scrobbles
+
+
+def process_audioscrobbler_tsv_file(
+    file_path,
+    user_id,
+    user_tz=None,
+    start_row: int = 0,
+    chunk_size: Optional[int] = None,
+    on_chunk: Optional[Callable] = None,
+) -> int:
+    """Takes a path to a file of TSV data and imports it as past scrobbles
+
+    The file is streamed and committed every `chunk_size` rows. After each
+    commit `on_chunk(created_scrobbles, next_row)` is called inside the same
+    transaction, so a checkpoint saved there always matches what was
+    imported. Rows before `start_row` are skipped, to resume from such a
+    checkpoint. Returns the number of scrobbles created.
+    """
     if not user_tz:
         user_tz = pytz.utc
+    chunk_size = chunk_size or TSV_IMPORT_CHUNK_SIZE
 
     is_os_file = "https://" not in file_path
 
     if not is_os_file:
-        r = requests.get(file_path)
+        r = requests.get(file_path, stream=True)
         tsv_data = codecs.iterdecode(r.iter_lines(), "utf-8")
     else:
         tsv_data = open(file_path)
@@ -35,67 +86,81 @@ def process_audioscrobbler_tsv_file(file_path, user_id, user_tz=None):
     source = "Audioscrobbler File"
     rows = csv.reader(tsv_data, delimiter="\t")
 
+    created_count = 0
     rockbox_info = ""
+    played_rows = []
+    next_row = start_row
+
+    def commit_chunk():
+        nonlocal created_count, played_rows
+        # Remote lookups happen out here, to keep the transaction short
+        new_scrobbles = build_tsv_scrobbles(
+            played_rows, user_id, source, rockbox_info
+        )
+        with transaction.atomic():
+            created = Scrobble.objects.bulk_create(new_scrobbles)
+            if on_chunk:
+                on_chunk(created, next_row)
+        created_count += len(created)
+        played_rows = []
+        logger.info(
+            "[process_audioscrobbler_tsv_file] committed chunk",
+            extra={
+                "user_id": user_id,
+                "next_row": next_row,
+                "created_count": len(created),
+            },
+        )
+
     for row_num, row in enumerate(rows):
         if row_num in [0, 1, 2]:
             if "Rockbox" in row[0]:
                 source = "Rockbox"
             rockbox_info += row[0] + "\n"
             continue
+        if row_num < start_row:
+            continue
+        next_row = row_num + 1
+
         if len(row) > 8:
             logger.warning(
                 "Improper row length during Audioscrobbler import",
                 extra={"row": row},
             )
             continue
-
-        artist = get_or_create_artist(row[AsTsvColumn["ARTIST_NAME"].value])
-        album = get_or_create_album(
-            row[AsTsvColumn["ALBUM_NAME"].value], artist
-        )
-
-        track = get_or_create_track(
-            title=row[AsTsvColumn["TRACK_NAME"].value],
-            mbid=row[AsTsvColumn["MB_ID"].value],
-            artist=artist,
-            album=album,
-            run_time_seconds=int(row[AsTsvColumn["RUN_TIME_SECONDS"].value]),
-        )
         if row[AsTsvColumn["COMPLETE"].value] == "S":
             logger.info(
-                f"Skipping track {track} by {artist} because not finished"
+                f"Skipping track {row[AsTsvColumn['TRACK_NAME'].value]} by "
+                f"{row[AsTsvColumn['ARTIST_NAME'].value]} because not finished"
             )
             continue
 
-        timestamp = timestamp_user_tz_to_utc(
-            int(row[AsTsvColumn["TIMESTAMP"].value]), user_tz
+        mbid = ""
+        if len(row) > AsTsvColumn["MB_ID"].value:
+            mbid = row[AsTsvColumn["MB_ID"].value]
+        played_rows.append(
+            {
+                "artist": row[AsTsvColumn["ARTIST_NAME"].value],
+                "album": row[AsTsvColumn["ALBUM_NAME"].value],
+                "title": row[AsTsvColumn["TRACK_NAME"].value],
+                "mbid": mbid,
+                "run_time_seconds": int(
+                    row[AsTsvColumn["RUN_TIME_SECONDS"].value]
+                ),
+                "timestamp": timestamp_user_tz_to_utc(
+                    int(row[AsTsvColumn["TIMESTAMP"].value]), user_tz
+                ),
+            }
         )
+        if len(played_rows) >= chunk_size:
+            commit_chunk()
 
-        new_scrobble = Scrobble(
-            user_id=user_id,
-            timestamp=timestamp,
-            source=source,
-            log={"rockbox_info": rockbox_info}
-            track=track,
-            played_to_completion=True,
-            in_progress=False,
-            media_type=Scrobble.MediaType.TRACK,
-        )
-        existing = Scrobble.objects.filter(
-            timestamp=timestamp, track=track
-        ).first()
-        if existing:
-            logger.debug(f"Skipping existing scrobble {new_scrobble}")
-            continue
-        logger.debug(f"Queued scrobble {new_scrobble} for creation")
-        new_scrobbles.append(new_scrobble)
+    # Always commit the tail, even if empty, so the checkpoint reaches the
+    # end of the file
+    commit_chunk()
 
     if is_os_file:
         tsv_data.close()
 
-    created = Scrobble.objects.bulk_create(new_scrobbles)
-    logger.info(
-        f"Created {len(created)} scrobbles",
-        extra={"created_scrobbles": created},
-    )
-    return created
+    logger.info(f"Created {created_count} scrobbles")
+    return created_count
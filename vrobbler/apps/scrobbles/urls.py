@@ -35,6 +35,11 @@ urlpatterns = [
         views.gps_webhook,
         name="gps-webhook",
     ),
+    path(
+        "webhook/gps/track/",
+        views.gps_track_webhook,
+        name="gps-track-webhook",
+    ),
     path(
         "webhook/jellyfin/",
         views.jellyfin_webhook,
@@ -56,6 +61,11 @@ urlpatterns = [
         views.ScrobbleTSVImportDetailView.as_view(),
         name="tsv-import-detail",
     ),
+    path(
+        "imports/tsv/<slug:slug>/progress/",
+        views.ScrobbleTSVImportProgressView.as_view(),
+        name="tsv-import-progress",
+    ),
     path(
         "imports/lastfm/<slug:slug>/",
         views.ScrobbleLastFMImportDetailView.as_view(),
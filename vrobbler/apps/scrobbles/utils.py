@@ -9,7 +9,7 @@ from django.db import models
 from django.utils import timezone
 from profiles.models import UserProfile
 from profiles.utils import now_user_timezone
-from scrobbles.constants import LONG_PLAY_MEDIA
+from scrobbles.constants import LONG_PLAY_MEDIA, MEDIA_TYPE_FOREIGN_KEYS
 from scrobbles.tasks import process_lastfm_import, process_retroarch_import
 
 logger = logging.getLogger(__name__)
@@ -55,10 +55,51 @@ def get_scrobbles_for_media(media_obj, user: User) -> models.QuerySet:
     return Scrobble.objects.filter(media_query, user=user)
 
 
+def get_existing_track_scrobbles(
+    user_id: int, timestamps: list[datetime], track_ids: list[int]
+) -> set[tuple[datetime, int]]:
+    """Load the (timestamp, track_id) pairs a user already has scrobbled
+    in one query, so imports don't check for duplicates row by row"""
+    Scrobble = apps.get_model(app_label="scrobbles", model_name="Scrobble")
+    if not timestamps or not track_ids:
+        return set()
+    return set(
+        Scrobble.objects.filter(
+            user_id=user_id,
+            timestamp__gte=min(timestamps),
+            timestamp__lte=max(timestamps),
+            track_id__in=set(track_ids),
+        ).values_list("timestamp", "track_id")
+    )
+
+
 def get_recently_played_board_games(user: User) -> dict:
     ...
 
 
+def get_long_plays_with_last_scrobble(
+    user: User, media_model: models.Model
+) -> models.QuerySet:
+    """Annotate the long play media a user has scrobbled with the timestamp
+    and completion of their latest scrobble, all in one query"""
+    Scrobble = apps.get_model(app_label="scrobbles", model_name="Scrobble")
+    key = media_class_to_foreign_key(media_model.__name__)
+    user_scrobbles = Scrobble.objects.filter(user=user)
+    latest = user_scrobbles.filter(**{key: models.OuterRef("pk")}).order_by(
+        "-timestamp", "-id"
+    )
+    return media_model.objects.filter(
+        id__in=user_scrobbles.filter(**{f"{key}__isnull": False}).values(key)
+    ).annotate(
+        last_scrobble_timestamp=models.Subquery(
+            latest.values("timestamp")[:1]
+        ),
+        last_scrobble_complete=models.Subquery(
+            latest.values("long_play_complete")[:1]
+        ),
+    )
+
+
 def get_long_plays_in_progress(user: User) -> dict:
     """Find all books where the last scrobble is not marked complete"""
     media_dict = {
@@ -68,34 +109,29 @@ def get_long_plays_in_progress(user: User) -> dict:
     now = now_user_timezone(user.profile)
     for app, model in LONG_PLAY_MEDIA.items():
         media_obj = apps.get_model(app_label=app, model_name=model)
-        for media in media_obj.objects.all():
-            last_scrobble = media.scrobble_set.filter(user=user).last()
-            if last_scrobble and last_scrobble.long_play_complete == False:
-                days_past = (now - last_scrobble.timestamp).days
-                if days_past > 7:
-                    media_dict["inactive"].append(media)
-                else:
-                    media_dict["active"].append(media)
-    media_dict["active"].reverse()
-    media_dict["inactive"].reverse()
+        for media in (
+            get_long_plays_with_last_scrobble(user, media_obj)
+            .filter(last_scrobble_complete=False)
+            .order_by("-pk")
+        ):
+            days_past = (now - media.last_scrobble_timestamp).days
+            if days_past > 7:
+                media_dict["inactive"].append(media)
+            else:
+                media_dict["active"].append(media)
     return media_dict
 
 
 def get_long_plays_completed(user: User) -> list:
-    """Find all books where the last scrobble is not marked complete"""
+    """Find all books where the last scrobble is marked complete"""
     media_list = []
     for app, model in LONG_PLAY_MEDIA.items():
         media_obj = apps.get_model(app_label=app, model_name=model)
-        for media in media_obj.objects.all():
-            if (
-                media.scrobble_set.all()
-                and media.scrobble_set.filter(user=user)
-                .order_by("timestamp")
-                .last()
-                .long_play_complete
-                == True
-            ):
-                media_list.append(media)
+        media_list.extend(
+            get_long_plays_with_last_scrobble(user, media_obj)
+            .filter(last_scrobble_complete=True)
+            .order_by("pk")
+        )
     return media_list
 
 
@@ -125,16 +161,27 @@ def import_lastfm_for_all_users(restart=False):
 
 
 def import_retroarch_for_all_users(restart=False):
-    """Grab a list of all users with Retroarch enabled and kickoff imports for them"""
+    """Grab a list of all users with Retroarch enabled and kickoff imports for
+    them, skipping anyone whose lrtl files haven't changed since last time"""
+    from videogames.retroarch import changed_lrtl_files
+
     RetroarchImport = apps.get_model("scrobbles", "RetroarchImport")
-    retroarch_enabled_user_ids = UserProfile.objects.filter(
+    retroarch_enabled_profiles = UserProfile.objects.filter(
         retroarch_path__isnull=False,
         retroarch_auto_import=True,
-    ).values_list("user_id", flat=True)
+    ).only("user_id", "retroarch_path", "retroarch_manifest")
 
     retroarch_import_count = 0
 
-    for user_id in retroarch_enabled_user_ids:
+    for profile in retroarch_enabled_profiles:
+        user_id = profile.user_id
+        if not changed_lrtl_files(
+            profile.retroarch_path, profile.retroarch_manifest
+        ):
+            logger.debug(
+                f"No Retroarch changes for user {user_id}, skipping import"
+            )
+            continue
         retroarch_import, created = RetroarchImport.objects.get_or_create(
             user_id=user_id, processed_finished__isnull=True
         )
@@ -151,6 +198,7 @@ def import_retroarch_for_all_users(restart=False):
 def delete_zombie_scrobbles(dry_run=True):
     """Look for any scrobble over a day old that is not paused and still in progress and delete it"""
     Scrobble = apps.get_model("scrobbles", "Scrobble")
+    ActiveScrobble = apps.get_model("scrobbles", "ActiveScrobble")
     now = timezone.now()
     three_days_ago = now - timedelta(days=3)
 
@@ -165,7 +213,10 @@ def delete_zombie_scrobbles(dry_run=True):
 
     if not dry_run:
         logger.info(f"Deleted {zombies_found} zombie scrobbles")
-        zombie_scrobbles.delete()
+        ActiveScrobble.objects.filter(
+            scrobble_id__in=zombie_scrobbles.values("id")
+        ).delete()
+        zombie_scrobbles.delete_with_rollups()
         return zombies_found
 
     logger.info(
@@ -175,4 +226,6 @@ def delete_zombie_scrobbles(dry_run=True):
 
 
 def media_class_to_foreign_key(media_class: str) -> str:
+    if media_class in MEDIA_TYPE_FOREIGN_KEYS:
+        return MEDIA_TYPE_FOREIGN_KEYS[media_class]
     return re.sub(r"(?<!^)(?=[A-Z])", "_", media_class).lower()
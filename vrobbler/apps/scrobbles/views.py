@@ -2,22 +2,30 @@ import calendar
 import json
 import logging
 from datetime import datetime, timedelta
+from xml.etree import ElementTree
 
 import pytz
 from django.apps import apps
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Count, Q
 from django.db.models.query import QuerySet
-from django.http import FileResponse, HttpResponseRedirect, JsonResponse
+from django.http import (
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import DetailView, FormView, TemplateView
 from django.views.generic.edit import CreateView
 from django.views.generic.list import ListView
-from music.aggregators import live_charts, scrobble_counts, week_of_scrobbles
+from locations.tracks import parse_track, track_format
+from music.aggregators import scrobble_counts, week_of_scrobbles
 from rest_framework import status
 from rest_framework.decorators import (
     api_view,
@@ -28,6 +36,10 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from scrobbles.api import serializers
+from scrobbles.chart_cache import (
+    enqueue_chart_record_build,
+    get_cached_charts,
+)
 from scrobbles.constants import (
     LONG_PLAY_MEDIA,
     MANUAL_SCROBBLE_FNS,
@@ -36,18 +48,21 @@ from scrobbles.constants import (
 from scrobbles.export import export_scrobbles
 from scrobbles.forms import ExportScrobbleForm, ScrobbleForm
 from scrobbles.models import (
+    ActiveScrobble,
     AudioScrobblerTSVImport,
     ChartRecord,
     KoReaderImport,
     LastFmImport,
     RetroarchImport,
     Scrobble,
+    WebhookInbox,
 )
 from scrobbles.scrobblers import *
 from scrobbles.tasks import (
     process_koreader_import,
     process_lastfm_import,
     process_tsv_import,
+    process_webhook_inbox,
 )
 from scrobbles.utils import (
     get_long_plays_completed,
@@ -86,7 +101,7 @@ class ScrobbleableDetailView(DetailView):
         if not self.request.user.is_anonymous:
             context_data["scrobbles"] = self.object.scrobble_set.filter(
                 user=self.request.user
-            )
+            ).with_media()
         return context_data
 
 
@@ -110,7 +125,7 @@ class RecentScrobbleList(ListView):
 
             completed_for_user = Scrobble.objects.filter(
                 played_to_completion=True, user=user
-            )
+            ).with_media()
             data["long_play_in_progress"] = get_long_plays_in_progress(user)
             data["play_again"] = get_recently_played_board_games(user)
             data["video_scrobble_list"] = completed_for_user.filter(
@@ -148,9 +163,11 @@ class RecentScrobbleList(ListView):
         return data
 
     def get_queryset(self):
-        return Scrobble.objects.filter(
-            track__isnull=False, in_progress=False
-        ).order_by("-timestamp")[:15]
+        return (
+            Scrobble.objects.filter(track__isnull=False, in_progress=False)
+            .with_media()
+            .order_by("-timestamp")[:15]
+        )
 
 
 class ScrobbleLongPlaysView(TemplateView):
@@ -190,6 +207,7 @@ class ScrobbleImportListView(TemplateView):
 
 class BaseScrobbleImportDetailView(DetailView):
     slug_field = "uuid"
+    paginate_by = 100
     template_name = "scrobbles/import_detail.html"
 
     def get_queryset(self):
@@ -207,6 +225,9 @@ class BaseScrobbleImportDetailView(DetailView):
         if self.model == RetroarchImport:
             title = "Retroarch Import"
         context_data["title"] = title
+        context_data["page_obj"] = Paginator(
+            self.object.scrobbles(), self.paginate_by
+        ).get_page(self.request.GET.get("page"))
         return context_data
 
 
@@ -218,6 +239,27 @@ class ScrobbleTSVImportDetailView(BaseScrobbleImportDetailView):
     model = AudioScrobblerTSVImport
 
 
+class ScrobbleTSVImportProgressView(LoginRequiredMixin, DetailView):
+    """Lets the UI poll how far along a TSV import is"""
+
+    model = AudioScrobblerTSVImport
+    slug_field = "uuid"
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+    def render_to_response(self, context, **response_kwargs):
+        tsv_import = self.object
+        return JsonResponse(
+            {
+                "processing_started": tsv_import.processing_started,
+                "processed_finished": tsv_import.processed_finished,
+                "rows_processed": tsv_import.rows_processed,
+                "process_count": tsv_import.process_count or 0,
+            }
+        )
+
+
 class ScrobbleLastFMImportDetailView(BaseScrobbleImportDetailView):
     model = LastFmImport
 
@@ -314,6 +356,25 @@ def lastfm_import(request):
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
 
+def queue_webhook(source: str, payload: dict, user_id: int) -> Response:
+    """Store a webhook payload in the inbox for celery to scrobble"""
+    if hasattr(payload, "dict"):
+        # Form encoded payloads arrive as a QueryDict
+        payload = payload.dict()
+
+    missing_keys = WebhookInbox.missing_keys(source, payload)
+    if missing_keys:
+        return Response(
+            {"missing_keys": missing_keys}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    entry = WebhookInbox.objects.create(
+        user_id=user_id, source=source, payload=payload
+    )
+    transaction.on_commit(lambda: process_webhook_inbox.delay(user_id))
+    return Response({"inbox_id": entry.id}, status=status.HTTP_202_ACCEPTED)
+
+
 @csrf_exempt
 @permission_classes([IsAuthenticated])
 @api_view(["POST"])
@@ -335,6 +396,11 @@ def jellyfin_webhook(request):
         )
         return Response({}, status=status.HTTP_304_NOT_MODIFIED)
 
+    if getattr(settings, "WEBHOOK_INGEST_ASYNC", False):
+        return queue_webhook(
+            WebhookInbox.Source.JELLYFIN, post_data, request.user.id
+        )
+
     scrobble = jellyfin_scrobble_media(post_data, request.user.id)
 
     if not scrobble:
@@ -356,6 +422,11 @@ def mopidy_webhook(request):
     except TypeError:
         data_dict = request.data
 
+    if getattr(settings, "WEBHOOK_INGEST_ASYNC", False):
+        return queue_webhook(
+            WebhookInbox.Source.MOPIDY, data_dict, request.user.id
+        )
+
     scrobble = mopidy_scrobble_media(data_dict, request.user.id)
 
     if not scrobble:
@@ -365,8 +436,8 @@ def mopidy_webhook(request):
 
 
 @csrf_exempt
-@permission_classes([IsAuthenticated])
 @api_view(["POST"])
+@permission_classes([IsAuthenticated])
 def gps_webhook(request):
     try:
         data_dict = json.loads(request.data)
@@ -378,10 +449,10 @@ def gps_webhook(request):
         json_data = json.dumps(data_dict, indent=4)
         logger.debug(f"{json_data}")
 
-    # TODO Fix this so we have to authenticate!
-    user_id = 1
-    if request.user.id:
-        user_id = request.user.id
+    user_id = request.user.id
+
+    if getattr(settings, "WEBHOOK_INGEST_ASYNC", False):
+        return queue_webhook(WebhookInbox.Source.GPSLOGGER, data_dict, user_id)
 
     scrobble = gpslogger_scrobble_location(data_dict, user_id)
 
@@ -391,6 +462,42 @@ def gps_webhook(request):
     return Response({"scrobble_id": scrobble.id}, status=status.HTTP_200_OK)
 
 
+@csrf_exempt
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def gps_track_webhook(request):
+    """Takes a whole GPSLogger track, as GPX, CSV or a JSON array of points,
+    either as the request body or as an uploaded `file`
+    """
+    filename = ""
+    content_type = request.content_type or ""
+    if content_type.startswith("multipart/form-data"):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({}, status=status.HTTP_400_BAD_REQUEST)
+        filename = upload.name
+        content_type = upload.content_type or ""
+        content = upload.read()
+    else:
+        content = request.body
+
+    user_id = request.user.id
+    points = parse_track(content, track_format(filename, content_type))
+    try:
+        scrobbles = gpslogger_scrobble_track(points, user_id)
+    except (ValueError, ElementTree.ParseError) as e:
+        logger.info(
+            "[gps_track_webhook] could not read track",
+            extra={"user_id": user_id, "error": str(e)},
+        )
+        return Response({}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(
+        {"scrobble_ids": [scrobble.id for scrobble in scrobbles]},
+        status=status.HTTP_200_OK,
+    )
+
+
 @csrf_exempt
 @permission_classes([IsAuthenticated])
 @api_view(["POST"])
@@ -556,13 +663,22 @@ def export(request):
     end = request.GET.get("end")
     logger.debug(f"Exporting all scrobbles in format {format}")
 
-    temp_file, extension = export_scrobbles(
-        start_date=start, end_date=end, format=format
-    )
+    compress = bool(request.GET.get("gzip"))
+
+    try:
+        stream, extension, content_type = export_scrobbles(
+            request.user.id,
+            start_date=start,
+            end_date=end,
+            format=format,
+            compress=compress,
+        )
+    except ImportError as e:
+        return JsonResponse({"detail": str(e)}, status=501)
 
     now = datetime.now()
     filename = f"vrobbler-export-{str(now)}.{extension}"
-    response = FileResponse(open(temp_file, "rb"))
+    response = StreamingHttpResponse(stream, content_type=content_type)
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
 
     return response
@@ -588,13 +704,10 @@ class ChartRecordView(TemplateView):
             media_filter, user=self.request.user, **kwargs
         ).order_by("rank")
 
-        if charts.count() == 0:
-            ChartRecord.build(
-                user=self.request.user, model_str=media_type, **kwargs
+        if not charts.exists():
+            enqueue_chart_record_build(
+                self.request.user.id, media_type, **kwargs
             )
-            charts = ChartRecord.objects.filter(
-                media_filter, user=self.request.user, **kwargs
-            ).order_by("rank")
         return charts
 
     def get_chart(
@@ -626,44 +739,6 @@ class ChartRecordView(TemplateView):
         context_data["artist_charts"] = {}
 
         if not date:
-            limit = 20
-            artist_params = {"user": user, "media_type": "Artist"}
-            context_data["current_artist_charts"] = {
-                "today": live_charts(
-                    **artist_params, chart_period="today", limit=limit
-                ),
-                "week": live_charts(
-                    **artist_params, chart_period="week", limit=limit
-                ),
-                "month": live_charts(
-                    **artist_params, chart_period="month", limit=limit
-                ),
-                "year": live_charts(
-                    **artist_params, chart_period="year", limit=limit
-                ),
-                "all": live_charts(**artist_params, limit=limit),
-            }
-
-            track_params = {"user": user, "media_type": "Track"}
-            context_data["current_track_charts"] = {
-                "today": live_charts(
-                    **track_params, chart_period="today", limit=limit
-                ),
-                "week": live_charts(
-                    **track_params, chart_period="week", limit=limit
-                ),
-                "month": live_charts(
-                    **track_params, chart_period="month", limit=limit
-                ),
-                "year": live_charts(
-                    **track_params, chart_period="year", limit=limit
-                ),
-                "all": live_charts(**track_params, limit=limit),
-            }
-
-            limit = 14
-            artist = {"user": user, "media_type": "Artist", "limit": limit}
-            # This is weird. They don't display properly as QuerySets, so we cast to lists
             context_data["chart_keys"] = {
                 "today": "Today",
                 "last7": "Last 7 days",
@@ -671,22 +746,10 @@ class ChartRecordView(TemplateView):
                 "year": "This year",
                 "all": "All time",
             }
-            context_data["current_artist_charts"] = {
-                "today": list(live_charts(**artist, chart_period="today")),
-                "last7": list(live_charts(**artist, chart_period="last7")),
-                "last30": list(live_charts(**artist, chart_period="last30")),
-                "year": list(live_charts(**artist, chart_period="year")),
-                "all": list(live_charts(**artist)),
-            }
-
-            track = {"user": user, "media_type": "Track", "limit": limit}
-            context_data["current_track_charts"] = {
-                "today": list(live_charts(**track, chart_period="today")),
-                "last7": list(live_charts(**track, chart_period="last7")),
-                "last30": list(live_charts(**track, chart_period="last30")),
-                "year": list(live_charts(**track, chart_period="year")),
-                "all": list(live_charts(**track)),
-            }
+            charts, building = get_cached_charts(user.id)
+            context_data["current_artist_charts"] = charts["Artist"]
+            context_data["current_track_charts"] = charts["Track"]
+            context_data["charts_building"] = building
             return context_data
 
         # Date provided, lookup past charts, returning nothing if it's now or in the future.
@@ -735,31 +798,37 @@ class ChartRecordView(TemplateView):
             media_filter, user=self.request.user, **params
         ).order_by("rank")
 
-        if track_charts.count() == 0 and not in_progress:
-            ChartRecord.build(
-                user=self.request.user, model_str="Track", **params
-            )
-            media_filter = self.get_media_filter("Track")
-            track_charts = ChartRecord.objects.filter(
-                media_filter, user=self.request.user, **params
-            ).order_by("rank")
-        if artist_charts.count() == 0 and not in_progress:
-            ChartRecord.build(
-                user=self.request.user, model_str="Artist", **params
-            )
-            media_filter = self.get_media_filter("Artist")
-            artist_charts = ChartRecord.objects.filter(
-                media_filter, user=self.request.user, **params
-            ).order_by("rank")
+        # Missing past charts are built in the background, not by this page
+        building = False
+        if not in_progress:
+            for model_str, charts in [
+                ("Track", track_charts),
+                ("Artist", artist_charts),
+            ]:
+                if not charts.exists():
+                    enqueue_chart_record_build(user.id, model_str, **params)
+                    building = True
 
         context_data["media_type"] = media_type
         context_data["track_charts"] = track_charts
         context_data["artist_charts"] = artist_charts
         context_data["name"] = " ".join(["Top", media_type, "for", name])
         context_data["in_progress"] = in_progress
+        context_data["charts_building"] = building
         return context_data
 
 
+STATUS_MEDIA_TYPES = {
+    "listening": Scrobble.MediaType.TRACK,
+    "watching": Scrobble.MediaType.VIDEO,
+    "going": Scrobble.MediaType.GEO_LOCATION,
+    "playing": Scrobble.MediaType.BOARD_GAME,
+    "sporting": Scrobble.MediaType.SPORT_EVENT,
+    "browsing": Scrobble.MediaType.WEBPAGE,
+    "participating": Scrobble.MediaType.LIFE_EVENT,
+}
+
+
 class ScrobbleStatusView(LoginRequiredMixin, TemplateView):
     model = Scrobble
     template_name = "scrobbles/status.html"
@@ -767,27 +836,20 @@ class ScrobbleStatusView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         user_scrobble_qs = Scrobble.objects.filter().order_by("-timestamp")
-        progress_plays = user_scrobble_qs.filter(
-            in_progress=True, is_paused=False
-        )
 
-        data["listening"] = progress_plays.filter(track__isnull=False).first()
-        data["watching"] = progress_plays.filter(video__isnull=False).first()
-        data["going"] = progress_plays.filter(
-            geo_location__isnull=False
-        ).first()
-        data["playing"] = progress_plays.filter(
-            board_game__isnull=False
-        ).first()
-        data["sporting"] = progress_plays.filter(
-            sport_event__isnull=False
-        ).first()
-        data["browsing"] = progress_plays.filter(
-            web_page__isnull=False
-        ).first()
-        data["participating"] = progress_plays.filter(
-            life_event__isnull=False
-        ).first()
+        # The newest unpaused scrobble in flight for each media type
+        active_ids = dict(
+            ActiveScrobble.objects.filter(is_paused=False)
+            .order_by("timestamp")
+            .values_list("media_type", "scrobble_id")
+        )
+        in_flight = (
+            Scrobble.objects.filter(id__in=active_ids.values())
+            .with_media()
+            .in_bulk()
+        )
+        for name, media_type in STATUS_MEDIA_TYPES.items():
+            data[name] = in_flight.get(active_ids.get(media_type))
 
         long_plays = user_scrobble_qs.filter(
             long_play_complete=False, played_to_completion=True
@@ -4,6 +4,7 @@ from dateutil.parser import parse
 from django.conf import settings
 from django.utils import timezone
 from pysportsdb import TheSportsDbClient
+from scrobbles import http_client
 from sports.models import Sport
 
 logger = logging.getLogger(__name__)
@@ -14,9 +15,12 @@ client = TheSportsDbClient(api_key=API_KEY)
 
 def lookup_event_from_thesportsdb(event_id: str) -> dict:
 
+    # The client only builds the URL, so the request uses our session
+    url = client.api_spec.get_lookup_event_url(id=event_id)
+    response = http_client.get(url, provider="thesportsdb")
     try:
-        event = client.lookup_event(event_id)["events"][0]
-    except TypeError:
+        event = response.json()["events"][0]
+    except (TypeError, ValueError, KeyError, IndexError):
         return {}
 
     if not event or type(event) != dict:
@@ -2,6 +2,7 @@ import logging
 from typing import Optional
 
 from howlongtobeatpy import HowLongToBeat
+from scrobbles import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -22,11 +23,14 @@ def lookup_game_from_hltb(name_or_id: str) -> Optional[dict]:
     except ValueError:
         hltb_id = None
 
+    # howlongtobeatpy makes its own requests, we can only pace them
     if hltb_id:
+        http_client.throttle("howlongtobeat")
         hltb_game = HowLongToBeat().search_from_id(hltb_id)
         logger.info(f"Found game on HLtB for ID {hltb_id}")
 
     if not hltb_game:
+        http_client.throttle("howlongtobeat")
         results = HowLongToBeat().search(name_or_id)
         if not results:
             logger.warn(f"Lookup of game on HLtB failed for ID {name_or_id}")
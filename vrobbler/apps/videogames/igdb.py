@@ -1,13 +1,15 @@
 import json
 import logging
+import time
 from datetime import datetime
 from operator import itemgetter
 from typing import Dict, Tuple
 
 import pytz
-import requests
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from scrobbles import http_client
+from scrobbles.lookup_cache import get_lookup_cache
 
 TWITCH_AUTH_BASE = "https://id.twitch.tv/"
 REFRESH_TOKEN_URL = (
@@ -19,6 +21,20 @@ GAMES_URL = "https://api.igdb.com/v4/games"
 ALT_NAMES_URL = "https://api.igdb.com/v4/alternative_names"
 SCREENSHOT_URL = "https://api.igdb.com/v4/screenshots"
 COVER_URL = "https://api.igdb.com/v4/covers"
+MULTIQUERY_URL = "https://api.igdb.com/v4/multiquery"
+
+GAME_FIELDS = "id,name,alternative_names.*,genres.*,release_dates.*,cover.*,screenshots.*,rating,rating_count,summary"
+# IGDB runs at most this many queries in one multiquery request
+IGDB_MULTIQUERY_LIMIT = 10
+# And returns at most this many results for one query
+IGDB_QUERY_LIMIT = 500
+
+IGDB_TOKEN_CACHE_KEY = "igdb:access-token"
+IGDB_TOKEN_LOCK_KEY = "igdb:access-token-lock"
+# Stop handing out a token this long before Twitch says it expires
+IGDB_TOKEN_EXPIRY_MARGIN = 60 * 10
+IGDB_TOKEN_LOCK_SECONDS = 30
+IGDB_TOKEN_POLL_SECONDS = 0.2
 
 IGDB_CLIENT_ID = getattr(settings, "IGDB_CLIENT_ID")
 IGDB_CLIENT_SECRET = getattr(settings, "IGDB_CLIENT_SECRET")
@@ -28,27 +44,117 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
-def get_igdb_token() -> str:
+def request_igdb_token() -> dict:
     token_url = REFRESH_TOKEN_URL.format(
         id=IGDB_CLIENT_ID, secret=IGDB_CLIENT_SECRET
     )
-    response = requests.post(token_url)
-    results = json.loads(response.content)
-    return results.get("access_token")
+    response = http_client.post(token_url, provider="igdb")
+    try:
+        return json.loads(response.content)
+    except ValueError:
+        logger.warning(
+            "[request_igdb_token] bad response from Twitch",
+            extra={"status_code": response.status_code},
+        )
+        return {}
 
 
-def lookup_game_id_from_gdb(name: str) -> str:
+def store_igdb_token(results: dict) -> str:
+    token = results.get("access_token") or ""
+    ttl = int(results.get("expires_in") or 0) - IGDB_TOKEN_EXPIRY_MARGIN
+    if token and ttl > 0:
+        get_lookup_cache().set(IGDB_TOKEN_CACHE_KEY, token, ttl)
+    return token
 
-    headers = {
-        "Authorization": f"Bearer {get_igdb_token()}",
-        "Client-ID": IGDB_CLIENT_ID,
-    }
+
+def get_igdb_token(rejected: str = "") -> str:
+    """An IGDB access token, cached until shortly before it expires
+
+    The token and its refresh lock live in the lookups cache, which is Redis
+    or the database, so every web and celery process shares them. When
+    there's no token, or only the `rejected` one IGDB just turned down, one
+    process asks Twitch for a new one while the others wait for it.
+    """
+    cache = get_lookup_cache()
+    token = cache.get(IGDB_TOKEN_CACHE_KEY)
+    if token and token != rejected:
+        return token
+
+    if cache.add(IGDB_TOKEN_LOCK_KEY, "refreshing", IGDB_TOKEN_LOCK_SECONDS):
+        try:
+            return store_igdb_token(request_igdb_token())
+        finally:
+            cache.delete(IGDB_TOKEN_LOCK_KEY)
+
+    deadline = time.monotonic() + IGDB_TOKEN_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(IGDB_TOKEN_POLL_SECONDS)
+        token = cache.get(IGDB_TOKEN_CACHE_KEY)
+        if token and token != rejected:
+            return token
+        if not cache.get(IGDB_TOKEN_LOCK_KEY):
+            break
+    # Whoever was refreshing it didn't get one, so ask ourselves
+    return store_igdb_token(request_igdb_token())
+
+
+def igdb_post(url: str, body: str) -> list:
+    """POST a query to IGDB, with a new token if the cached one is refused"""
+
+    def post(token):
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Client-ID": IGDB_CLIENT_ID,
+        }
+        return http_client.post(
+            url, provider="igdb", data=body, headers=headers
+        )
+
+    token = get_igdb_token()
+    response = post(token)
+    if response.status_code == 401:
+        response = post(get_igdb_token(rejected=token))
+
+    try:
+        return json.loads(response.content)
+    except ValueError:
+        logger.warning(
+            "[igdb_post] bad response from IGDB",
+            extra={"url": url, "status_code": response.status_code},
+        )
+        return []
+
+
+def igdb_multiquery(queries: list[tuple[str, str]]) -> list[list]:
+    """Run (endpoint, query) pairs through IGDB's multiquery endpoint,
+    IGDB_MULTIQUERY_LIMIT to a request, returning each one's results"""
+    results = []
+    for start in range(0, len(queries), IGDB_MULTIQUERY_LIMIT):
+        batch = queries[start : start + IGDB_MULTIQUERY_LIMIT]
+        body = "".join(
+            f'query {endpoint} "{start + i}" {{ {query} }};'
+            for i, (endpoint, query) in enumerate(batch)
+        )
+        response = igdb_post(MULTIQUERY_URL, body)
+        by_name = {
+            entry.get("name"): entry.get("result", [])
+            for entry in response
+            if isinstance(entry, dict)
+        }
+        results.extend(
+            by_name.get(str(start + i), []) for i in range(len(batch))
+        )
+    return results
+
+
+def search_query(name: str) -> str:
     if "(" in name:
         name = name.split(" (")[0]
+    name = name.replace("\\", "\\\\").replace('"', '\\"')
+    return f'fields name,game,published_at; search "{name}"; limit 100;'
+
 
-    body = f'fields name,game,published_at; search "{name}"; limit 100;'
-    response = requests.post(SEARCH_URL, data=body, headers=headers)
-    results = json.loads(response.content)
+def best_game_id(results: list, name: str = ""):
     if not results:
         logger.warn(
             f"Search of game on IGDB failed, no results found",
@@ -60,8 +166,8 @@ def lookup_game_id_from_gdb(name: str) -> str:
         logger.warn(
             f"Search of game on IGBD failed, API error",
             extra={
-                "cause": results.get("cause"),
-                "details": results.get("details"),
+                "cause": results[0].get("cause"),
+                "details": results[0].get("details"),
             },
         )
     # Sort our result by IDs so we always get the lowest ID, which is likely to be the least esoteric game
@@ -69,6 +175,23 @@ def lookup_game_id_from_gdb(name: str) -> str:
     return results[0].get("game", "")
 
 
+def lookup_game_id_from_gdb(name: str) -> str:
+    results = igdb_post(SEARCH_URL, search_query(name))
+    return best_game_id(results, name)
+
+
+def lookup_game_ids_from_igdb(names: list[str]) -> dict[str, str]:
+    """Search IGDB for many names, ten to a request"""
+    names = list(dict.fromkeys(names))
+    results = igdb_multiquery(
+        [("search", search_query(name)) for name in names]
+    )
+    return {
+        name: best_game_id(result, name)
+        for name, result in zip(names, results)
+    }
+
+
 def lookup_game_from_igdb(name_or_igdb_id: str) -> Dict:
     """Given credsa and an IGDB game ID, lookup the game metadata and return it
     in a dictionary mapped to our internal game fields
@@ -79,22 +202,56 @@ def lookup_game_from_igdb(name_or_igdb_id: str) -> Dict:
     except ValueError:
         igdb_id = lookup_game_id_from_gdb(name_or_igdb_id)
 
-    headers = {
-        "Authorization": f"Bearer {get_igdb_token()}",
-        "Client-ID": IGDB_CLIENT_ID,
-    }
-    fields = "id,name,alternative_names.*,genres.*,release_dates.*,cover.*,screenshots.*,rating,rating_count,summary"
-
-    game_dict = {}
-    body = f"fields {fields}; where id = {igdb_id}; sort id asc;"
-    response = requests.post(GAMES_URL, data=body, headers=headers)
-    results = json.loads(response.content)
+    body = f"fields {GAME_FIELDS}; where id = {igdb_id}; sort id asc;"
+    results = igdb_post(GAMES_URL, body)
     if not results:
         logger.warn(f"Lookup of game on IGDB failed for ID {igdb_id}")
-        return game_dict
+        return {}
+
+    return game_dict_from_igdb(results[0])
+
+
+def lookup_games_from_igdb(names_or_ids: list[str]) -> dict[str, dict]:
+    """Look up many games at once, mapping each name or ID to the same
+    dictionary `lookup_game_from_igdb` returns, or an empty one
+
+    Names are searched with `lookup_game_ids_from_igdb`, and then every
+    game is fetched in one query.
+    """
+    ids = {}
+    for name_or_id in names_or_ids:
+        try:
+            ids[name_or_id] = int(name_or_id)
+        except ValueError:
+            ids[name_or_id] = None
+    ids.update(
+        lookup_game_ids_from_igdb(
+            [name for name, igdb_id in ids.items() if igdb_id is None]
+        )
+    )
+
+    wanted = sorted({igdb_id for igdb_id in ids.values() if igdb_id})
+    games = {}
+    for start in range(0, len(wanted), IGDB_QUERY_LIMIT):
+        batch = wanted[start : start + IGDB_QUERY_LIMIT]
+        body = (
+            f"fields {GAME_FIELDS}; "
+            f"where id = ({','.join(str(igdb_id) for igdb_id in batch)}); "
+            f"limit {len(batch)};"
+        )
+        for game in igdb_post(GAMES_URL, body):
+            if isinstance(game, dict) and game.get("id"):
+                games[game["id"]] = game
+
+    return {
+        name_or_id: (
+            game_dict_from_igdb(games[igdb_id]) if igdb_id in games else {}
+        )
+        for name_or_id, igdb_id in ids.items()
+    }
 
-    game = results[0]
 
+def game_dict_from_igdb(game: dict) -> Dict:
     alt_name = None
     if "alternative_names" in game.keys():
         alt_name = game.get("alternative_names")[0].get("name")
@@ -9,10 +9,15 @@ from dateutil.parser import ParserError, parse
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+from scrobbles.http_client import gather
 from scrobbles.utils import convert_to_seconds
 from videogames.models import VideoGame
 from videogames.scrapers import scrape_game_name_from_adb
-from videogames.utils import get_or_create_videogame
+from videogames.utils import (
+    get_or_create_videogame,
+    lookup_videogame_data_many,
+)
 from vrobbler.apps.scrobbles.exceptions import UserNotFound
 from vrobbler.apps.videogames.exceptions import GameNotFound
 
@@ -20,10 +25,39 @@ logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+RETROARCH_LOOKUP_WORKERS = int(
+    getattr(settings, "RETROARCH_LOOKUP_WORKERS", 4)
+)
 
-def load_game_data(directory_path: str, user_tz=None) -> dict:
+
+def scan_lrtl_files(directory_path: str) -> dict[str, list[int]]:
+    """Map each lrtl file in a directory to its [mtime_ns, size], which is
+    all we need to tell if it changed since the last import"""
+    manifest = {}
+    with os.scandir(directory_path) as entries:
+        for entry in entries:
+            if not entry.name.endswith("lrtl"):
+                continue
+            stat = entry.stat()
+            manifest[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return manifest
+
+
+def changed_lrtl_files(directory_path: str, manifest: Optional[dict]) -> dict:
+    """The entries of a fresh scan that differ from `manifest`"""
+    manifest = manifest or {}
+    return {
+        filename: stats
+        for filename, stats in scan_lrtl_files(directory_path).items()
+        if manifest.get(filename) != stats
+    }
+
+
+def load_game_data(
+    directory_path: str, user_tz=None, filenames: Optional[list] = None
+) -> dict:
     """Given a path to a directory, cycle through each found lrtl file and
-    generate game data.
+    generate game data. Pass `filenames` to only read those files.
 
     Example json file as follows:
 
@@ -37,13 +71,17 @@ def load_game_data(directory_path: str, user_tz=None) -> dict:
       }
 
     """
-    directory = os.fsencode(directory_path)
     games = {}
     if not user_tz:
         user_tz = settings.TIME_ZONE
 
-    for file in os.listdir(directory):
-        filename = os.fsdecode(file)
+    if filenames is None:
+        filenames = [
+            os.fsdecode(file)
+            for file in os.listdir(os.fsencode(directory_path))
+        ]
+
+    for filename in filenames:
         if not filename.endswith("lrtl"):
             logger.info(f'Skipping "{filename}", not lrtl file')
             continue
@@ -51,38 +89,87 @@ def load_game_data(directory_path: str, user_tz=None) -> dict:
         game_name = filename.split(".lrtl")[0].split(" (")[0]
         with open("".join([directory_path, filename])) as f:
             try:
-                games[game_name] = json.load(f)
+                game_data = json.load(f)
             except json.JSONDecodeError:
                 logger.warn(
                     f"Could not decode JSOn for {game_name} and file {filename}"
                 )
-            # Convert runtime to seconds
-            games[game_name]["runtime"] = convert_to_seconds(
-                games[game_name]["runtime"]
-            )
-            # Convert last_played to datetime in user timezone
-            last_played_dt = parse(games.get(game_name).get("last_played"))
-            games[game_name]["last_played"] = user_tz.localize(last_played_dt)
+                continue
+        # Convert runtime to seconds
+        game_data["runtime"] = convert_to_seconds(game_data["runtime"])
+        # Convert last_played to datetime in user timezone
+        last_played_dt = parse(game_data.get("last_played"))
+        game_data["last_played"] = user_tz.localize(last_played_dt)
+        game_data["filename"] = filename
+        games[game_name] = game_data
 
     return games
 
 
-def lookup_from_short_mame_name(game_name: str) -> Optional[VideoGame]:
-    logger.info(f"Received name {game_name}")
+def lookup_mame_name(game_name: str) -> str:
     try:
-        mame_name = scrape_game_name_from_adb(game_name)
+        return scrape_game_name_from_adb(game_name)
     except GameNotFound as e:
         logger.warning(e)
-        return
+        return ""
+
 
-    if mame_name:
-        logger.info(f"Found name {game_name}")
-        game_name = mame_name
+def lookup_in_parallel(lookup, names: list) -> dict:
+    """Run a remote lookup for each name on a thread pool, returning a map
+    of name to result. Lookups must not touch the database."""
+    return gather(lookup, names, workers=RETROARCH_LOOKUP_WORKERS)
 
-    return VideoGame.objects.filter(retroarch_name=game_name).first()
 
+def resolve_games(game_names: list) -> dict[str, VideoGame]:
+    """Find or create the game for each Retroarch game name
 
-def import_retroarch_lrtl_files(playlog_path: str, user_id: int) -> List[dict]:
+    Known names are matched in one query. Unknown ones are checked against
+    ArcadeDB, and then HowLongToBeat, with the remote lookups for all of
+    them running in parallel, and whatever's left is looked up on IGDB in
+    batches.
+    """
+    games = {
+        game.retroarch_name: game
+        for game in VideoGame.objects.filter(retroarch_name__in=game_names)
+    }
+
+    unknown = [name for name in game_names if name not in games]
+    mame_names = lookup_in_parallel(lookup_mame_name, unknown)
+    games_by_mame_name = {
+        game.retroarch_name: game
+        for game in VideoGame.objects.filter(
+            retroarch_name__in=[name for name in mame_names.values() if name]
+        )
+    }
+    for game_name, mame_name in mame_names.items():
+        if mame_name in games_by_mame_name:
+            games[game_name] = games_by_mame_name[mame_name]
+
+    # If we didn't find it on ADB, go to get_or_create
+    unknown = [name for name in unknown if name not in games]
+    game_dicts = lookup_videogame_data_many(unknown)
+    for game_name, game_dict in game_dicts.items():
+        if not game_dict:
+            continue
+        try:
+            found_game = get_or_create_videogame(
+                game_name, game_dict=game_dict
+            )
+        except GameNotFound as e:
+            logger.warning(f"Game not found for: {e}")
+            continue
+
+        if found_game:
+            found_game.retroarch_name = game_name
+            found_game.save(update_fields=["retroarch_name"])
+            games[game_name] = found_game
+
+    return games
+
+
+def import_retroarch_lrtl_files(
+    playlog_path: str, user_id: int, import_all: bool = False
+) -> List[dict]:
     """Given a path to Retroarch lrtl game log file data,
     gather
 
@@ -91,6 +178,9 @@ def import_retroarch_lrtl_files(playlog_path: str, user_id: int) -> List[dict]:
         2. Check for existing scrobbles
         3. Create new scrobble if last_played != last_scrobble.timestamp
         4. Calculate scrobble time from runtime - last_scrobble.long_play_time
+
+    Only files that changed since the last import are read, unless
+    `import_all` is set.
     """
     Scrobble = apps.get_model("scrobbles", "Scrobble")
     user = User.objects.filter(pk=user_id).first()
@@ -98,46 +188,57 @@ def import_retroarch_lrtl_files(playlog_path: str, user_id: int) -> List[dict]:
         logger.warning(f"User ID {user_id} is not valid, cannot scrobble")
         raise UserNotFound
 
+    profile = user.profile
+    manifest = {} if import_all else dict(profile.retroarch_manifest or {})
+    changed = changed_lrtl_files(playlog_path, manifest)
     game_logs = load_game_data(
-        playlog_path, pytz.timezone(user.profile.timezone)
+        playlog_path,
+        pytz.timezone(profile.timezone),
+        filenames=list(changed.keys()),
     )
-    found_game = None
-    new_scrobbles = []
-
-    for game_name, game_data in game_logs.items():
-        found_game = VideoGame.objects.filter(retroarch_name=game_name).first()
-
-        # If we didn't find by Retroarch name, check ArcadeDB
-        found_game_from_adb = None
-        if not found_game:
-            found_game_from_adb = lookup_from_short_mame_name(game_name)
+    games = resolve_games(list(game_logs.keys()))
 
-        # If we didn't find it on ADB, go to get_or_create
-        if not found_game and not found_game_from_adb:
-            try:
-                found_game = get_or_create_videogame(game_name)
-            except GameNotFound as e:
-                logger.warning(f"Game not found for: {e}")
-                continue
-
-            if found_game:
-                found_game.retroarch_name = game_name
-                found_game.save(update_fields=["retroarch_name"])
+    # Scrobbles we already have for these plays, and the last for each game
+    existing_plays = set(
+        Scrobble.objects.filter(
+            video_game__in=games.values(),
+            stop_timestamp__in=[
+                game_data["last_played"] for game_data in game_logs.values()
+            ],
+        ).values_list("video_game_id", "stop_timestamp")
+    )
+    last_scrobbles = Scrobble.objects.in_bulk(
+        VideoGame.objects.filter(id__in=[g.id for g in games.values()])
+        .annotate(
+            last_scrobble_id=Subquery(
+                Scrobble.objects.filter(video_game=OuterRef("pk"))
+                .order_by("-id")
+                .values("id")[:1]
+            )
+        )
+        .values_list("last_scrobble_id", flat=True)
+    )
+    last_scrobbles_by_game = {
+        scrobble.video_game_id: scrobble
+        for scrobble in last_scrobbles.values()
+    }
 
+    new_scrobbles = []
+    for game_name, game_data in game_logs.items():
+        found_game = games.get(game_name)
         if not found_game:
             logger.warning(f"No game found or created for {game_name}")
+            # Try this file again next time
+            changed.pop(game_data["filename"], None)
             continue
 
         # Found a game, check if scrobble exists
         end_datetime = game_data.get("last_played")
-        found_scrobble = found_game.scrobble_set.filter(
-            stop_timestamp=end_datetime
-        )
-        if found_scrobble:
+        if (found_game.id, end_datetime) in existing_plays:
             logger.info(f"Skipping scrobble for game {found_game.id}")
             continue
 
-        last_scrobble = found_game.scrobble_set.last()
+        last_scrobble = last_scrobbles_by_game.get(found_game.id)
 
         long_play_complete = None
         if last_scrobble:
@@ -174,4 +275,8 @@ def import_retroarch_lrtl_files(playlog_path: str, user_id: int) -> List[dict]:
         )
     created_scrobbles = Scrobble.objects.bulk_create(new_scrobbles)
     logger.info(f"Created {len(created_scrobbles)} scrobbles")
+
+    manifest.update(changed)
+    profile.retroarch_manifest = manifest
+    profile.save(update_fields=["retroarch_manifest"])
     return new_scrobbles
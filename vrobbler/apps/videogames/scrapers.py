@@ -1,8 +1,8 @@
 import logging
 from typing import Optional
 
-import requests
 from bs4 import BeautifulSoup
+from scrobbles import http_client
 
 from vrobbler.apps.videogames.exceptions import GameNotFound
 
@@ -26,9 +26,8 @@ def _get_title_from_soup(soup) -> Optional[int]:
 
 def scrape_game_name_from_adb(name: str) -> str:
     title = ""
-    headers = {"User-Agent": "Vrobbler 0.11.12"}
     url = MAME_LOOKUP_URL.format(query=name)
-    resp = requests.get(url, headers=headers)
+    resp = http_client.get(url, provider="arcadedb")
     if not resp.ok:
         raise GameNotFound(f"Lookup failed with code {resp.status_code}")
 
@@ -4,7 +4,8 @@ from typing import Optional
 import requests
 from django.core.files.base import ContentFile
 from videogames.howlongtobeat import lookup_game_from_hltb
-from videogames.igdb import lookup_game_from_igdb
+from scrobbles.http_client import gather
+from videogames.igdb import lookup_game_from_igdb, lookup_games_from_igdb
 from videogames.models import VideoGame, VideoGamePlatform
 
 from vrobbler.apps.videogames.exceptions import GameNotFound
@@ -12,16 +13,42 @@ from vrobbler.apps.videogames.exceptions import GameNotFound
 logger = logging.getLogger(__name__)
 
 
+def lookup_videogame_data(name_or_id: str) -> Optional[dict]:
+    """Look up game data by name or ID from HowLongToBeat, then IGDB"""
+    game_dict = lookup_game_from_hltb(name_or_id)
+
+    if not game_dict:
+        game_dict = lookup_game_from_igdb(name_or_id)
+
+    return game_dict
+
+
+def lookup_videogame_data_many(names_or_ids: list) -> dict:
+    """Look up many games at once, mapping each name or ID to its game data
+    or None
+
+    HowLongToBeat is asked about them all in parallel, and the ones it
+    doesn't know go to IGDB as a batch.
+    """
+    game_dicts = gather(lookup_game_from_hltb, names_or_ids)
+    missing = [name for name, game_dict in game_dicts.items() if not game_dict]
+    if missing:
+        for name, game_dict in lookup_games_from_igdb(missing).items():
+            game_dicts[name] = game_dict or None
+    return game_dicts
+
+
 def get_or_create_videogame(
     name_or_id: str,
     force_update: bool = False,
+    game_dict: Optional[dict] = None,
 ) -> Optional[VideoGame]:
-    """Look up game by name or ID from HowLongToBeat"""
-
-    game_dict = lookup_game_from_hltb(name_or_id)
+    """Look up game by name or ID from HowLongToBeat
 
+    Pass `game_dict` if the lookup was already done, to skip it.
+    """
     if not game_dict:
-        game_dict = lookup_game_from_igdb(name_or_id)
+        game_dict = lookup_videogame_data(name_or_id)
 
     if not game_dict:
         return
@@ -53,6 +53,22 @@ DELETE_STALE_SCROBBLES = (
     os.getenv("VROBBLER_DELETE_STALE_SCROBBLES", "true").lower() in TRUTHY
 )
 
+# Queue webhooks in an inbox for celery workers instead of scrobbling in the request
+WEBHOOK_INGEST_ASYNC = (
+    os.getenv("VROBBLER_WEBHOOK_INGEST_ASYNC", "false").lower() in TRUTHY
+)
+
+# How many rows of an Audioscrobbler TSV file are committed at a time
+TSV_IMPORT_CHUNK_SIZE = int(os.getenv("VROBBLER_TSV_IMPORT_CHUNK_SIZE", 1000))
+
+# How many scrobbles an export reads from the database at a time
+EXPORT_CHUNK_SIZE = int(os.getenv("VROBBLER_EXPORT_CHUNK_SIZE", 2000))
+
+# How many scrobbles go in each row group of a Parquet export
+EXPORT_PARQUET_ROW_GROUP_SIZE = int(
+    os.getenv("VROBBLER_EXPORT_PARQUET_ROW_GROUP_SIZE", 50000)
+)
+
 # Used to dump data coming from srobbling sources, helpful for building new inputs
 DUMP_REQUEST_DATA = (
     os.getenv("VROBBLER_DUMP_REQUEST_DATA", "false").lower() in TRUTHY
@@ -68,6 +84,8 @@ IGDB_CLIENT_SECRET = os.getenv("VROBBLER_IGDB_CLIENT_SECRET")
 COMICVINE_API_KEY = os.getenv("VROBBLER_COMICVINE_API_KEY")
 GEOLOC_ACCURACY = os.getenv("VROBBLER_GEOLOC_ACCURACY", 3)
 GEOLOC_PROXIMITY = os.getenv("VROBBLER_GEOLOC_PROXIMITY", "0.0001")
+# Measure proximity as a real distance in meters instead of degrees
+GEOLOC_PROXIMITY_METERS = os.getenv("VROBBLER_GEOLOC_PROXIMITY_METERS")
 POINTS_FOR_MOVEMENT_HISTORY = os.getenv(
     "VROBBLER_POINTS_FOR_MOVEMENT_HISTORY", 3
 )
@@ -96,6 +114,23 @@ CELERY_RESULT_BACKEND = "django-db"
 CELERY_TIMEZONE = os.getenv("VROBBLER_TIME_ZONE", "US/Eastern")
 CELERY_TASK_TRACK_STARTED = True
 
+# How often buffered playback progress is written to the database
+PROGRESS_FLUSH_SECONDS = int(os.getenv("VROBBLER_PROGRESS_FLUSH_SECONDS", 60))
+# How long processed webhooks are kept before they're purged
+WEBHOOK_INBOX_RETENTION_DAYS = int(
+    os.getenv("VROBBLER_WEBHOOK_INBOX_RETENTION_DAYS", 7)
+)
+CELERY_BEAT_SCHEDULE = {
+    "flush-progress-buffer": {
+        "task": "scrobbles.tasks.flush_progress_buffer",
+        "schedule": PROGRESS_FLUSH_SECONDS,
+    },
+    "purge-webhook-inbox": {
+        "task": "scrobbles.tasks.purge_webhook_inbox",
+        "schedule": 60 * 60 * 24,
+    },
+}
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -199,11 +234,66 @@ CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "unique-snowflake",
-    }
+    },
+    # Remote metadata lookups (MusicBrainz, TheAudioDB, etc), kept in the
+    # database so they survive restarts and are shared with the workers
+    "lookups": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "vrobbler_lookup_cache",
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+    # Playback progress ticks waiting to be written to the database, only
+    # buffered with Redis since every process has to see them
+    "progress": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "progress",
+    },
+    # Live charts, built by celery and read by the chart page, so they're
+    # kept in the database where both can see them
+    "charts": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "vrobbler_chart_cache",
+    },
 }
 if REDIS_URL:
     CACHES["default"]["BACKEND"] = "django_redis.cache.RedisCache"
     CACHES["default"]["LOCATION"] = REDIS_URL
+    CACHES["lookups"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "lookups",
+    }
+    CACHES["progress"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "progress",
+    }
+    CACHES["charts"] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "charts",
+    }
+
+# How long remote metadata lookups are cached, empty results for less time
+LOOKUP_CACHE_TTL = int(
+    os.getenv("VROBBLER_LOOKUP_CACHE_TTL", 60 * 60 * 24 * 30)
+)
+LOOKUP_CACHE_NEGATIVE_TTL = int(
+    os.getenv("VROBBLER_LOOKUP_CACHE_NEGATIVE_TTL", 60 * 60 * 24)
+)
+
+# How long a built chart is kept, they're rebuilt whenever they change
+CHART_CACHE_TTL = int(os.getenv("VROBBLER_CHART_CACHE_TTL", 60 * 60 * 24 * 2))
+
+# How many remote game lookups a Retroarch import runs at once
+RETROARCH_LOOKUP_WORKERS = int(
+    os.getenv("VROBBLER_RETROARCH_LOOKUP_WORKERS", 4)
+)
+
+# Shared by the remote metadata lookups, see scrobbles.http_client
+HTTP_TIMEOUT_SECONDS = float(os.getenv("VROBBLER_HTTP_TIMEOUT_SECONDS", 10))
+HTTP_RETRIES = int(os.getenv("VROBBLER_HTTP_RETRIES", 3))
+HTTP_LOOKUP_WORKERS = int(os.getenv("VROBBLER_HTTP_LOOKUP_WORKERS", 8))
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 